@@ -0,0 +1,104 @@
+"""
+Measure the throughput of the COUNTER metrics aggregation on a synthetic sorted pretable.
+
+The pretable follows values.PRETABLE_FILE_HEADER and is sorted by IP and access time, as
+written by gen-pretable sort. Most lines are article pages, abstracts and PDFs of the classic
+site, from a pool of articles in which a few are much more accessed than the others; the
+remaining lines are actions that are not article accesses. With --hot_ip_lines, part of the
+lines come from a single IP through the whole day, as from a NAT gateway or proxy.
+
+    python benchmarks/bench_compute_metrics.py -n 1000000
+    python benchmarks/bench_compute_metrics.py -n 1000000 --max_keys 100000
+    python benchmarks/bench_compute_metrics.py -n 1000000 --hot_ip_lines 300000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from scielo_usage_counter import metrics, values
+
+
+ACTIONS = (
+    (55, '/scielo.php?script=sci_arttext&pid={pid}&lng=en&nrm=iso&tlng={lang}'),
+    (20, '/scielo.php?script=sci_pdf&pid={pid}&lng=en&nrm=iso&tlng={lang}'),
+    (10, '/scielo.php?script=sci_abstract&pid={pid}&lng=es&nrm=iso'),
+    (10, '/scielo.php?script=sci_serial&pid={issn}&lng=en&nrm=iso'),
+    (5, '/pdf/rbp/v26n3/a13v26n3.pdf'),
+)
+
+LANGUAGES = ('pt', 'en', 'es')
+
+BROWSERS = (('CH', '121.0.0.0'), ('FF', '122.0'), ('MF', '17.2'), ('CM', '120.0.6099.230'))
+
+
+def generate_pretable(path, size, seed=1, articles=50000, journals=300, places=5000, hot_ip_lines=0):
+    rnd = random.Random(seed)
+
+    issns = [f'{rnd.randint(0, 9999):04d}-{rnd.randint(0, 9999):04d}' for _ in range(journals)]
+    pids = [f'S{rnd.choice(issns)}{rnd.randint(1998, 2024)}{rnd.randint(1, 12):04d}{rnd.randint(1, 400):05d}' for _ in range(articles)]
+    coordinates = [(f'{rnd.uniform(-33, 5):.4f}', f'{rnd.uniform(-73, -35):.4f}') for _ in range(places)]
+    weights = [w for w, _ in ACTIONS]
+    templates = [t for _, t in ACTIONS]
+
+    rows = []
+    for _ in range(min(hot_ip_lines, size)):
+        pid = pids[min(int(rnd.paretovariate(0.8)), articles) - 1]
+        action = rnd.choices(templates, weights)[0].format(pid=pid, issn=pid[1:10], lang=rnd.choice(LANGUAGES))
+        server_time = f'2024-02-12 {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:{rnd.randint(0, 59):02d}'
+        browser = rnd.choice(BROWSERS)
+        rows.append((server_time, browser[0], browser[1], '200.17.0.1', '-23.5475', '-46.6361', action))
+
+    while len(rows) < size:
+        # each IP makes a burst of accesses in a few hours of the day
+        ip = f'{rnd.randint(1, 223)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(1, 254)}'
+        latitude, longitude = rnd.choice(coordinates)
+        browser = rnd.choice(BROWSERS)
+        hour = rnd.randint(0, 23)
+
+        for _ in range(min(int(rnd.paretovariate(1.2)), 500)):
+            pid = pids[min(int(rnd.paretovariate(0.8)), articles) - 1]
+            action = rnd.choices(templates, weights)[0].format(pid=pid, issn=pid[1:10], lang=rnd.choice(LANGUAGES))
+            server_time = f'2024-02-12 {min(hour + rnd.randint(0, 2), 23):02d}:{rnd.randint(0, 59):02d}:{rnd.randint(0, 59):02d}'
+            rows.append((server_time, browser[0], browser[1], ip, latitude, longitude, action))
+
+    rows.sort(key=lambda r: (r[3], r[0]))
+
+    with open(path, 'w') as fout:
+        fout.write('\t'.join(values.PRETABLE_FILE_HEADER) + '\n')
+        for r in rows[:size]:
+            fout.write('\t'.join(r) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--size', type=int, default=1000000, help='Número de linhas da pré-tabela sintética')
+    parser.add_argument('-k', '--runs', type=int, default=3, help='Número de execuções (a mais rápida é considerada)')
+    parser.add_argument('--max_keys', type=int, default=values.METRIC_MAX_KEYS, help='Número de chaves de métricas mantidas em memória')
+    parser.add_argument('--hot_ip_lines', type=int, default=0, help='Número de linhas de um único IP')
+    params = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, '2024-02-12.tsv')
+        generate_pretable(path, params.size, hot_ip_lines=params.hot_ip_lines)
+
+        times = []
+        for _ in range(params.runs):
+            start = time.perf_counter()
+            aggregator = metrics.aggregate_pretable(path, metrics.MetricsAggregator(max_keys=params.max_keys, tmp_dir=tmp_dir))
+            runs = aggregator.runs
+            keys = sum(1 for _ in aggregator.results())
+            times.append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    best = min(times)
+    print(f'lines: {params.size}, best of {params.runs}: {best:.3f}s ({best / params.size * 1e9:,.0f} ns/line, {params.size / best:,.0f} lines/s)')
+    print(f'article accesses: {aggregator.hits}, double-clicks: {aggregator.double_clicks}, ignored: {aggregator.ignored_hits}, keys: {keys}, runs: {runs}')
+
+
+if __name__ == '__main__':
+    main()
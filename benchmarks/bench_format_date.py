@@ -0,0 +1,49 @@
+"""
+Compare strptime/strftime date formatting with TimestampConverter on a synthetic sequence of log dates.
+
+    python benchmarks/bench_format_date.py -n 500000
+"""
+import argparse
+import datetime
+import random
+import time
+
+from scielo_usage_counter.timestamp import TimestampConverter, legacy_format_date
+
+
+def generate_dates(size, timezone='-0300', seed=42):
+    rnd = random.Random(seed)
+    current = datetime.datetime(2024, 2, 14)
+    dates = []
+
+    for i in range(size):
+        current += datetime.timedelta(seconds=rnd.randint(0, 3))
+        dates.append((current.strftime('%d/%b/%Y:%H:%M:%S'), timezone))
+
+    return dates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--size', type=int, default=500000, help='Número de datas')
+    params = parser.parse_args()
+
+    dates = generate_dates(params.size)
+    converter = TimestampConverter()
+
+    start = time.perf_counter()
+    expected = [legacy_format_date(d, tz) for d, tz in dates]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    obtained = [converter.convert(d, tz) for d, tz in dates]
+    converter_time = time.perf_counter() - start
+
+    print(f'dates: {len(dates)}, days: {len(set(d[:11] for d, _ in dates))}')
+    print(f'strptime:  {legacy_time:.3f}s ({len(dates) / legacy_time:,.0f} dates/s)')
+    print(f'converter: {converter_time:.3f}s ({len(dates) / converter_time:,.0f} dates/s)')
+    print(f'speedup: {legacy_time / converter_time:.1f}x, identical results: {expected == obtained}')
+
+
+if __name__ == '__main__':
+    main()
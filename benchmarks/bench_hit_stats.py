@@ -0,0 +1,60 @@
+"""
+Measure the per-line overhead of building a Hit and updating the Stats counters, as parse_line does.
+
+    python benchmarks/bench_hit_stats.py -n 1000000
+"""
+import argparse
+import time
+
+from scielo_usage_counter.log import Hit, Stats
+
+
+def simulate_line(stats, i):
+    # the counter updates and Hit attributes of a valid line, and of an ignored one every other line
+    stats.increment('lines_parsed')
+    stats.increment('lines_format_ncsa_extended')
+
+    hit = Hit()
+    hit.method = 'GET'
+    hit.status = '200'
+    hit.user_agent = 'Mozilla/5.0'
+    hit.client_name = 'CH'
+    hit.client_version = '121.0.0.0'
+    hit.action = '/scielo.php'
+    hit.ip = '200.46.0.1'
+    hit.country_code = 'BR'
+    hit.local_datetime = '2024-02-12 04:03:47'
+
+    if i & 1:
+        stats.increment('ignored_lines_static_resources')
+        hit.is_valid = False
+
+    if hit.is_valid:
+        stats.increment('total_imported_lines')
+        return [hit.local_datetime, hit.client_name, hit.client_version, hit.ip, hit.country_code, hit.action]
+
+    stats.increment('total_ignored_lines')
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--size', type=int, default=1000000, help='Número de linhas simuladas')
+    parser.add_argument('-k', '--runs', type=int, default=3, help='Número de execuções (a mais rápida é considerada)')
+    params = parser.parse_args()
+
+    times = []
+    for _ in range(params.runs):
+        stats = Stats()
+        start = time.perf_counter()
+        for i in range(params.size):
+            simulate_line(stats, i)
+        times.append(time.perf_counter() - start)
+
+    best = min(times)
+    print(f'lines: {params.size}, best of {params.runs}: {best:.3f}s ({best / params.size * 1e9:,.0f} ns/line)')
+    print('stats: ' + ', '.join(f'{k}={v}' for k, v in stats.to_dict().items() if v))
+
+
+if __name__ == '__main__':
+    main()
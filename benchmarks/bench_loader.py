@@ -0,0 +1,103 @@
+"""
+Measure the write throughput of metric rows into a SQLite database.
+
+Compares adding ORM objects, one executemany INSERT, and loader.BulkLoader writing new rows
+and then adding to the existing ones, as the monthly tables are updated. Rows of the detailed
+table, half of them without a geolocation (a NULL unique column), are written by the loader too.
+
+    python benchmarks/bench_loader.py -n 200000
+    python benchmarks/bench_loader.py -n 200000 --batch_size 5000
+"""
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+from sqlalchemy import insert
+
+from scielo_usage_counter import metrics, values
+from scielo_usage_counter.database import db, loader
+
+import scielo_usage_counter.database.declararive as models
+
+
+TABLE = models.MetricArticleDaily.__table__
+
+DETAILED_TABLE = models.MetricArticleDetailed.__table__
+
+
+def generate_rows(size, day=datetime.date(2024, 2, 12)):
+    return [dict(collection=1, year_month_day=day, article=a, **dict(zip(metrics.MEASURES, (3, 4, 1, 2)))) for a in range(1, size + 1)]
+
+
+def generate_detailed_rows(size, day=datetime.date(2024, 2, 12)):
+    return [dict(r, format=1, language=1, geolocation=None if r['article'] % 2 else 1) for r in generate_rows(size, day)]
+
+
+def write_orm(str_connection, rows, batch_size):
+    for i in range(0, len(rows), batch_size):
+        with db.session_scope(str_connection) as session:
+            session.add_all([models.MetricArticleDaily(**r) for r in rows[i:i + batch_size]])
+
+
+def write_executemany(str_connection, rows, batch_size):
+    for i in range(0, len(rows), batch_size):
+        with db.session_scope(str_connection) as session:
+            session.execute(insert(TABLE), rows[i:i + batch_size])
+
+
+def write_loader(str_connection, rows, batch_size, mode=loader.UPSERT_REPLACE, table=TABLE):
+    loader.BulkLoader(str_connection, batch_size=batch_size).upsert(table, rows, mode)
+
+
+def run(tmp_dir, name, functions, rows, batch_size, repeat):
+    times = []
+    for k in range(repeat):
+        str_connection = 'sqlite:///' + os.path.join(tmp_dir, f'{name}-{k}.db')
+        db.create_tables(str_connection, tables=[TABLE, DETAILED_TABLE])
+
+        for i, function in enumerate(functions):
+            start = time.perf_counter()
+            function(str_connection, rows, batch_size)
+            if i == len(functions) - 1:
+                times.append(time.perf_counter() - start)
+
+        db.dispose(str_connection)
+
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--size', type=int, default=200000, help='Número de linhas de métricas')
+    parser.add_argument('-k', '--runs', type=int, default=3, help='Número de execuções (a mais rápida é considerada)')
+    parser.add_argument('--batch_size', type=int, default=values.DB_LOADER_BATCH_SIZE, help='Número de linhas por lote')
+    params = parser.parse_args()
+
+    rows = generate_rows(params.size)
+    detailed_rows = generate_detailed_rows(params.size)
+    increment = lambda s, r, b: write_loader(s, r, b, loader.UPSERT_INCREMENT)
+    detailed = lambda s, r, b: write_loader(s, r, b, table=DETAILED_TABLE)
+    detailed_increment = lambda s, r, b: write_loader(s, r, b, loader.UPSERT_INCREMENT, DETAILED_TABLE)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        results = [
+            ('orm add_all', run(tmp_dir, 'orm', [write_orm], rows, params.batch_size, params.runs)),
+            ('executemany insert', run(tmp_dir, 'executemany', [write_executemany], rows, params.batch_size, params.runs)),
+            ('loader upsert (new rows)', run(tmp_dir, 'loader', [write_loader], rows, params.batch_size, params.runs)),
+            ('loader upsert (existing rows)', run(tmp_dir, 'increment', [write_loader, increment], rows, params.batch_size, params.runs)),
+            ('detailed upsert (new rows)', run(tmp_dir, 'detailed', [detailed], detailed_rows, params.batch_size, params.runs)),
+            ('detailed upsert (existing rows)', run(tmp_dir, 'detailed_increment', [detailed, detailed_increment], detailed_rows, params.batch_size, params.runs)),
+        ]
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    for name, best in results:
+        print(f'{name:<32} rows: {params.size}, best of {params.runs}: {best:.3f}s ({params.size / best:,.0f} rows/s)')
+
+
+if __name__ == '__main__':
+    main()
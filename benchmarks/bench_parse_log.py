@@ -0,0 +1,175 @@
+"""
+Measure LogParser throughput and the time spent in each stage of parse_line on synthetic log lines.
+
+Results can be saved as JSON and compared with the results of another commit:
+
+    python benchmarks/bench_parse_log.py -n 200000 -o before.json
+    python benchmarks/bench_parse_log.py -n 200000 -o after.json -c before.json
+
+No network access is needed: the defaults use the test fixtures as geolocation map and robots list.
+"""
+import argparse
+import collections
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from device_detector.settings import DDCache  # noqa: E402
+from synthetic_log import FORMATS, generate_lines  # noqa: E402
+
+from scielo_usage_counter import log, log_format, values  # noqa: E402
+
+
+STAGES = ('regex', 'ua_detection', 'robots', 'geoip', 'date', 'path')
+
+
+def _timed(func, timings, stage):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[stage] += time.perf_counter() - start
+    return wrapper
+
+
+def instrument(lp, timings):
+    """
+    Replace, on the instance, the methods called by parse_line with versions that add their time to timings.
+    The ua_detection stage only runs on user agent cache misses and includes the robots stage.
+    """
+    lp.line_matcher.match = _timed(lp.line_matcher.match, timings, 'regex')
+    lp._classify_user_agent = _timed(lp._classify_user_agent, timings, 'ua_detection')
+    lp.user_agent_is_bot = _timed(lp.user_agent_is_bot, timings, 'robots')
+    lp.geoip.ip_to_country_code = _timed(lp.geoip.ip_to_country_code, timings, 'geoip')
+    lp.format_date = _timed(lp.format_date, timings, 'date')
+    lp.has_valid_path = _timed(lp.has_valid_path, timings, 'path')
+
+
+def new_parser(mmdb, robots, evaluation_mode):
+    # module level caches would otherwise be warm from a previous run;
+    # the compiled device detector regexes are kept, as in a long-running process
+    log_format.get_ip_type.cache_clear()
+    DDCache['user_agents'].clear()
+    return log.LogParser(mmdb_path=mmdb, robots_path=robots, evaluation_mode=evaluation_mode)
+
+
+def run(lines, mmdb, robots, evaluation_mode, timings=None):
+    lp = new_parser(mmdb, robots, evaluation_mode)
+    if timings is not None:
+        instrument(lp, timings)
+
+    start = time.perf_counter()
+    for line in lines:
+        lp.parse_line(line)
+    elapsed = time.perf_counter() - start
+
+    lp.collect_ua_cache_stats()
+    return elapsed, lp.stats
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(size, seed, log_format_name, mmdb, robots, runs, evaluation_mode=values.EVALUATION_MODE_FULL):
+    lines = generate_lines(size, seed=seed, log_format=log_format_name)
+
+    # throughput is measured without instrumentation, whose overhead is reported in the stage timings
+    times = []
+    for _ in range(runs):
+        elapsed, stats = run(lines, mmdb, robots, evaluation_mode)
+        times.append(elapsed)
+    best = min(times)
+
+    timings = collections.defaultdict(float)
+    instrumented_time, _ = run(lines, mmdb, robots, evaluation_mode, timings)
+    timings['ua_detection'] -= timings['robots']
+
+    stages = {s: timings[s] for s in STAGES}
+    stages['other'] = instrumented_time - sum(stages.values())
+
+    return {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'lines': size,
+        'seed': seed,
+        'log_format': log_format_name,
+        'evaluation_mode': evaluation_mode,
+        'runs': runs,
+        'times': times,
+        'best_time': best,
+        'lines_per_second': size / best,
+        'instrumented_time': instrumented_time,
+        'stages': stages,
+        'stats': {k: v for k, v in stats.to_dict().items() if k != 'total_time'},
+    }
+
+
+def print_result(result, baseline=None):
+    print(
+        f'commit: {result["commit"]}, lines: {result["lines"]}, format: {result["log_format"]}, seed: {result["seed"]}, '
+        f'evaluation mode: {result.get("evaluation_mode", values.EVALUATION_MODE_FULL)}'
+    )
+
+    line = f'throughput: {result["lines_per_second"]:,.0f} lines/s (best of {result["runs"]}: {result["best_time"]:.3f}s)'
+    if baseline:
+        line += f', baseline {baseline["lines_per_second"]:,.0f} lines/s ({result["lines_per_second"] / baseline["lines_per_second"]:.2f}x)'
+    print(line)
+
+    total = result['instrumented_time']
+    print(f'{"stage":<14}{"seconds":>10}{"share":>8}' + (f'{"baseline":>10}{"change":>9}' if baseline else ''))
+    for stage, seconds in result['stages'].items():
+        line = f'{stage:<14}{seconds:>10.3f}{seconds / total:>8.1%}'
+        if baseline and stage in baseline['stages']:
+            base = baseline['stages'][stage]
+            line += f'{base:>10.3f}' + (f'{seconds / base - 1:>+9.1%}' if base > 0 else f'{"":>9}')
+        print(line)
+
+    if baseline:
+        if (baseline['lines'], baseline['seed'], baseline['log_format']) != (result['lines'], result['seed'], result['log_format']):
+            print('warning: the baseline was measured on different lines')
+        elif baseline.get('evaluation_mode', values.EVALUATION_MODE_FULL) != result['evaluation_mode']:
+            print('warning: the baseline was measured with a different evaluation mode, whose reason counters differ')
+        elif baseline['stats'] != result['stats']:
+            changed = sorted(k for k in result['stats'] if result['stats'][k] != baseline['stats'].get(k))
+            print(f'warning: stats differ from the baseline: {", ".join(changed)}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--size', type=int, default=100000, help='Número de linhas sintéticas')
+    parser.add_argument('-s', '--seed', type=int, default=42, help='Semente do gerador de linhas')
+    parser.add_argument('-f', '--log_format', choices=FORMATS, default='ncsa_extended', help='Formato das linhas')
+    parser.add_argument('-k', '--runs', type=int, default=3, help='Número de execuções (a mais rápida é considerada)')
+    parser.add_argument('-m', '--mmdb', default='tests/fixtures/map.mmdb', help='Arquivo de mapa de geolocalizações')
+    parser.add_argument('-r', '--robots', default='tests/fixtures/counter-robots.txt', help='Arquivo de robôs')
+    parser.add_argument('-e', '--evaluation_mode', choices=values.EVALUATION_MODES, default=values.EVALUATION_MODE_FULL, help='Modo de avaliação das linhas')
+    parser.add_argument('-o', '--output', help='Arquivo JSON em que o resultado é gravado')
+    parser.add_argument('-c', '--compare', help='Arquivo JSON com resultado anterior, para comparação')
+    params = parser.parse_args()
+
+    result = benchmark(params.size, params.seed, params.log_format, params.mmdb, params.robots, params.runs, params.evaluation_mode)
+
+    baseline = None
+    if params.compare:
+        with open(params.compare) as fin:
+            baseline = json.load(fin)
+
+    print_result(result, baseline)
+
+    if params.output:
+        with open(params.output, 'w') as fout:
+            json.dump(result, fout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
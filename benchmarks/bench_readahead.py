@@ -0,0 +1,63 @@
+"""
+Compare parsing a compressed log file with and without the readahead decompression thread.
+
+    python benchmarks/bench_readahead.py -n 1000 -c bz2
+"""
+import argparse
+import bz2
+import gzip
+import os
+import tempfile
+import time
+
+from scielo_usage_counter import log
+
+
+def generate_compressed(path, logfile, repeat, compression):
+    with open(logfile, 'rb') as fin:
+        data = fin.read()
+
+    with (gzip if compression == 'gzip' else bz2).open(path, 'wb') as fout:
+        for _ in range(repeat):
+            fout.write(data)
+
+
+def parse(path, mmdb, robots, readahead_buffer_size):
+    lp = log.LogParser(mmdb_path=mmdb, robots_path=robots, readahead_buffer_size=readahead_buffer_size)
+    lp.logfile = path
+
+    start = time.perf_counter()
+    rows = sum(1 for _ in lp.parse())
+    elapsed = time.perf_counter() - start
+
+    lp.logfile.close()
+    return rows, lp.stats.lines_parsed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--repeat', type=int, default=200, help='Número de cópias do arquivo de log')
+    parser.add_argument('-c', '--compression', choices=['gzip', 'bz2'], default='gzip', help='Formato de compressão')
+    parser.add_argument('-l', '--logfile', default='tests/fixtures/usage.log', help='Arquivo de log repetido')
+    parser.add_argument('-m', '--mmdb', default='tests/fixtures/map.mmdb', help='Arquivo de mapa de geolocalizações')
+    parser.add_argument('-r', '--robots', default='tests/fixtures/counter-robots.txt', help='Arquivo de robôs')
+    params = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'usage.log.' + params.compression)
+        generate_compressed(path, params.logfile, params.repeat, params.compression)
+
+        # warms up the module level caches (IP types, device detector) before timing
+        parse(path, params.mmdb, params.robots, 0)
+
+        without_rows, lines, without_time = parse(path, params.mmdb, params.robots, 0)
+        with_rows, _, with_time = parse(path, params.mmdb, params.robots, 4 * 1024 * 1024)
+
+    print(f'lines: {lines}, rows: {with_rows}')
+    print(f'no readahead: {without_time:.3f}s ({lines / without_time:,.0f} lines/s)')
+    print(f'readahead:    {with_time:.3f}s ({lines / with_time:,.0f} lines/s)')
+    print(f'speedup: {without_time / with_time:.2f}x, identical row counts: {without_rows == with_rows}')
+
+
+if __name__ == '__main__':
+    main()
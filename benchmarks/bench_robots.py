@@ -0,0 +1,78 @@
+"""
+Compare the per-pattern robots loop with RobotsMatcher on a synthetic user agent corpus.
+
+    python benchmarks/bench_robots.py -r tests/fixtures/counter-robots.txt
+"""
+import argparse
+import random
+import time
+
+from scielo_usage_counter.robots import RobotsMatcher
+from scielo_usage_counter.utils import resource_utils
+
+
+BROWSER_TEMPLATES = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{major}.0.{minor}.{patch} Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/{major}.{minor} Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:{major}.0) Gecko/20100101 Firefox/{major}.0',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 16_{minor} like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148',
+    'Mozilla/5.0 (Linux; Android {minor}; SM-A{patch}) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{major}.0.0.0 Mobile Safari/537.36',
+]
+
+BOT_TEMPLATES = [
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+    'Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)',
+    'LOCKSS cache',
+    'python-requests/2.{minor}.0',
+    'Wget/1.{minor}',
+]
+
+
+def generate_user_agents(size, bot_ratio=0.2, seed=42):
+    rnd = random.Random(seed)
+    user_agents = []
+
+    for i in range(size):
+        templates = BOT_TEMPLATES if rnd.random() < bot_ratio else BROWSER_TEMPLATES
+        user_agents.append(rnd.choice(templates).format(
+            major=rnd.randint(60, 131),
+            minor=rnd.randint(0, 20),
+            patch=rnd.randint(100, 999),
+        ))
+
+    return user_agents
+
+
+def legacy_is_bot(robots, user_agent):
+    for regex in robots:
+        if regex.search(user_agent):
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--robots', required=True, help='Arquivo de robôs')
+    parser.add_argument('-n', '--size', type=int, default=50000, help='Número de user agents')
+    params = parser.parse_args()
+
+    robots = resource_utils.load_robots(robots_list=None, robots_path=params.robots)
+    matcher = RobotsMatcher(robots)
+    user_agents = generate_user_agents(params.size)
+
+    start = time.perf_counter()
+    expected = [legacy_is_bot(robots, ua) for ua in user_agents]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    obtained = [matcher.is_bot(ua) for ua in user_agents]
+    matcher_time = time.perf_counter() - start
+
+    print(f'patterns: {len(robots)}, user agents: {len(user_agents)}, bots: {sum(expected)}')
+    print(f'loop:    {legacy_time:.3f}s ({len(user_agents) / legacy_time:,.0f} ua/s)')
+    print(f'matcher: {matcher_time:.3f}s ({len(user_agents) / matcher_time:,.0f} ua/s)')
+    print(f'speedup: {legacy_time / matcher_time:.1f}x, identical verdicts: {expected == obtained}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Deterministic synthetic access log generator used by the parse-log benchmarks.
+
+The lines follow the formats accepted by LogParser and mix, with fixed
+proportions, browsers and robots, static resources, article pages and
+downloads, redirect and error statuses, IPv4 and IPv6 addresses and
+forwarded IP lists. The same size, seed and format always produce the
+same lines.
+
+    python benchmarks/synthetic_log.py -n 100000 -o data/synthetic.log
+"""
+import argparse
+import datetime
+import gzip
+import random
+
+
+FORMATS = (
+    'ncsa_extended',
+    'ncsa_extended_domain',
+    'ncsa_extended_ip_list',
+    'ncsa_extended_domain_ip_list',
+    'varnish',
+)
+
+DOMAINS = ('www.scielo.br', 'scielo.isciii.es', 'scielo.sld.cu', 'www.scielo.cl')
+
+# public first octets, so that the addresses are not classified as local
+IPV4_FIRST_OCTETS = (8, 23, 45, 64, 77, 91, 131, 143, 152, 170, 177, 179, 181, 186, 187, 189, 190, 191, 200, 201)
+
+IPV6_PREFIXES = ('2001:12f0', '2804:14c', '2804:431', '2800:3f0', '2a02:26f0')
+
+PROXY_IPS = ('198.41.230.129', '162.158.90.12', '172.70.142.21')
+
+BROWSER_TEMPLATES = (
+    (30, 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{major}.0.{build}.{patch} Safari/537.36'),
+    (20, 'Mozilla/5.0 (Linux; Android {android}; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{major}.0.0.0 Mobile Safari/537.36'),
+    (12, 'Mozilla/5.0 (iPhone; CPU iPhone OS {ios} like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/{safari} Mobile/15E148 Safari/604.1'),
+    (10, 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/{safari} Safari/605.1.15'),
+    (10, 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:{major}.0) Gecko/20100101 Firefox/{major}.0'),
+    (8, 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{major}.0.0.0 Safari/537.36 Edg/{major}.0.{build}.{patch}'),
+    (5, 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{major}.0.{build}.{patch} Safari/537.36'),
+)
+
+BOT_USER_AGENTS = (
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+    'Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)',
+    'Mozilla/5.0 (Linux; Android 7.0;) AppleWebKit/537.36 (KHTML, like Gecko) Mobile Safari/537.36 (compatible; PetalBot;+https://webmaster.petalsearch.com/site/petalbot)',
+    'Mozilla/5.0 (compatible; AhrefsBot/7.0; +http://ahrefs.com/robot/)',
+    'Mozilla/5.0 (compatible; SemrushBot/7~bl; +http://www.semrush.com/bot.html)',
+    'python-requests/2.31.0',
+    'curl/7.81.0',
+    'Amazon-Route53-Health-Check-Service (ref 1261cdc1-a132-45b2-8c26-5de713c689cb; report http://amzn.to/1vsZADi)',
+)
+
+STATIC_PATHS = (
+    '/css/screen/general.css',
+    '/css/screen/layout.css',
+    '/applications/scielo-org/js/toolbox.js',
+    '/js/jquery-1.4.2.min.js',
+    '/img/en/fbpelogp.gif',
+    '/img/es/iconCitedOff.gif',
+    '/favicon.ico',
+    '/img/revistas/{acronym}/v{volume}n{number}/a{article:02d}fig01.jpg',
+    '/img/revistas/{acronym}/v{volume}n{number}/a{article:02d}tab02.png',
+)
+
+ACTION_PATHS = (
+    '/scielo.php?script=sci_arttext&pid={pid}&lng=en&nrm=iso&tlng=pt',
+    '/scielo.php?script=sci_abstract&pid={pid}&lng=es&nrm=iso',
+    '/scielo.php?script=sci_serial&pid={issn}&lng=en&nrm=iso',
+    '/scielo.php?script=sci_issuetoc&pid={issn}{year}000{number}&lng=pt',
+)
+
+DOWNLOAD_PATHS = (
+    '/pdf/{acronym}/v{volume}n{number}/a{article:02d}v{volume}n{number}.pdf',
+    '/pdf/{acronym}/v{volume}n{number}/{issn}-{acronym}-{volume}-{number}-{article:04d}.pdf',
+)
+
+ACRONYMS = ('rbp', 'pab', 'cr', 'rbgo', 'abo', 'anp', 'rbof', 'brag', 'bjce', 'ca', 'fb', 'ric', 'aue')
+
+# (weight, value) distributions
+PATH_KINDS = ((55, 'static'), (35, 'action'), (10, 'download'))
+STATUSES = ((82, '200'), (6, '304'), (3, '301'), (2, '302'), (5, '404'), (1, '403'), (1, '500'))
+METHODS = ((96, 'GET'), (2, 'HEAD'), (2, 'POST'))
+
+BOT_RATE = 0.12
+IPV6_RATE = 0.1
+MALFORMED_RATE = 0.002
+
+
+def _weighted(rnd, distribution):
+    total = sum(w for w, _ in distribution)
+    x = rnd.uniform(0, total)
+    for w, v in distribution:
+        x -= w
+        if x <= 0:
+            return v
+    return distribution[-1][1]
+
+
+class SyntheticLogGenerator:
+    """
+    Generates synthetic access log lines.
+
+    Parameters:
+    -----------
+        seed (int): Seed of the random generator.
+        log_format (str): One of FORMATS.
+        ips (int): Number of distinct client addresses.
+        user_agents (int): Number of distinct browser user agents.
+        start (datetime.datetime): Local time of the first line.
+        timezone (str): Timezone of the dates.
+    """
+    def __init__(
+        self,
+        seed=42,
+        log_format='ncsa_extended',
+        ips=5000,
+        user_agents=2000,
+        start=datetime.datetime(2024, 2, 14),
+        timezone='-0300',
+    ):
+        if log_format not in FORMATS:
+            raise ValueError(f'Invalid log format: {log_format}')
+
+        self.rnd = random.Random(seed)
+        self.log_format = log_format
+        self.current = start
+        self.timezone = timezone
+        self.ip_pool = [self._random_ip() for _ in range(ips)]
+        self.ua_pool = [self._random_browser() for _ in range(user_agents)]
+
+    def _random_ip(self):
+        rnd = self.rnd
+        if rnd.random() < IPV6_RATE:
+            return f'{rnd.choice(IPV6_PREFIXES)}:{rnd.randrange(65536):x}:{rnd.randrange(65536):x}::{rnd.randrange(1, 65536):x}'
+        return f'{rnd.choice(IPV4_FIRST_OCTETS)}.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(1, 255)}'
+
+    def _random_browser(self):
+        rnd = self.rnd
+        return _weighted(rnd, BROWSER_TEMPLATES).format(
+            major=rnd.randint(90, 122),
+            build=rnd.randint(4000, 6200),
+            patch=rnd.randint(0, 250),
+            android=rnd.randint(8, 14),
+            ios=f'{rnd.randint(13, 17)}_{rnd.randint(0, 7)}',
+            safari=f'{rnd.randint(13, 17)}.{rnd.randint(0, 6)}',
+        )
+
+    def _pick(self, pool):
+        # a few addresses and user agents account for most of the hits
+        index = int(self.rnd.paretovariate(1.2)) - 1
+        return pool[index % len(pool)]
+
+    def _path(self):
+        rnd = self.rnd
+        kind = _weighted(rnd, PATH_KINDS)
+        issn = f'{rnd.randint(0, 9999):04d}-{rnd.randint(0, 9999):04d}'
+        fields = {
+            'acronym': rnd.choice(ACRONYMS),
+            'volume': rnd.randint(1, 80),
+            'number': rnd.randint(1, 6),
+            'article': rnd.randint(1, 40),
+            'year': rnd.randint(1998, 2024),
+            'issn': issn,
+            'pid': f'S{issn}{rnd.randint(1998, 2024)}000{rnd.randint(100, 999)}{rnd.randint(1, 40):05d}',
+        }
+
+        if kind == 'static':
+            return rnd.choice(STATIC_PATHS).format(**fields)
+        if kind == 'download':
+            return rnd.choice(DOWNLOAD_PATHS).format(**fields)
+        return rnd.choice(ACTION_PATHS).format(**fields)
+
+    def line(self):
+        rnd = self.rnd
+        self.current += datetime.timedelta(milliseconds=rnd.randint(0, 400))
+
+        if rnd.random() < MALFORMED_RATE:
+            return f'- - - [{self.current.strftime("%d/%b/%Y:%H:%M:%S")} {self.timezone}] "PRI * HTTP/2.0" 400 392 "-" "-"'
+
+        ip = self._pick(self.ip_pool)
+        user_agent = rnd.choice(BOT_USER_AGENTS) if rnd.random() < BOT_RATE else self._pick(self.ua_pool)
+        domain = rnd.choice(DOMAINS)
+        path = self._path()
+        referrer = f'https://{domain}/scielo.php?script=sci_arttext&pid=S{rnd.randint(0, 99999999):08d}' if rnd.random() < 0.7 else '-'
+
+        prefix = f'{ip} - -'
+        if self.log_format in ('ncsa_extended_ip_list', 'ncsa_extended_domain_ip_list'):
+            prefix = f'{ip} {ip}, {rnd.choice(PROXY_IPS)} -'
+        if self.log_format in ('ncsa_extended_domain', 'ncsa_extended_domain_ip_list', 'varnish'):
+            prefix = f'{domain} {prefix}'
+
+        line = (
+            f'{prefix} [{self.current.strftime("%d/%b/%Y:%H:%M:%S")} {self.timezone}] '
+            f'"{_weighted(rnd, METHODS)} {path} HTTP/1.1" {_weighted(rnd, STATUSES)} {rnd.randint(80, 900000)} '
+            f'"{referrer}" "{user_agent}"'
+        )
+
+        if self.log_format == 'varnish':
+            line += f' {rnd.randint(100, 3000)} {rnd.randint(200, 900)} {rnd.randint(100, 30000)}'
+
+        return line
+
+    def lines(self, size):
+        for _ in range(size):
+            yield self.line()
+
+
+def generate_lines(size, seed=42, log_format='ncsa_extended', **options):
+    return list(SyntheticLogGenerator(seed=seed, log_format=log_format, **options).lines(size))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--size', type=int, default=100000, help='Número de linhas')
+    parser.add_argument('-s', '--seed', type=int, default=42, help='Semente do gerador aleatório')
+    parser.add_argument('-f', '--log_format', choices=FORMATS, default='ncsa_extended', help='Formato das linhas')
+    parser.add_argument('-o', '--output', required=True, help='Arquivo de log gerado (compactado quando termina em .gz)')
+    params = parser.parse_args()
+
+    opener = gzip.open if params.output.endswith('.gz') else open
+    with opener(params.output, 'wt') as fout:
+        for line in SyntheticLogGenerator(seed=params.seed, log_format=params.log_format).lines(params.size):
+            fout.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import collections
+import json
+import logging
+import os
+import sys
+
+
+EVICTION_LRU = 'lru'
+EVICTION_FIFO = 'fifo'
+
+EVICTION_POLICIES = (EVICTION_LRU, EVICTION_FIFO)
+
+MISSING = object()
+
+
+def estimate_size(key, value):
+    """
+    Estimate, in bytes, the memory used by a cache entry.
+    Tuples and lists are measured together with their items.
+    """
+    size = sys.getsizeof(key) + sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        size += sum(sys.getsizeof(v) for v in value)
+    return size
+
+
+class LRUCache:
+    """
+    Bounded key-value cache.
+
+    Entries are evicted when the number of entries exceeds max_size or when
+    the estimated memory usage exceeds max_bytes. With the 'lru' policy a hit
+    refreshes the entry; with the 'fifo' policy entries leave in insertion order.
+
+    Parameters:
+    -----------
+        max_size (int): Maximum number of entries.
+        max_bytes (int or None): Maximum estimated memory usage, in bytes.
+        eviction (str): Eviction policy, one of EVICTION_POLICIES.
+        sizeof (callable): Function (key, value) -> estimated size in bytes.
+    """
+    def __init__(self, max_size=100000, max_bytes=None, eviction=EVICTION_LRU, sizeof=estimate_size):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f'Invalid eviction policy: {eviction}')
+
+        self.__data = collections.OrderedDict()
+        self.__sizes = {}
+        self.__bytes = 0
+
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.sizeof = sizeof
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.__data)
+
+    def __contains__(self, key):
+        return key in self.__data
+
+    @property
+    def size_in_bytes(self):
+        return self.__bytes
+
+    def counters(self):
+        return self.hits, self.misses, self.evictions
+
+    def get(self, key, default=None):
+        value = self.__data.get(key, MISSING)
+
+        if value is MISSING:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        if self.eviction == EVICTION_LRU:
+            self.__data.move_to_end(key)
+
+        return value
+
+    def put(self, key, value):
+        if key in self.__data:
+            self.__bytes -= self.__sizes[key]
+            del self.__data[key]
+
+        size = self.sizeof(key, value) if self.max_bytes else 0
+        self.__data[key] = value
+        self.__sizes[key] = size
+        self.__bytes += size
+
+        while self.__data and (
+            len(self.__data) > self.max_size or
+            (self.max_bytes and self.__bytes > self.max_bytes)
+        ):
+            old_key, _ = self.__data.popitem(last=False)
+            self.__bytes -= self.__sizes.pop(old_key)
+            self.evictions += 1
+
+    def get_or_compute(self, key, func):
+        """
+        Return the cached value of key, computing and storing func(key) on a miss.
+        """
+        value = self.get(key, MISSING)
+
+        if value is MISSING:
+            value = func(key)
+            self.put(key, value)
+
+        return value
+
+    def clear(self):
+        self.__data.clear()
+        self.__sizes.clear()
+        self.__bytes = 0
+
+    def save(self, path, fingerprint=None):
+        """
+        Persist the cache entries, in eviction order, to a JSON file.
+
+        Parameters:
+        -----------
+            path (str): Destination file path.
+            fingerprint (str or None): Identifies the data used to compute the values.
+        """
+        tmp_path = path + '.tmp'
+
+        try:
+            with open(tmp_path, 'w') as fout:
+                json.dump({
+                    'fingerprint': fingerprint,
+                    'items': [[k, v] for k, v in self.__data.items()],
+                }, fout)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            logging.error(f'Failed to save cache to {path}: {e}')
+
+    def load(self, path, fingerprint=None):
+        """
+        Load cache entries previously persisted with save.
+        Entries are ignored when the stored fingerprint differs from the given one.
+
+        Returns:
+        --------
+            int: The number of loaded entries.
+        """
+        try:
+            with open(path) as fin:
+                content = json.load(fin)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logging.warning(f'Failed to load cache from {path}: {e}')
+            return 0
+
+        if content.get('fingerprint') != fingerprint:
+            logging.info(f'Cache {path} was built with different data and was ignored')
+            return 0
+
+        evictions = self.evictions
+        for k, v in content.get('items', []):
+            self.put(k, tuple(v) if isinstance(v, list) else v)
+        self.evictions = evictions
+
+        return len(self.__data)
+
+
+def merge_files(path, paths, max_size=100000, max_bytes=None, eviction=EVICTION_LRU):
+    """
+    Merge caches persisted with save into the cache persisted at path, then remove them.
+    Entries of later files are the most recent ones. Files whose fingerprint differs from that of the first
+    readable file are ignored.
+
+    Returns:
+    --------
+        int: The number of entries of the merged cache, or zero if none of the files could be read.
+    """
+    fingerprint = MISSING
+    for p in paths:
+        try:
+            with open(p) as fin:
+                fingerprint = json.load(fin).get('fingerprint')
+            break
+        except (OSError, ValueError):
+            continue
+
+    if fingerprint is MISSING:
+        return 0
+
+    merged = LRUCache(max_size=max_size, max_bytes=max_bytes, eviction=eviction)
+    for p in [path] + list(paths):
+        merged.load(p, fingerprint)
+    merged.save(path, fingerprint)
+
+    for p in paths:
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+    return len(merged)
@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+
+
+CHECKPOINT_EXTENSION = 'checkpoint'
+
+
+def get_checkpoint_path(output_directory, logfile_path):
+    return os.path.join(output_directory, f'{os.path.basename(logfile_path)}.{CHECKPOINT_EXTENSION}')
+
+
+class Checkpoint:
+    """
+    State of a partially parsed log file.
+
+    Parameters:
+    -----------
+        logfile_path (str): Path of the log file.
+        output_path (str): Path of the parsed output file.
+        offset (int): Position of the next line to read, as returned by the log file tell (decompressed offset for gzip and bz2 files).
+        output_position (int): Size of the output file containing only the rows of the lines read before offset.
+        stats (dict): Stats counters at offset.
+        elapsed (float): Parsing time, in seconds, until the checkpoint.
+        matcher_state (dict): State of the log format matcher at offset.
+        logfile_size (int): Size of the log file, used to detect a changed file.
+        logfile_mtime (float): Modification time of the log file, used to detect a changed file.
+        completed (bool): Whether the log file was completely parsed. A completed checkpoint is kept
+            until the new status of the log file is recorded, so that the file is not parsed again.
+    """
+    def __init__(
+        self,
+        logfile_path,
+        output_path,
+        offset=0,
+        output_position=0,
+        stats=None,
+        elapsed=0.0,
+        matcher_state=None,
+        logfile_size=None,
+        logfile_mtime=None,
+        completed=False,
+    ):
+        self.logfile_path = logfile_path
+        self.output_path = output_path
+        self.offset = offset
+        self.output_position = output_position
+        self.stats = stats or {}
+        self.elapsed = elapsed
+        self.matcher_state = matcher_state or {}
+        self.completed = completed
+
+        if logfile_size is None or logfile_mtime is None:
+            st = os.stat(logfile_path)
+            logfile_size, logfile_mtime = st.st_size, st.st_mtime
+
+        self.logfile_size = logfile_size
+        self.logfile_mtime = logfile_mtime
+
+    def to_dict(self):
+        return {
+            'logfile_path': self.logfile_path,
+            'output_path': self.output_path,
+            'offset': self.offset,
+            'output_position': self.output_position,
+            'stats': self.stats,
+            'elapsed': self.elapsed,
+            'matcher_state': self.matcher_state,
+            'logfile_size': self.logfile_size,
+            'logfile_mtime': self.logfile_mtime,
+            'completed': self.completed,
+        }
+
+    def save(self, path):
+        """
+        Write the checkpoint atomically, so a crash while saving keeps the previous checkpoint.
+        """
+        tmp_path = path + '.tmp'
+
+        with open(tmp_path, 'w') as fout:
+            json.dump(self.to_dict(), fout)
+            fout.flush()
+            os.fsync(fout.fileno())
+
+        os.replace(tmp_path, path)
+
+    def is_valid_for(self, logfile_path):
+        """
+        Whether the checkpoint was created for the log file, as it is now, and its output file is still available.
+        """
+        try:
+            st = os.stat(logfile_path)
+            output_size = os.path.getsize(self.output_path)
+        except OSError:
+            return False
+
+        return (
+            os.path.abspath(logfile_path) == os.path.abspath(self.logfile_path) and
+            st.st_size == self.logfile_size and
+            st.st_mtime == self.logfile_mtime and
+            output_size >= self.output_position
+        )
+
+
+def load_checkpoint(path, logfile_path):
+    """
+    Load the checkpoint of a log file.
+
+    Returns:
+    --------
+        Checkpoint or None: The checkpoint, or None when it does not exist or cannot be used to resume the log file.
+    """
+    try:
+        with open(path) as fin:
+            checkpoint = Checkpoint(**json.load(fin))
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError, TypeError) as e:
+        logging.warning(f'Checkpoint {path} não pôde ser lido: {e}')
+        return
+
+    if not checkpoint.is_valid_for(logfile_path):
+        logging.warning(f'Checkpoint {path} não corresponde ao arquivo {logfile_path} e foi ignorado')
+        return
+
+    return checkpoint
+
+
+def remove_checkpoint(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
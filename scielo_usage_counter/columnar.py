@@ -0,0 +1,349 @@
+import array
+import datetime
+import ipaddress
+import socket
+import struct
+import sys
+import zlib
+
+from . import exceptions, values
+
+
+MAGIC = b'SUCCOL\x00\x01'
+
+BLOCK_HEADER = struct.Struct('<II')
+
+DEFAULT_BLOCK_SIZE = 65536
+
+COMPRESSION_LEVEL = 1
+
+COLUMNS = values.PARSED_FILE_HEADER
+
+IP_KIND_STRING = 0
+IP_KIND_V4 = 4
+IP_KIND_V6 = 6
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+_SECONDS_PER_DAY = 86400
+
+
+def _to_little_endian(arr):
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+
+def _array_to_bytes(arr):
+    if sys.byteorder == 'big':
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _read_array(typecode, data, offset, count):
+    arr = array.array(typecode)
+    end = offset + arr.itemsize * count
+    arr.frombytes(data[offset:end])
+    return _to_little_endian(arr), end
+
+
+def is_columnar_file(path):
+    try:
+        with open(path, 'rb') as fin:
+            return fin.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class _Dictionary:
+    """
+    Maps strings to sequential integer codes. Entries added since the last
+    block are written along with that block.
+    """
+    def __init__(self):
+        self.codes = {}
+        self.pending = []
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.codes)
+            self.codes[value] = code
+            self.pending.append(value)
+        return code
+
+    def dump_pending(self):
+        encoded = [v.encode('utf-8', 'surrogatepass') for v in self.pending]
+        self.pending = []
+
+        lengths = array.array('I', [len(v) for v in encoded])
+        return struct.pack('<I', len(encoded)) + _array_to_bytes(lengths) + b''.join(encoded)
+
+
+def _load_pending(entries, data, offset):
+    count, = struct.unpack_from('<I', data, offset)
+    lengths, offset = _read_array('I', data, offset + 4, count)
+
+    for length in lengths:
+        entries.append(data[offset:offset + length].decode('utf-8', 'surrogatepass'))
+        offset += length
+
+    return offset
+
+
+class ColumnarWriter:
+    """
+    Writes parsed hits to a compact columnar file.
+
+    Rows are buffered in blocks of block_size rows. In each block, browser
+    names, browser versions, country codes and actions are dictionary encoded
+    (the dictionaries are shared by the whole file), dates are stored as
+    int64 UTC epoch seconds and IP addresses are packed as 4 or 16 bytes.
+    IP addresses whose text is not in canonical form are kept as strings, so
+    rows are read back exactly as written. Each block is compressed with zlib.
+
+    Parameters:
+    -----------
+        path (str): Output file path.
+        block_size (int): Number of rows per block.
+    """
+    def __init__(self, path, block_size=DEFAULT_BLOCK_SIZE):
+        self.path = path
+        self.block_size = block_size
+        self.rows_written = 0
+
+        self.__file = open(path, 'wb')
+        self.__file.write(MAGIC)
+
+        self.__names = _Dictionary()
+        self.__versions = _Dictionary()
+        self.__countries = _Dictionary()
+        self.__actions = _Dictionary()
+        self.__ip_strings = _Dictionary()
+        self.__days = {}
+        self.__ips = {}
+        self._reset_block()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _reset_block(self):
+        self.__timestamps = array.array('q')
+        self.__name_ids = array.array('I')
+        self.__version_ids = array.array('I')
+        self.__country_ids = array.array('I')
+        self.__action_ids = array.array('I')
+        self.__ip_kinds = array.array('B')
+        self.__ipv4 = bytearray()
+        self.__ipv6 = bytearray()
+        self.__ip_string_ids = array.array('I')
+
+    def _encode_timestamp(self, server_date):
+        if len(server_date) != 19 or server_date[10] != ' ':
+            raise exceptions.InvalidColumnarDataError(f'Data inválida: {server_date}')
+
+        day = self.__days.get(server_date[:10])
+
+        if day is None:
+            day = (datetime.date.fromisoformat(server_date[:10]).toordinal() - _EPOCH_ORDINAL) * _SECONDS_PER_DAY
+            self.__days[server_date[:10]] = day
+
+        return day + int(server_date[11:13]) * 3600 + int(server_date[14:16]) * 60 + int(server_date[17:19])
+
+    def _encode_ip(self, ip):
+        packed = self.__ips.get(ip)
+
+        if packed is None:
+            try:
+                ipa = ipaddress.ip_address(ip)
+                if str(ipa) != ip:
+                    packed = (IP_KIND_STRING, None)
+                else:
+                    packed = (ipa.version, ipa.packed)
+            except ValueError:
+                packed = (IP_KIND_STRING, None)
+
+            if len(self.__ips) < DEFAULT_BLOCK_SIZE * 4:
+                self.__ips[ip] = packed
+
+        kind, value = packed
+        self.__ip_kinds.append(kind)
+
+        if kind == IP_KIND_V4:
+            self.__ipv4.extend(value)
+        elif kind == IP_KIND_V6:
+            self.__ipv6.extend(value)
+        else:
+            self.__ip_string_ids.append(self.__ip_strings.encode(ip))
+
+    def write(self, row):
+        server_date, name, version, ip, country, action = row
+
+        self.__timestamps.append(self._encode_timestamp(server_date))
+        self.__name_ids.append(self.__names.encode(name))
+        self.__version_ids.append(self.__versions.encode(version))
+        self.__country_ids.append(self.__countries.encode(country))
+        self.__action_ids.append(self.__actions.encode(action))
+        self._encode_ip(ip)
+
+        if len(self.__timestamps) >= self.block_size:
+            self.flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            if row:
+                self.write(row)
+
+    def flush(self):
+        nrows = len(self.__timestamps)
+        if not nrows:
+            return
+
+        payload = b''.join([
+            self.__names.dump_pending(),
+            self.__versions.dump_pending(),
+            self.__countries.dump_pending(),
+            self.__actions.dump_pending(),
+            self.__ip_strings.dump_pending(),
+            _array_to_bytes(self.__timestamps),
+            _array_to_bytes(self.__name_ids),
+            _array_to_bytes(self.__version_ids),
+            _array_to_bytes(self.__country_ids),
+            _array_to_bytes(self.__action_ids),
+            _array_to_bytes(self.__ip_kinds),
+            struct.pack('<I', len(self.__ipv4) // 4),
+            bytes(self.__ipv4),
+            struct.pack('<I', len(self.__ipv6) // 16),
+            bytes(self.__ipv6),
+            struct.pack('<I', len(self.__ip_string_ids)),
+            _array_to_bytes(self.__ip_string_ids),
+        ])
+
+        compressed = zlib.compress(payload, COMPRESSION_LEVEL)
+        self.__file.write(BLOCK_HEADER.pack(nrows, len(compressed)))
+        self.__file.write(compressed)
+
+        self.rows_written += nrows
+        self._reset_block()
+
+    def close(self):
+        if self.__file.closed:
+            return
+
+        self.flush()
+        self.__file.close()
+
+
+class ColumnarReader:
+    """
+    Reads files written by ColumnarWriter.
+
+    Iterating over the reader yields rows as lists of strings, in the same
+    order and format as the rows of the tab-separated output of LogParser.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        for block in self.iter_blocks():
+            yield from zip(*block)
+
+    def iter_blocks(self):
+        """
+        Yield the columns of each block, as a list of six sequences of strings.
+        """
+        names, versions, countries, actions, ip_strings = [], [], [], [], []
+        timestamp_strings = {}
+
+        with open(self.path, 'rb') as fin:
+            if fin.read(len(MAGIC)) != MAGIC:
+                raise exceptions.InvalidColumnarDataError(f'Arquivo colunar inválido: {self.path}')
+
+            while True:
+                header = fin.read(BLOCK_HEADER.size)
+                if not header:
+                    break
+                if len(header) != BLOCK_HEADER.size:
+                    raise exceptions.InvalidColumnarDataError(f'Bloco truncado em {self.path}')
+
+                nrows, size = BLOCK_HEADER.unpack(header)
+                compressed = fin.read(size)
+                if len(compressed) != size:
+                    raise exceptions.InvalidColumnarDataError(f'Bloco truncado em {self.path}')
+
+                data = zlib.decompress(compressed)
+
+                offset = 0
+                for entries in (names, versions, countries, actions, ip_strings):
+                    offset = _load_pending(entries, data, offset)
+
+                timestamps, offset = _read_array('q', data, offset, nrows)
+                name_ids, offset = _read_array('I', data, offset, nrows)
+                version_ids, offset = _read_array('I', data, offset, nrows)
+                country_ids, offset = _read_array('I', data, offset, nrows)
+                action_ids, offset = _read_array('I', data, offset, nrows)
+                ip_kinds, offset = _read_array('B', data, offset, nrows)
+
+                count, = struct.unpack_from('<I', data, offset)
+                ipv4 = data[offset + 4:offset + 4 + count * 4]
+                offset += 4 + count * 4
+
+                count, = struct.unpack_from('<I', data, offset)
+                ipv6 = data[offset + 4:offset + 4 + count * 16]
+                offset += 4 + count * 16
+
+                count, = struct.unpack_from('<I', data, offset)
+                ip_string_ids, offset = _read_array('I', data, offset + 4, count)
+
+                yield [
+                    self._format_timestamps(timestamps, timestamp_strings),
+                    [names[i] for i in name_ids],
+                    [versions[i] for i in version_ids],
+                    self._decode_ips(ip_kinds, ipv4, ipv6, ip_string_ids, ip_strings),
+                    [countries[i] for i in country_ids],
+                    [actions[i] for i in action_ids],
+                ]
+
+    def _format_timestamps(self, timestamps, timestamp_strings):
+        # a day has at most 86400 distinct timestamps, so formatted strings are cached
+        if len(timestamp_strings) > 4 * _SECONDS_PER_DAY:
+            timestamp_strings.clear()
+
+        formatted = []
+        for timestamp in timestamps:
+            timestamp_string = timestamp_strings.get(timestamp)
+
+            if timestamp_string is None:
+                days, seconds = divmod(timestamp, _SECONDS_PER_DAY)
+                hour, seconds = divmod(seconds, 3600)
+                minute, second = divmod(seconds, 60)
+
+                day_string = datetime.date.fromordinal(days + _EPOCH_ORDINAL).isoformat()
+                timestamp_string = f'{day_string} {hour:02d}:{minute:02d}:{second:02d}'
+                timestamp_strings[timestamp] = timestamp_string
+
+            formatted.append(timestamp_string)
+
+        return formatted
+
+    def _decode_ips(self, ip_kinds, ipv4, ipv6, ip_string_ids, ip_strings):
+        ips = []
+        v4 = 0
+        v6 = 0
+        strings = iter(ip_string_ids)
+
+        for kind in ip_kinds:
+            if kind == IP_KIND_V4:
+                ips.append(socket.inet_ntoa(ipv4[v4:v4 + 4]))
+                v4 += 4
+            elif kind == IP_KIND_V6:
+                ips.append(str(ipaddress.IPv6Address(ipv6[v6:v6 + 16])))
+                v6 += 16
+            else:
+                ips.append(ip_strings[next(strings)])
+
+        return ips
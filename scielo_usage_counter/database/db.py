@@ -1,47 +1,116 @@
-from sqlalchemy import and_, create_engine
+from sqlalchemy import and_, bindparam, create_engine, delete, insert, update
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
+from sqlalchemy.pool import QueuePool
 
+import contextlib
 import datetime
+import decimal
 
 from scielo_usage_counter import values
 
 import scielo_usage_counter.database.declararive as models
 
 
-def create_tables(str_connection):
-    engine = create_engine(str_connection)
-    models.Base.metadata.create_all(engine)
+# Geolocation coordinates are DECIMAL(9, 6)
+COORDINATE_QUANTUM = decimal.Decimal('0.000001')
+
+# engines and session factories are created once per connection string,
+# so that consecutive status updates reuse the pooled connections
+_engines = {}
+_session_factories = {}
+
+
+def _get_engine_options(str_connection):
+    url = make_url(str_connection)
+    options = {'pool_pre_ping': True}
+
+    if url.get_backend_name() == 'sqlite':
+        # in-memory databases keep their default pool, which holds one connection per thread
+        if url.database and url.database != ':memory:':
+            options['poolclass'] = QueuePool
+        return options
+
+    options['pool_size'] = values.DB_POOL_SIZE
+    options['max_overflow'] = values.DB_POOL_MAX_OVERFLOW
+    options['pool_recycle'] = values.DB_POOL_RECYCLE
+    return options
+
+
+def get_engine(str_connection):
+    engine = _engines.get(str_connection)
+
+    if engine is None:
+        engine = create_engine(str_connection, **_get_engine_options(str_connection))
+        _engines[str_connection] = engine
+
+    return engine
+
+
+def dispose(str_connection=None):
+    """
+    Close the pooled connections and forget the engines of a connection string, or of all of them.
+    """
+    str_connections = [str_connection] if str_connection else list(_engines)
+
+    for sc in str_connections:
+        _session_factories.pop(sc, None)
+        engine = _engines.pop(sc, None)
+        if engine is not None:
+            engine.dispose()
+
+
+def create_tables(str_connection, tables=None):
+    models.Base.metadata.create_all(get_engine(str_connection), tables=tables)
 
 
 def get_session(str_connection):
-    engine = create_engine(str_connection)
-    session = sessionmaker(bind=engine)
-    return session()
+    session_factory = _session_factories.get(str_connection)
 
+    if session_factory is None:
+        # objects stay readable after the session is committed and closed
+        session_factory = sessionmaker(bind=get_engine(str_connection), expire_on_commit=False)
+        _session_factories[str_connection] = session_factory
 
-def get_collection_id(str_connection, collection_acronym):
+    return session_factory()
+
+
+@contextlib.contextmanager
+def session_scope(str_connection):
+    """
+    Provide a session that is committed when the block succeeds, rolled back when it fails, and always closed.
+    """
     session = get_session(str_connection)
-    return session.query(models.Collection).filter(models.Collection.acronym == collection_acronym).one().id
+    try:
+        yield session
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def get_collection_id(str_connection, collection_acronym):
+    with session_scope(str_connection) as session:
+        return session.query(models.Collection).filter(models.Collection.acronym == collection_acronym).one().id
 
 
 def get_collection_acronym(str_connection, collection_id):
-    session = get_session(str_connection)
-    return session.get(models.Collection, collection_id).one().acronym
+    with session_scope(str_connection) as session:
+        return session.get(models.Collection, collection_id).acronym
 
 
 def get_non_parsed_logs(str_connection, collection):
-    session = get_session(str_connection)
-    try:
+    with session_scope(str_connection) as session:
         return session.query(
             models.ControlLogFile).filter(
                 and_(
                     models.ControlLogFile.collection == collection,
-                    models.ControlLogFile.status == values.LOGFILE_STATUS_QUEUE,
+                    models.ControlLogFile.status.in_([values.LOGFILE_STATUS_QUEUE, values.LOGFILE_STATUS_PARTIAL]),
                 )
-            ).order_by(models.ControlLogFile.date)
-    except NoResultFound:
-        return []
+            ).order_by(models.ControlLogFile.date).all()
 
 
 def _get_date_status(dates):
@@ -63,42 +132,57 @@ def _get_previous_and_next_dates(date, interval=2):
     return all_days
 
 
-def _get_enabled_dates_by_status_value(session, collection, date_status: dict, status_value: int):
+def _get_date_status_window(session, collection, dates, interval=2):
+    """
+    Load, in one query, the status of the dates of a collection from interval days before the first date to interval days after the last one.
+    The range is served by the (collection, date) unique index.
+    """
+    if not dates:
+        return {}
+
+    rows = session.query(models.ControlDateStatus.date, models.ControlDateStatus.status).filter(
+        and_(
+            models.ControlDateStatus.collection == collection,
+            models.ControlDateStatus.date.between(
+                min(dates) + datetime.timedelta(days=-interval),
+                max(dates) + datetime.timedelta(days=+interval),
+            ),
+        )
+    )
+
+    return {r.date: r.status for r in rows}
+
+
+def _get_enabled_dates_by_status_value(session, collection, date_status: dict, status_value: int, interval=2):
+    candidate_dates = [date for date, status in date_status.items() if status == status_value]
+    window = _get_date_status_window(session, collection, candidate_dates, interval)
+
     enabled_dates = []
 
-    for date, status in date_status.items():
-        pn_dates = _get_previous_and_next_dates(date)
-        is_valid_date = _check_previous_and_next_dates(session, collection, pn_dates)
+    for date in candidate_dates:
+        pn_dates = _get_previous_and_next_dates(date, interval)
 
-        if status == status_value and is_valid_date:
+        if _check_previous_and_next_dates(window, pn_dates):
             enabled_dates.append(date)
 
     return enabled_dates
 
 
-def _check_previous_and_next_dates(session, collection, dates):
+def _check_previous_and_next_dates(date_status: dict, dates):
     for d in dates:
-        try:
-            cds = session.query(models.ControlDateStatus).filter(
-                and_(
-                    models.ControlDateStatus.collection == collection,
-                    models.ControlDateStatus.date == d,
-                )
-            ).one()
-
-            if cds.status != values.DATE_STATUS_EXTRACTING_PRETABLE and cds.status < values.DATE_STATUS_LOADED:
-                return False
+        if d not in date_status:
+            return False
 
-        except NoResultFound:
+        status = date_status[d]
+        if status != values.DATE_STATUS_EXTRACTING_PRETABLE and status < values.DATE_STATUS_LOADED:
             return False
 
     return True
 
 
 def get_non_pretable_dates(str_connection, collection):
-    session = get_session(str_connection)
-    try:
-        parsed_dates = session.query(models.ControlDateStatus).filter(
+    with session_scope(str_connection) as session:
+        parsed_dates = session.query(models.ControlDateStatus.date, models.ControlDateStatus.status).filter(
             and_(
                 models.ControlDateStatus.collection == collection,
                 models.ControlDateStatus.status == values.DATE_STATUS_LOADED,
@@ -109,14 +193,10 @@ def get_non_pretable_dates(str_connection, collection):
 
         return _get_enabled_dates_by_status_value(session, collection, date2status, values.DATE_STATUS_LOADED)
 
-    except NoResultFound:
-        return []
-
 
 def get_unsorted_pretables(str_connection, collection):
-    session = get_session(str_connection)
-    try:
-        unsorted_pretable_dates = session.query(models.ControlDateStatus).filter(
+    with session_scope(str_connection) as session:
+        unsorted_pretable_dates = session.query(models.ControlDateStatus.date, models.ControlDateStatus.status).filter(
             and_(
                 models.ControlDateStatus.collection == collection,
                 models.ControlDateStatus.status == values.DATE_STATUS_EXTRACTING_PRETABLE,
@@ -127,40 +207,295 @@ def get_unsorted_pretables(str_connection, collection):
 
         return _get_enabled_dates_by_status_value(session, collection, date2status, values.DATE_STATUS_EXTRACTING_PRETABLE)
 
-    except NoResultFound:
-        return []
+
+def get_pretable_dates(str_connection, collection):
+    """
+    Dates whose sorted pretables are ready and whose metrics are not computed yet.
+    """
+    with session_scope(str_connection) as session:
+        return [r.date for r in session.query(models.ControlDateStatus.date).filter(
+            and_(
+                models.ControlDateStatus.collection == collection,
+                models.ControlDateStatus.status == values.DATE_STATUS_PRETABLE,
+            )
+        ).order_by(models.ControlDateStatus.date)]
+
+
+def get_journal_ids(str_connection):
+    """
+    Returns:
+    --------
+        dict: Journal id by each of its ISSNs (print, electronic and SciELO).
+    """
+    journal_ids = {}
+
+    with session_scope(str_connection) as session:
+        for j in session.query(models.Journal.id, models.Journal.print_issn, models.Journal.electronic_issn, models.Journal.scielo_issn):
+            for issn in (j.print_issn, j.electronic_issn, j.scielo_issn):
+                if issn:
+                    journal_ids.setdefault(issn, j.id)
+
+    return journal_ids
+
+
+def get_journal_issns(str_connection):
+    """
+    Returns:
+    --------
+        dict: Canonical ISSN of the journal by each of its ISSNs, i.e. the first of its ISSNs in get_journal_ids.
+    """
+    canonical_issns = {}
+    journal_issns = {}
+
+    for issn, journal_id in get_journal_ids(str_connection).items():
+        journal_issns[issn] = canonical_issns.setdefault(journal_id, issn)
+
+    return journal_issns
+
+
+def get_article_ids(str_connection, collection, pids, chunk_size=1000):
+    """
+    Returns:
+    --------
+        dict: Article id by PID, for the PIDs registered in the collection.
+    """
+    article_ids = {}
+    pids = list(pids)
+
+    with session_scope(str_connection) as session:
+        for i in range(0, len(pids), chunk_size):
+            for a in session.query(models.Article.id, models.Article.pid).filter(
+                and_(
+                    models.Article.collection == collection,
+                    models.Article.pid.in_(pids[i:i + chunk_size]),
+                )
+            ):
+                article_ids[a.pid] = a.id
+
+    return article_ids
+
+
+def get_or_create_dimension_ids(str_connection, model, column, keys):
+    """
+    Load the ids of ArticleFormat or ArticleLanguage rows, creating the missing ones.
+
+    Returns:
+    --------
+        dict: Row id by value of the column.
+    """
+    keys = set(keys)
+    field = getattr(model, column)
+
+    with session_scope(str_connection) as session:
+        ids = {v: i for i, v in session.query(model.id, field).filter(field.in_(keys))}
+
+        missing = keys - set(ids)
+        if missing:
+            session.execute(insert(model.__table__), [{column: k} for k in missing])
+            ids.update({v: i for i, v in session.query(model.id, field).filter(field.in_(missing))})
+
+    return ids
+
+
+def _to_coordinate(value):
+    return decimal.Decimal(value).quantize(COORDINATE_QUANTUM)
+
+
+def get_or_create_geolocation_ids(str_connection, coordinates, chunk_size=1000):
+    """
+    Load the ids of Geolocation rows, creating the missing ones.
+
+    Parameters:
+    -----------
+        coordinates (iterable): (latitude, longitude) pairs, as strings.
+
+    Returns:
+    --------
+        dict: Geolocation id by (latitude, longitude) pair, as given.
+    """
+    by_decimal = {}
+    for c in coordinates:
+        try:
+            by_decimal.setdefault((_to_coordinate(c[0]), _to_coordinate(c[1])), []).append(c)
+        except decimal.InvalidOperation:
+            continue
+
+    def _load(session, keys):
+        latitudes = list({k[0] for k in keys})
+        loaded = {}
+        for i in range(0, len(latitudes), chunk_size):
+            for r in session.query(models.Geolocation.id, models.Geolocation.latitude, models.Geolocation.longitude).filter(
+                models.Geolocation.latitude.in_(latitudes[i:i + chunk_size])
+            ):
+                loaded[(_to_coordinate(r.latitude), _to_coordinate(r.longitude))] = r.id
+        return loaded
+
+    ids = {}
+    with session_scope(str_connection) as session:
+        existing = _load(session, by_decimal)
+
+        missing = [k for k in by_decimal if k not in existing]
+        if missing:
+            session.execute(insert(models.Geolocation.__table__), [{'latitude': lat, 'longitude': lon} for lat, lon in missing])
+            existing.update(_load(session, missing))
+
+    for k, given in by_decimal.items():
+        for c in given:
+            ids[c] = existing.get(k)
+
+    return ids
+
+
+def delete_metrics(str_connection, tables, collection, date):
+    """
+    Remove the metrics of a collection in a day, so that they can be computed again.
+    """
+    with session_scope(str_connection) as session:
+        for table in tables:
+            t = models.Base.metadata.tables[table]
+            session.execute(delete(t).where(and_(t.c.collection == collection, t.c.year_month_day == date)))
 
 
 def get_logfile_status(str_connection, logfile_id):
-    session = get_session(str_connection)
-    try:
+    with session_scope(str_connection) as session:
         return session.query(
             models.ControlLogFile).filter(
                 models.ControlLogFile.id == logfile_id
-            )
-    except NoResultFound:
-        return []
+            ).all()
 
 
 def set_logfile_status(str_connection, logfile_id, status):
-    session = get_session(str_connection)
-    lf = session.get(models.ControlLogFile, logfile_id)
-    lf.status = status
-    session.commit()
+    with session_scope(str_connection) as session:
+        lf = session.get(models.ControlLogFile, logfile_id)
+        lf.status = status
 
 
 def set_control_date_status(str_connection, collection, date, status):
-    session = get_session(str_connection)
-    try:
-        cds = session.query(models.ControlDateStatus).filter(
-            and_(
-                models.ControlDateStatus.collection == collection,
-                models.ControlDateStatus.date == date,
-            )
-        ).one()
-        cds.status = status
-        session.commit()
-    except NoResultFound:
-        ...
-    except MultipleResultsFound:
-        ...
+    with session_scope(str_connection) as session:
+        try:
+            cds = session.query(models.ControlDateStatus).filter(
+                and_(
+                    models.ControlDateStatus.collection == collection,
+                    models.ControlDateStatus.date == date,
+                )
+            ).one()
+            cds.status = status
+        except NoResultFound:
+            ...
+        except MultipleResultsFound:
+            ...
+
+
+def set_logfile_statuses(str_connection, statuses):
+    """
+    Update the status of several log files with one executemany statement.
+
+    Parameters:
+    -----------
+        statuses (list): (logfile_id, status) pairs.
+    """
+    if not statuses:
+        return
+
+    table = models.ControlLogFile.__table__
+    statement = update(table).where(table.c.id == bindparam('b_id')).values(status=bindparam('b_status'))
+
+    with session_scope(str_connection) as session:
+        session.execute(statement, [{'b_id': i, 'b_status': s} for i, s in statuses])
+
+
+def set_control_date_statuses(str_connection, statuses):
+    """
+    Update the status of several dates with one executemany statement.
+    Dates without a ControlDateStatus row are ignored, as in set_control_date_status.
+
+    Parameters:
+    -----------
+        statuses (list): (collection, date, status) tuples.
+    """
+    if not statuses:
+        return
+
+    table = models.ControlDateStatus.__table__
+    statement = update(table).where(
+        and_(
+            table.c.collection == bindparam('b_collection'),
+            table.c.date == bindparam('b_date'),
+        )
+    ).values(status=bindparam('b_status'))
+
+    with session_scope(str_connection) as session:
+        session.execute(statement, [{'b_collection': c, 'b_date': d, 'b_status': s} for c, d, s in statuses])
+
+
+def iter_partial_logfiles(str_connection, logfiles, chunk_size=values.DB_STATUS_FLUSH_INTERVAL):
+    """
+    Yield log files, marking each chunk of chunk_size files as partially parsed,
+    with one set_logfile_statuses call, before its first file is yielded.
+
+    Parameters:
+    -----------
+        logfiles (list): ControlLogFile objects, as returned by get_non_parsed_logs.
+        chunk_size (int): Number of log files marked at once.
+    """
+    chunk_size = max(1, chunk_size)
+
+    for i in range(0, len(logfiles), chunk_size):
+        chunk = logfiles[i:i + chunk_size]
+        set_logfile_statuses(str_connection, [(lf.id, values.LOGFILE_STATUS_PARTIAL) for lf in chunk])
+        yield from chunk
+
+
+class StatusBuffer:
+    """
+    Collects status updates and writes them with a bulk update function every flush_interval updates,
+    and when the buffer is closed or leaves a with block, even because of an exception.
+
+    A callback given with an update runs after the update is written,
+    e.g. to remove a file that must be kept until the database records the new status.
+
+    Parameters:
+    -----------
+        str_connection (str): Database connection string.
+        bulk_update (callable): set_logfile_statuses or set_control_date_statuses.
+        flush_interval (int): Number of buffered updates that triggers a flush. 1 writes each update at once.
+    """
+    def __init__(self, str_connection, bulk_update, flush_interval=values.DB_STATUS_FLUSH_INTERVAL):
+        self.str_connection = str_connection
+        self.bulk_update = bulk_update
+        self.flush_interval = max(1, flush_interval)
+        self.__updates = []
+        self.__callbacks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.__updates)
+
+    def add(self, status_update, on_flush=None):
+        self.__updates.append(status_update)
+        if on_flush is not None:
+            self.__callbacks.append(on_flush)
+
+        if len(self.__updates) >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self.__updates:
+            return
+
+        updates, self.__updates = self.__updates, []
+        callbacks, self.__callbacks = self.__callbacks, []
+
+        self.bulk_update(self.str_connection, updates)
+
+        for callback in callbacks:
+            callback()
+
+    def close(self):
+        self.flush()
+
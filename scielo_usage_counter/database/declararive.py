@@ -1,6 +1,7 @@
 from sqlalchemy import Column, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.dialects.mysql import BIGINT, BOOLEAN, DATE, DATETIME, DECIMAL, INTEGER, MEDIUMINT, TINYINT, VARCHAR
 from sqlalchemy.dialects.mysql.types import SMALLINT
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import declarative_mixin
 
@@ -190,6 +191,43 @@ class MetricArticleDaily(MetricMixin, Base):
     year_month_day = Column(DATE, nullable=False)
 
 
+class MetricArticleDailyGeolocation(MetricMixin, Base):
+    __tablename__ = 'metric_article_daily_geolocation'
+    __table_args__ = (UniqueConstraint('year_month_day', 'collection', 'article', 'geolocation'),)
+    __table_args__ += (Index('i_ymd_art_geo', 'year_month_day', 'collection', 'article', 'geolocation'),)
+
+    article = Column(INTEGER(unsigned=True), ForeignKey('article.id'))
+    collection = Column(TINYINT(unsigned=True), ForeignKey('collection.id'))
+    geolocation = Column(INTEGER(unsigned=True), ForeignKey('geolocation.id'))
+
+    year_month_day = Column(DATE, nullable=False)
+
+
+class MetricArticleDailyGeolocationFormat(MetricMixin, Base):
+    __tablename__ = 'metric_article_daily_geolocation_format'
+    __table_args__ = (UniqueConstraint('year_month_day', 'collection', 'article', 'geolocation', 'format'),)
+    __table_args__ += (Index('i_ymd_art_geo_for', 'year_month_day', 'collection', 'article', 'geolocation', 'format'),)
+
+    article = Column(INTEGER(unsigned=True), ForeignKey('article.id'))
+    collection = Column(TINYINT(unsigned=True), ForeignKey('collection.id'))
+    geolocation = Column(INTEGER(unsigned=True), ForeignKey('geolocation.id'))
+    format = Column(TINYINT(unsigned=True), ForeignKey('article_format.id'))
+
+    year_month_day = Column(DATE, nullable=False)
+
+
+class MetricArticleDailyGeolocationLanguage(MetricMixin, Base):
+    __tablename__ = 'metric_article_daily_geolocation_language'
+    __table_args__ = (UniqueConstraint('year_month_day', 'collection', 'article', 'geolocation', 'language'),)
+    __table_args__ += (Index('i_ymd_art_geo_lan', 'year_month_day', 'collection', 'article', 'geolocation', 'language'),)
+
+    article = Column(INTEGER(unsigned=True), ForeignKey('article.id'))
+    collection = Column(TINYINT(unsigned=True), ForeignKey('collection.id'))
+    geolocation = Column(INTEGER(unsigned=True), ForeignKey('geolocation.id'))
+    language = Column(SMALLINT(unsigned=True), ForeignKey('article_language.id'))
+
+    year_month_day = Column(DATE, nullable=False)
+
 class MetricArticleMonthly(MetricMixin, Base):
     __tablename__ = 'metric_article_monthly'
     __table_args__ = (UniqueConstraint('collection', 'year_month', 'article'),)
@@ -314,6 +352,43 @@ class MetricJournalDaily(MetricMixin, Base):
     year_month_day = Column(DATE, nullable=False)
 
 
+class MetricJournalDailyGeolocation(MetricMixin, Base):
+    __tablename__ = 'metric_journal_daily_geolocation'
+    __table_args__ = (UniqueConstraint('year_month_day', 'collection', 'geolocation', 'journal'),)
+    __table_args__ += (Index('i_col_ymd_geo_jou', 'collection', 'year_month_day', 'geolocation', 'journal'),)
+
+    journal = Column(SMALLINT(unsigned=True), ForeignKey('journal.id'))
+    collection = Column(TINYINT(unsigned=True), ForeignKey('collection.id'))
+    geolocation = Column(INTEGER(unsigned=True), ForeignKey('geolocation.id'))
+
+    year_month_day = Column(DATE, nullable=False)
+
+
+class MetricJournalDailyGeolocationFormat(MetricMixin, Base):
+    __tablename__ = 'metric_journal_daily_geolocation_format'
+    __table_args__ = (UniqueConstraint('year_month_day', 'collection', 'geolocation', 'format', 'journal'),)
+    __table_args__ += (Index('i_col_ymd_geo_for_jou', 'collection', 'year_month_day', 'geolocation', 'format', 'journal'),)
+
+    journal = Column(SMALLINT(unsigned=True), ForeignKey('journal.id'))
+    collection = Column(TINYINT(unsigned=True), ForeignKey('collection.id'))
+    geolocation = Column(INTEGER(unsigned=True), ForeignKey('geolocation.id'))
+    format = Column(TINYINT(unsigned=True), ForeignKey('article_format.id'))
+
+    year_month_day = Column(DATE, nullable=False)
+
+
+class MetricJournalDailyGeolocationLanguage(MetricMixin, Base):
+    __tablename__ = 'metric_journal_daily_geolocation_language'
+    __table_args__ = (UniqueConstraint('year_month_day', 'collection', 'geolocation', 'language', 'journal'),)
+    __table_args__ += (Index('i_col_ymd_geo_lan_jou', 'collection', 'year_month_day', 'geolocation', 'language', 'journal'),)
+
+    journal = Column(SMALLINT(unsigned=True), ForeignKey('journal.id'))
+    collection = Column(TINYINT(unsigned=True), ForeignKey('collection.id'))
+    geolocation = Column(INTEGER(unsigned=True), ForeignKey('geolocation.id'))
+    language = Column(SMALLINT(unsigned=True), ForeignKey('article_language.id'))
+
+    year_month_day = Column(DATE, nullable=False)
+
 class MetricJournalMonthly(MetricMixin, Base):
     __tablename__ = 'metric_journal_monthly'
     __table_args__ = (UniqueConstraint('collection', 'year_month', 'journal'),)
@@ -458,3 +533,14 @@ class SushiAlert(Base):
     created = Column(DATETIME, nullable=False)
     description = Column(VARCHAR(1024))
     is_active = Column(BOOLEAN, nullable=False)
+
+
+# SQLite has no sized integer types and only autoincrements INTEGER primary keys,
+# so the MySQL integer types are created as INTEGER in local SQLite databases
+@compiles(BIGINT, 'sqlite')
+@compiles(INTEGER, 'sqlite')
+@compiles(MEDIUMINT, 'sqlite')
+@compiles(SMALLINT, 'sqlite')
+@compiles(TINYINT, 'sqlite')
+def _compile_integer_sqlite(type_, compiler, **kw):
+    return 'INTEGER'
@@ -0,0 +1,388 @@
+import concurrent.futures
+import functools
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import Table, and_, bindparam, insert, or_, select, text, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import UniqueConstraint
+
+from scielo_usage_counter import metrics, values
+from scielo_usage_counter.database import db
+
+import scielo_usage_counter.database.declararive as models
+
+
+UPSERT_REPLACE = 'replace'
+UPSERT_INCREMENT = 'increment'
+UPSERT_MODES = (UPSERT_REPLACE, UPSERT_INCREMENT)
+
+# MySQL: deadlock found when trying to get lock, lock wait timeout exceeded
+MYSQL_RETRY_ERRORS = (1213, 1205)
+
+SQLITE_RETRY_MESSAGES = ('database is locked',)
+
+
+def get_unique_columns(table):
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            return [c.name for c in constraint.columns]
+    return []
+
+
+def is_retryable(error):
+    """
+    Check whether a database error is a deadlock or a lock timeout, after which the transaction can be run again.
+    """
+    orig = getattr(error, 'orig', None)
+    args = getattr(orig, 'args', ())
+
+    if args and args[0] in MYSQL_RETRY_ERRORS:
+        return True
+
+    return any(m in str(orig) for m in SQLITE_RETRY_MESSAGES)
+
+
+class BulkLoader:
+    """
+    Writes rows to a table with a unique constraint, such as the metric tables, with batched upserts.
+
+    Each batch is one executemany INSERT ... ON DUPLICATE KEY UPDATE statement on MySQL, which
+    mysqlclient sends as multi-row statements, or INSERT ... ON CONFLICT DO UPDATE on SQLite. The other columns of rows whose unique key already
+    exists are replaced (UPSERT_REPLACE) or added to (UPSERT_INCREMENT). Rows with a NULL unique
+    column, which unique constraints never match, are matched against the existing rows of each
+    batch with one query, and are then updated and inserted with one executemany statement each.
+
+    On MySQL, batches can instead be written to a temporary TSV file and loaded with
+    LOAD DATA LOCAL INFILE into a temporary table, from which they are upserted. The connection
+    must allow it, e.g. with local_infile=1 in the connection string.
+
+    Batches run in their own transactions, on workers parallel connections, and are run again
+    after a deadlock or a lock timeout. Given a connection, batches run in its transaction
+    instead, one after the other, and are not run again, since a deadlock rolls the whole
+    transaction back. SQLite databases allow one writer, so they use a single worker.
+
+    Parameters:
+    -----------
+        str_connection (str): Database connection string.
+        batch_size (int): Number of rows per statement.
+        workers (int): Number of parallel connections per table.
+        max_retries (int): Number of times a batch is run again after a deadlock or a lock timeout.
+        retry_wait (float): Seconds before the first new run, doubled at each new run.
+        load_data (bool): Whether MySQL batches are written with LOAD DATA LOCAL INFILE.
+        tmp_dir (str): Directory of the temporary files of LOAD DATA LOCAL INFILE.
+    """
+    def __init__(
+        self,
+        str_connection,
+        batch_size=values.DB_LOADER_BATCH_SIZE,
+        workers=values.DB_LOADER_WORKERS,
+        max_retries=values.DB_LOADER_MAX_RETRIES,
+        retry_wait=values.DB_LOADER_RETRY_WAIT,
+        load_data=False,
+        tmp_dir=None,
+    ):
+        self.engine = db.get_engine(str_connection)
+        self.dialect = self.engine.dialect.name
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers) if self.dialect == 'mysql' else 1
+        self.max_retries = max(0, max_retries)
+        self.retry_wait = retry_wait
+        self.load_data = load_data and self.dialect == 'mysql'
+        self.tmp_dir = tmp_dir
+        self.rows = 0
+        self.retries = 0
+        self.__statements = {}
+        self.__lock = threading.Lock()
+
+    def _get_value_columns(self, table, unique_columns):
+        return [c.name for c in table.columns if not c.primary_key and c.name not in unique_columns]
+
+    def _get_updates(self, table, unique_columns, new_values, mode):
+        if mode == UPSERT_INCREMENT:
+            return {c: table.c[c] + new_values[c] for c in self._get_value_columns(table, unique_columns)}
+        return {c: new_values[c] for c in self._get_value_columns(table, unique_columns)}
+
+    def _get_statement(self, table, unique_columns, mode):
+        key = (table.name, mode)
+        statement = self.__statements.get(key)
+
+        if statement is None:
+            if self.dialect == 'mysql':
+                statement = mysql_insert(table)
+                statement = statement.on_duplicate_key_update(self._get_updates(table, unique_columns, statement.inserted, mode))
+            else:
+                statement = sqlite_insert(table)
+                statement = statement.on_conflict_do_update(index_elements=unique_columns, set_=self._get_updates(table, unique_columns, statement.excluded, mode))
+            self.__statements[key] = statement
+
+        return statement
+
+    def _write_batch(self, table, unique_columns, mode, rows, connection):
+        # the same statement object keeps its compiled form in the engine cache; mysqlclient
+        # sends the rows of an executemany INSERT as multi-row statements
+        connection.execute(self._get_statement(table, unique_columns, mode), rows)
+
+    def _load_batch(self, table, unique_columns, mode, rows, connection):
+        columns = list(rows[0])
+        staging = f'tmp_load_{table.name}'
+        updates = ', '.join(
+            f'{c} = {table.name}.{c} + VALUES({c})' if mode == UPSERT_INCREMENT else f'{c} = VALUES({c})'
+            for c in self._get_value_columns(table, unique_columns)
+        )
+
+        fd, path = tempfile.mkstemp(prefix='load-', suffix='.tsv', dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'w') as fout:
+                for r in rows:
+                    fout.write('\t'.join('\\N' if r[c] is None else str(r[c]) for c in columns) + '\n')
+
+            connection.execute(text(f'CREATE TEMPORARY TABLE IF NOT EXISTS {staging} LIKE {table.name}'))
+            connection.execute(text(f'DELETE FROM {staging}'))
+            connection.execute(
+                text(f"LOAD DATA LOCAL INFILE :path INTO TABLE {staging} FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({', '.join(columns)})"),
+                {'path': path},
+            )
+            connection.execute(text(
+                f'INSERT INTO {table.name} ({", ".join(columns)}) SELECT {", ".join(columns)} FROM {staging} ON DUPLICATE KEY UPDATE {updates}'
+            ))
+        finally:
+            os.remove(path)
+
+    def _get_existing_ids(self, table, unique_columns, keys, connection):
+        conditions = []
+        for i, c in enumerate(unique_columns):
+            key_values = {k[i] for k in keys}
+            condition = table.c[c].in_(key_values - {None})
+            if None in key_values:
+                condition = or_(condition, table.c[c].is_(None))
+            conditions.append(condition)
+
+        # the conditions select every row whose key columns hold values of the keys, and the keys are matched here
+        id_column = table.c[table.primary_key.columns.keys()[0]]
+        existing = {}
+        for r in connection.execute(select(id_column, *[table.c[c] for c in unique_columns]).where(and_(*conditions))):
+            r = tuple(r)
+            if r[1:] in keys:
+                existing[r[1:]] = r[0]
+        return existing
+
+    def _merge_rows(self, table, unique_columns, mode, rows):
+        # rows with the same key are merged, as if they were written one after the other
+        value_columns = [c for c in self._get_value_columns(table, unique_columns) if c in rows[0]]
+        merged = {}
+
+        for r in rows:
+            key = tuple(r.get(c) for c in unique_columns)
+            if mode == UPSERT_INCREMENT and key in merged:
+                merged[key] = {**merged[key], **{c: merged[key][c] + r[c] for c in value_columns}}
+            else:
+                merged[key] = r
+
+        return list(merged.values())
+
+    def _write_rows_with_nulls(self, table, unique_columns, mode, rows, connection):
+        if not unique_columns:
+            connection.execute(insert(table), rows)
+            return
+
+        value_columns = [c for c in self._get_value_columns(table, unique_columns) if c in rows[0]]
+        keys = [tuple(r.get(c) for c in unique_columns) for r in rows]
+        existing = self._get_existing_ids(table, unique_columns, set(keys), connection)
+
+        updates = [{'b_id': existing[k], **{f'b_{c}': r[c] for c in value_columns}} for k, r in zip(keys, rows) if k in existing]
+        if updates:
+            id_column = table.c[table.primary_key.columns.keys()[0]]
+            new_values = {c: table.c[c] + bindparam(f'b_{c}') if mode == UPSERT_INCREMENT else bindparam(f'b_{c}') for c in value_columns}
+            connection.execute(update(table).where(id_column == bindparam('b_id')).values(new_values), updates)
+
+        inserts = [r for k, r in zip(keys, rows) if k not in existing]
+        if inserts:
+            connection.execute(insert(table), inserts)
+
+    def _run(self, work):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.engine.begin() as connection:
+                    return work(connection)
+            except DBAPIError as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                with self.__lock:
+                    self.retries += 1
+                logging.warning('Lote será gravado novamente: %s' % e.orig)
+                time.sleep(self.retry_wait * 2 ** attempt)
+
+    def upsert(self, table, rows, mode=UPSERT_REPLACE, connection=None):
+        """
+        Write rows, all of them with the same columns, to a table.
+
+        Parameters:
+        -----------
+            table (str or sqlalchemy.Table): Table, or its name.
+            rows (list): Rows (dict) to be written.
+            mode (str): UPSERT_REPLACE or UPSERT_INCREMENT.
+            connection (sqlalchemy.engine.Connection): Connection whose transaction is used (optional).
+        """
+        if mode not in UPSERT_MODES:
+            raise ValueError('Modo de gravação inválido: %s' % mode)
+
+        if not rows:
+            return
+
+        if not isinstance(table, Table):
+            table = models.Base.metadata.tables[table]
+
+        size = len(rows)
+        unique_columns = get_unique_columns(table)
+        with_nulls = [r for r in rows if any(r.get(c) is None for c in unique_columns)]
+        rows = [r for r in rows if all(r.get(c) is not None for c in unique_columns)]
+
+        works = []
+        if rows and unique_columns and self.dialect in ('mysql', 'sqlite'):
+            write_batch = self._load_batch if self.load_data else self._write_batch
+            for i in range(0, len(rows), self.batch_size):
+                works.append(functools.partial(write_batch, table, unique_columns, mode, rows[i:i + self.batch_size]))
+        else:
+            with_nulls.extend(rows)
+
+        if with_nulls and unique_columns:
+            with_nulls = self._merge_rows(table, unique_columns, mode, with_nulls)
+
+        for i in range(0, len(with_nulls), self.batch_size):
+            works.append(functools.partial(self._write_rows_with_nulls, table, unique_columns, mode, with_nulls[i:i + self.batch_size]))
+
+        if connection is not None:
+            for work in works:
+                work(connection)
+        elif self.workers == 1 or len(works) == 1:
+            for work in works:
+                self._run(work)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+                list(executor.map(self._run, works))
+
+        self.rows += size
+
+
+class MetricsWriter:
+    """
+    Writes the results of metrics.MetricsAggregator to the metric tables, in batches.
+
+    The natural keys of the results (PID, ISSN, format, language, coordinates and year of
+    publication) are translated into the ids of the Article, Journal, ArticleFormat,
+    ArticleLanguage and Geolocation tables. Formats, languages and places are created when
+    missing; results of articles or journals that are not registered are not written.
+    Ids are cached between batches and between days.
+
+    Results whose keys resolve to the same ids, such as ISSNs of one journal, coordinates
+    quantized to one place, or places without coordinates, are summed. Since the metrics of
+    the day are removed before they are written, the rows of every batch are added to the
+    rows already written.
+
+    Parameters:
+    -----------
+        str_connection (str): Database connection string.
+        collection (int): Collection id.
+        batch_size (int): Number of results translated and written at once.
+        loader (BulkLoader): Loader of the metric rows (optional).
+    """
+    def __init__(self, str_connection, collection, batch_size=values.METRIC_BATCH_SIZE, loader=None):
+        self.str_connection = str_connection
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.loader = loader or BulkLoader(str_connection)
+        self.written = 0
+        self.unresolved = 0
+        self.__ids = {
+            'article': {},
+            'journal': db.get_journal_ids(str_connection),
+            'format': {},
+            'language': {},
+            'geolocation': {},
+        }
+
+    def _load_ids(self, batch):
+        missing = {'article': set(), 'format': set(), 'language': set(), 'geolocation': set()}
+
+        for key, _ in batch:
+            for column, value in zip(metrics.METRIC_TABLE_KEYS[key[0]], key[1:]):
+                if column in missing and value not in self.__ids[column]:
+                    missing[column].add(value)
+
+        if missing['article']:
+            article_ids = db.get_article_ids(self.str_connection, self.collection, missing['article'])
+            self.__ids['article'].update({pid: article_ids.get(pid) for pid in missing['article']})
+
+        for column, model in (('format', models.ArticleFormat), ('language', models.ArticleLanguage)):
+            if missing[column]:
+                self.__ids[column].update(db.get_or_create_dimension_ids(self.str_connection, model, column, missing[column]))
+
+        if missing['geolocation']:
+            geolocation_ids = db.get_or_create_geolocation_ids(self.str_connection, [c for c in missing['geolocation'] if c[0] and c[1]])
+            self.__ids['geolocation'].update({c: geolocation_ids.get(c) for c in missing['geolocation']})
+
+    def _to_row(self, key, counts, date):
+        row = {'collection': self.collection, 'year_month_day': date}
+
+        for column, value in zip(metrics.METRIC_TABLE_KEYS[key[0]], key[1:]):
+            if column == 'yop':
+                row[column] = int(value) if value.isdigit() else None
+                continue
+
+            row[column] = self.__ids[column].get(value)
+            if row[column] is None and column in ('article', 'journal'):
+                return None
+
+        row.update(zip(metrics.MEASURES, counts))
+        return row
+
+    def _write_batch(self, batch, date):
+        self._load_ids(batch)
+
+        rows = {}
+        for key, counts in batch:
+            row = self._to_row(key, counts, date)
+            if row is None:
+                self.unresolved += 1
+                continue
+
+            # different natural keys may resolve to the same row of the table
+            table_rows = rows.setdefault(key[0], {})
+            row_key = tuple(row[c] for c in metrics.METRIC_TABLE_KEYS[key[0]])
+            existing = table_rows.get(row_key)
+            if existing is None:
+                table_rows[row_key] = row
+            else:
+                for m in metrics.MEASURES:
+                    existing[m] += row[m]
+
+        for table, table_rows in rows.items():
+            self.loader.upsert(table, list(table_rows.values()), UPSERT_INCREMENT)
+            self.written += len(table_rows)
+
+    def write(self, results, date):
+        """
+        Replace the metrics of the day by the results.
+
+        Parameters:
+        -----------
+            results (iterable): (key, measures) pairs, as yielded by metrics.MetricsAggregator.results.
+            date (datetime.date): Day of the metrics.
+        """
+        db.delete_metrics(self.str_connection, list(metrics.METRIC_TABLE_KEYS), self.collection, date)
+
+        batch = []
+        for result in results:
+            batch.append(result)
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch, date)
+                batch = []
+
+        if batch:
+            self._write_batch(batch, date)
@@ -0,0 +1,195 @@
+import collections
+import datetime
+
+from sqlalchemy import and_, delete, func, insert, select, update
+
+from scielo_usage_counter import metrics, values
+from scielo_usage_counter.database.db import session_scope
+from scielo_usage_counter.database.loader import BulkLoader, UPSERT_INCREMENT
+
+import scielo_usage_counter.database.declararive as models
+
+
+# name: identifier of the monthly table in MetricStatus.metric_table, which is limited to 32 characters
+# table: monthly table
+# source: daily table whose rows of a day are summed into the monthly table
+# keys: columns of the monthly rows, besides collection and year_month
+#
+# user-sessions do not cross hours, so the unique measures of the days of a month add up to those of the month.
+# Each source counts unique items by the format and language of its monthly table, and is summed only across
+# geolocations and years of publication, which do not change within a session (see metrics.METRIC_TABLE_KEYS).
+Rollup = collections.namedtuple('Rollup', ['name', 'table', 'source', 'keys'])
+
+ROLLUPS = (
+    Rollup('art_monthly', 'metric_article_monthly', metrics.ARTICLE_DAILY, ('article',)),
+    Rollup('art_monthly_lan', 'metric_article_monthly_language', metrics.ARTICLE_DAILY_GEO_LAN, ('article', 'language')),
+    Rollup('art_monthly_for', 'metric_article_monthly_format', metrics.ARTICLE_DAILY_GEO_FOR, ('article', 'format')),
+    Rollup('art_monthly_geo', 'metric_article_monthly_geolocation', metrics.ARTICLE_DAILY_GEO, ('article', 'geolocation')),
+    Rollup('art_monthly_geo_lan', 'metric_article_monthly_geolocation_language', metrics.ARTICLE_DAILY_GEO_LAN, ('article', 'geolocation', 'language')),
+    Rollup('art_monthly_geo_for', 'metric_article_monthly_geolocation_format', metrics.ARTICLE_DAILY_GEO_FOR, ('article', 'geolocation', 'format')),
+    Rollup('art_monthly_for_lan', 'metric_article_monthly_format_language', metrics.ARTICLE_DETAILED, ('article', 'format', 'language')),
+    Rollup('jou_monthly', 'metric_journal_monthly', metrics.JOURNAL_DAILY, ('journal',)),
+    Rollup('jou_monthly_yop', 'metric_journal_monthly_yop', metrics.JOURNAL_DAILY_YOP, ('journal', 'yop')),
+    Rollup('jou_monthly_for', 'metric_journal_monthly_format', metrics.JOURNAL_DAILY_GEO_FOR, ('journal', 'format')),
+    Rollup('jou_monthly_lan', 'metric_journal_monthly_language', metrics.JOURNAL_DAILY_GEO_LAN, ('journal', 'language')),
+    Rollup('jou_monthly_geo', 'metric_journal_monthly_geolocation', metrics.JOURNAL_DAILY_GEO, ('journal', 'geolocation')),
+    Rollup('jou_monthly_geo_for', 'metric_journal_monthly_geolocation_format', metrics.JOURNAL_DAILY_GEO_FOR, ('journal', 'geolocation', 'format')),
+    Rollup('jou_monthly_geo_lan', 'metric_journal_monthly_geolocation_language', metrics.JOURNAL_DAILY_GEO_LAN, ('journal', 'geolocation', 'language')),
+    Rollup('jou_monthly_for_lan', 'metric_journal_monthly_format_language', metrics.JOURNAL_DETAILED, ('journal', 'format', 'language')),
+)
+
+
+def _get_table(name):
+    return models.Base.metadata.tables[name]
+
+
+def get_day_deltas(session, rollup, collection, date, sign=1):
+    """
+    Sum the daily rows of a day by the keys of a monthly table.
+
+    Returns:
+    --------
+        list: Monthly rows (dict) holding the measures of the day, multiplied by sign.
+    """
+    source = _get_table(rollup.source)
+    key_columns = [source.c[k] for k in rollup.keys]
+    year_month = date.replace(day=1)
+
+    rows = session.execute(
+        select(*key_columns, *[func.sum(source.c[m]).label(m) for m in metrics.MEASURES]).where(
+            and_(
+                source.c.collection == collection,
+                source.c.year_month_day == date,
+            )
+        ).group_by(*key_columns)
+    )
+
+    deltas = []
+    for r in rows:
+        row = {'collection': collection, 'year_month': year_month}
+        row.update({k: r._mapping[k] for k in rollup.keys})
+        row.update({m: sign * int(r._mapping[m]) for m in metrics.MEASURES})
+        deltas.append(row)
+
+    return deltas
+
+
+def _get_folded_rollups(session, collection, date):
+    return {r.metric_table for r in session.query(models.MetricStatus.metric_table).filter(
+        and_(
+            models.MetricStatus.collection == collection,
+            models.MetricStatus.year_month_day == date,
+            models.MetricStatus.status == True,
+        )
+    )}
+
+
+def _set_folded(session, collection, rollup, date, status):
+    table = models.MetricStatus.__table__
+    condition = and_(table.c.collection == collection, table.c.metric_table == rollup.name, table.c.year_month_day == date)
+    updated = datetime.datetime.now()
+
+    result = session.execute(update(table).where(condition).values(status=status, updated=updated))
+    if result.rowcount == 0:
+        session.execute(insert(table), [{'collection': collection, 'metric_table': rollup.name, 'year_month_day': date, 'status': status, 'updated': updated}])
+
+
+def fold_day(str_connection, collection, date, rollups=ROLLUPS, loader=None):
+    """
+    Add the daily metrics of a day to the monthly tables it was not added to yet.
+    The monthly rows and the MetricStatus rows are written in the same transaction,
+    so that a day is never added twice to a monthly table.
+    The measures are added to the existing monthly rows by the loader (loader.BulkLoader).
+
+    Returns:
+    --------
+        int: Number of monthly rows updated or inserted.
+    """
+    loader = loader or BulkLoader(str_connection)
+    written = 0
+
+    with session_scope(str_connection) as session:
+        folded = _get_folded_rollups(session, collection, date)
+
+        for rollup in rollups:
+            if rollup.name in folded:
+                continue
+
+            deltas = get_day_deltas(session, rollup, collection, date)
+            loader.upsert(rollup.table, deltas, UPSERT_INCREMENT, connection=session.connection())
+            _set_folded(session, collection, rollup, date, True)
+            written += len(deltas)
+
+    return written
+
+
+def unfold_day(str_connection, collection, date, rollups=ROLLUPS, loader=None):
+    """
+    Subtract the daily metrics of a day from the monthly tables it was added to,
+    e.g. before its daily metrics are computed again.
+    Monthly rows left without any access are removed.
+    """
+    loader = loader or BulkLoader(str_connection)
+
+    with session_scope(str_connection) as session:
+        folded = _get_folded_rollups(session, collection, date)
+
+        for rollup in rollups:
+            if rollup.name not in folded:
+                continue
+
+            table = _get_table(rollup.table)
+            loader.upsert(table, get_day_deltas(session, rollup, collection, date, sign=-1), UPSERT_INCREMENT, connection=session.connection())
+            session.execute(delete(table).where(
+                and_(
+                    table.c.collection == collection,
+                    table.c.year_month == date.replace(day=1),
+                    *[table.c[m] == 0 for m in metrics.MEASURES],
+                )
+            ))
+            _set_folded(session, collection, rollup, date, False)
+
+
+def get_unfolded_dates(str_connection, collection, rollups=ROLLUPS):
+    """
+    Computed dates that were not added to all the monthly tables.
+    """
+    with session_scope(str_connection) as session:
+        computed_dates = [r.date for r in session.query(models.ControlDateStatus.date).filter(
+            and_(
+                models.ControlDateStatus.collection == collection,
+                models.ControlDateStatus.status == values.DATE_STATUS_COMPUTED,
+            )
+        ).order_by(models.ControlDateStatus.date)]
+
+        if not computed_dates:
+            return []
+
+        folded = collections.defaultdict(set)
+        for r in session.query(models.MetricStatus.year_month_day, models.MetricStatus.metric_table).filter(
+            and_(
+                models.MetricStatus.collection == collection,
+                models.MetricStatus.year_month_day.between(computed_dates[0], computed_dates[-1]),
+                models.MetricStatus.status == True,
+            )
+        ):
+            folded[r.year_month_day].add(r.metric_table)
+
+    names = {r.name for r in rollups}
+    return [d for d in computed_dates if not names <= folded[d]]
+
+
+def fold_pending_dates(str_connection, collection, rollups=ROLLUPS, loader=None):
+    """
+    Add the computed dates that are missing from the monthly tables.
+
+    Returns:
+    --------
+        list: Dates added.
+    """
+    dates = get_unfolded_dates(str_connection, collection, rollups)
+
+    for date in dates:
+        fold_day(str_connection, collection, date, rollups, loader)
+
+    return dates
@@ -8,4 +8,7 @@ class InvalidLogFileMimeError(Exception):
     ...
 
 class InvalidFilePath(Exception):
-    ...
\ No newline at end of file
+    ...
+
+class InvalidColumnarDataError(Exception):
+    ...
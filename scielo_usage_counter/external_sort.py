@@ -0,0 +1,244 @@
+import collections
+import heapq
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from . import exceptions
+from .utils import file_utils
+
+
+SORT_MODE_IP_TIME = 'ip_time'
+SORT_MODE_COMPAT = 'compat'
+SORT_MODES = (SORT_MODE_IP_TIME, SORT_MODE_COMPAT)
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# sorting a run takes several times the size of its lines, because of the object overhead and the sort keys
+MEMORY_FACTOR = 4
+
+MIN_RUN_SIZE = 1024 * 1024
+
+MAX_MERGE_FILES = 128
+
+SortResult = collections.namedtuple('SortResult', ['lines_read', 'lines_written', 'duplicates', 'runs'])
+
+
+def _compat_key(line):
+    # sort -t '\t' -k 4: the key goes from the 4th field to the end of the line, and the whole line breaks ties
+    i = -1
+    for _ in range(3):
+        i = line.find(b'\t', i + 1)
+        if i < 0:
+            return b'', line
+    return line[i + 1:], line
+
+
+def _make_ip_time_key(ip_index, time_index):
+    def _key(line):
+        fields = line.split(b'\t')
+        ip = fields[ip_index] if ip_index < len(fields) else b''
+        server_time = fields[time_index] if time_index < len(fields) else b''
+        return ip, server_time, line
+    return _key
+
+
+def _get_key(mode, key_fields):
+    if mode == SORT_MODE_COMPAT:
+        return _compat_key
+    return _make_ip_time_key(*key_fields)
+
+
+def _unique(lines):
+    """
+    Remove adjacent duplicated lines, as uniq does. Yields (line, is_duplicate).
+    """
+    previous = None
+    for line in lines:
+        yield line, line == previous
+        previous = line
+
+
+def _read_lines(path):
+    with open(path, 'rb') as fin:
+        for line in fin:
+            yield line[:-1] if line.endswith(b'\n') else line
+
+
+def _write_lines(lines, fout):
+    written = 0
+    duplicates = 0
+
+    for line, is_duplicate in _unique(lines):
+        if is_duplicate:
+            duplicates += 1
+            continue
+        fout.write(line)
+        fout.write(b'\n')
+        written += 1
+
+    return written, duplicates
+
+
+def _sort_range(input_path, start, end, mode, key_fields, tmp_dir):
+    """
+    Sort the lines of a byte range of the input file and write them to a temporary run file.
+
+    Returns:
+    --------
+        tuple: (run path, lines read, lines written, duplicates)
+    """
+    with open(input_path, 'rb') as fin:
+        fin.seek(start)
+        data = fin.read(end - start)
+
+    lines = data.split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+    del data
+
+    lines.sort(key=_get_key(mode, key_fields), reverse=mode == SORT_MODE_COMPAT)
+
+    fd, run_path = tempfile.mkstemp(prefix='run-', suffix='.tsv', dir=tmp_dir)
+    with os.fdopen(fd, 'wb') as fout:
+        written, duplicates = _write_lines(lines, fout)
+
+    return run_path, len(lines), written, duplicates
+
+
+class ExternalSorter:
+    """
+    Sorts and removes duplicated lines of tab-separated files larger than memory.
+
+    The input is split into line-aligned ranges sized after the memory budget.
+    Each range is sorted in memory (in parallel, when workers > 1) and written
+    to a temporary run file. Runs are then combined with a k-way heap merge,
+    in several passes when there are more than MAX_MERGE_FILES runs, and
+    duplicated lines are removed while merging.
+
+    In the 'ip_time' mode the header line is kept at the top and the rows are
+    sorted by IP address, then server time, then the whole row, so that all
+    the hits of an IP address are contiguous and in chronological order.
+
+    In the 'compat' mode the output is byte-identical to
+    LC_ALL=C sort -r -t $'\\t' -k 4 | uniq, the command used by scripts/sort_uniq.sh.
+
+    Parameters:
+    -----------
+        mode (str): One of SORT_MODES.
+        memory_budget (int): Approximate memory, in bytes, used by all workers while sorting runs.
+        workers (int): Number of processes used to sort runs.
+        tmp_dir (str or None): Directory of the temporary run files.
+        ip_field (str): Header field with the IP address, used by the 'ip_time' mode.
+        time_field (str): Header field with the server time, used by the 'ip_time' mode.
+    """
+    def __init__(
+        self,
+        mode=SORT_MODE_IP_TIME,
+        memory_budget=DEFAULT_MEMORY_BUDGET,
+        workers=1,
+        tmp_dir=None,
+        ip_field='ip',
+        time_field='serverTime',
+    ):
+        if mode not in SORT_MODES:
+            raise ValueError(f'Invalid sort mode: {mode}')
+
+        self.mode = mode
+        self.memory_budget = memory_budget
+        self.workers = max(1, workers)
+        self.tmp_dir = tmp_dir
+        self.ip_field = ip_field
+        self.time_field = time_field
+
+    @property
+    def run_size(self):
+        return max(MIN_RUN_SIZE, self.memory_budget // (self.workers * MEMORY_FACTOR))
+
+    def _read_header(self, input_path):
+        with open(input_path, 'rb') as fin:
+            header = fin.readline()
+
+        fields = header.rstrip(b'\n').decode().split('\t')
+        for f in (self.ip_field, self.time_field):
+            if f not in fields:
+                raise exceptions.InvalidFilePath(f'Campo {f} não encontrado no cabeçalho de {input_path}')
+
+        return header, (fields.index(self.ip_field), fields.index(self.time_field))
+
+    def _generate_runs(self, input_path, start, key_fields, tmp_dir):
+        ranges = file_utils.get_line_aligned_ranges(input_path, self.run_size, start=start)
+        tasks = [(input_path, s, e, self.mode, key_fields, tmp_dir) for s, e in ranges]
+
+        if self.workers > 1 and len(tasks) > 1:
+            with multiprocessing.Pool(min(self.workers, len(tasks))) as pool:
+                return pool.starmap(_sort_range, tasks)
+
+        return [_sort_range(*t) for t in tasks]
+
+    def _merge(self, runs, fout, key):
+        return _write_lines(
+            heapq.merge(*[_read_lines(r) for r in runs], key=key, reverse=self.mode == SORT_MODE_COMPAT),
+            fout,
+        )
+
+    def sort(self, input_path, output_path):
+        """
+        Sort input_path into output_path.
+
+        Returns:
+        --------
+            SortResult: Number of lines read and written, duplicates removed and runs generated.
+        """
+        if not file_utils.is_valid_path(input_path):
+            raise exceptions.InvalidFilePath('%s não é um caminho válido' % input_path)
+
+        header = b''
+        key_fields = None
+        if self.mode == SORT_MODE_IP_TIME:
+            header, key_fields = self._read_header(input_path)
+
+        key = _get_key(self.mode, key_fields)
+        tmp_dir = tempfile.mkdtemp(prefix='sort-', dir=self.tmp_dir)
+
+        try:
+            runs = self._generate_runs(input_path, len(header), key_fields, tmp_dir)
+            lines_read = sum(r[1] for r in runs)
+            duplicates = sum(r[3] for r in runs)
+            run_paths = [r[0] for r in runs]
+            logging.info(f'{len(run_paths)} blocos ordenados gerados para {input_path} ({lines_read} linhas)')
+
+            # reduces the number of runs until they can be merged at once
+            while len(run_paths) > MAX_MERGE_FILES:
+                merged_paths = []
+                for i in range(0, len(run_paths), MAX_MERGE_FILES):
+                    fd, merged_path = tempfile.mkstemp(prefix='run-', suffix='.tsv', dir=tmp_dir)
+                    with os.fdopen(fd, 'wb') as fout:
+                        duplicates += self._merge(run_paths[i:i + MAX_MERGE_FILES], fout, key)[1]
+                    merged_paths.append(merged_path)
+                logging.info(f'{len(run_paths)} blocos combinados em {len(merged_paths)}')
+                run_paths = merged_paths
+
+            with open(output_path, 'wb') as fout:
+                fout.write(header)
+                if header and not header.endswith(b'\n'):
+                    fout.write(b'\n')
+                written, merge_duplicates = self._merge(run_paths, fout, key)
+
+            duplicates += merge_duplicates
+            if header:
+                lines_read += 1
+                written += 1
+
+            logging.info(f'Arquivo {output_path} gravado com {written} linhas ({duplicates} duplicadas removidas)')
+            return SortResult(lines_read, written, duplicates, len(runs))
+
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def sort_file(input_path, output_path, mode=SORT_MODE_IP_TIME, memory_budget=DEFAULT_MEMORY_BUDGET, workers=1, tmp_dir=None):
+    sorter = ExternalSorter(mode=mode, memory_budget=memory_budget, workers=workers, tmp_dir=tmp_dir)
+    return sorter.sort(input_path, output_path)
@@ -1,9 +1,84 @@
+import collections
 import geoip2.database
+import ipaddress
 
 from geoip2.errors import AddressNotFoundError
 
+from . import cache, values
+
+
+GeoRecord = collections.namedtuple('GeoRecord', ['country_code', 'latitude', 'longitude'])
+
+
+class CountryPrefixCache:
+    """
+    Compact cache of country codes keyed by /24 (IPv4) and /48 (IPv6) prefixes.
+
+    A prefix is only stored when the whole prefix lies inside the network that
+    the geolocation map returned, so cached codes are exact. IPv4 codes are kept
+    as 2 bytes per /24 prefix in a flat array (32 MiB, allocated on first use);
+    IPv6 codes are kept in a bounded dictionary.
+    """
+    IPV4_PREFIX = 24
+    IPV6_PREFIX = 48
+
+    def __init__(self, ipv6_max_size=values.GEOIP_CACHE_SIZE):
+        self.__ipv4 = None
+        self.__ipv6 = cache.LRUCache(max_size=ipv6_max_size)
+
+    def _key(self, ip):
+        try:
+            ipa = ipaddress.ip_address(ip)
+        except ValueError:
+            return None, None
+
+        if ipa.version == 4:
+            return 4, int(ipa) >> (32 - self.IPV4_PREFIX)
+        return 6, int(ipa) >> (128 - self.IPV6_PREFIX)
+
+    def get(self, ip):
+        version, key = self._key(ip)
+
+        if version == 4 and self.__ipv4 is not None:
+            code = self.__ipv4[key * 2:key * 2 + 2]
+            if code != b'\x00\x00':
+                return code.decode()
+        elif version == 6:
+            return self.__ipv6.get(key)
+
+        return None
+
+    def put(self, ip, prefix_len, country_code):
+        if not country_code or len(country_code) != 2:
+            return
+
+        version, key = self._key(ip)
+
+        if version == 4 and prefix_len <= self.IPV4_PREFIX:
+            if self.__ipv4 is None:
+                self.__ipv4 = bytearray(2 * 2 ** self.IPV4_PREFIX)
+            self.__ipv4[key * 2:key * 2 + 2] = country_code.encode()
+        elif version == 6 and prefix_len <= self.IPV6_PREFIX:
+            self.__ipv6.put(key, country_code)
+
 
 class GeoIp:
+    """
+    Geolocation of IP addresses.
+
+    Lookups are memoized by IP, including addresses that are not found, and the
+    same record serves ip_to_country_code and ip_to_geolocation. Optionally,
+    country codes are also cached by network prefix.
+
+    Parameters:
+    -----------
+        cache_size (int): Maximum number of IP addresses kept in the memoization cache.
+        prefix_cache (bool): Whether to cache country codes by /24 and /48 prefixes.
+    """
+    def __init__(self, cache_size=values.GEOIP_CACHE_SIZE, prefix_cache=False):
+        self.__cache = cache.LRUCache(max_size=cache_size)
+        self.__prefix_cache = CountryPrefixCache() if prefix_cache else None
+
     @property
     def map(self):
         return self.__map
@@ -14,28 +89,73 @@ class GeoIp:
             self.__map = geoip2.database.Reader(mmbd)
         except FileNotFoundError:
             return
-        
-    def ip_to_country_code(self, ip):
+
+        # city databases also carry the country, so one lookup yields both
+        if 'City' in self.__map.metadata().database_type:
+            self.__map_lookup = self.__map.city
+        else:
+            self.__map_lookup = self.__map.country
+
+        self.__cache.clear()
+        if self.__prefix_cache is not None:
+            self.__prefix_cache = CountryPrefixCache()
+
+    @property
+    def cache(self):
+        return self.__cache
+
+    def _lookup(self, ip):
         try:
-            return self.map.country(ip).country.iso_code
+            response = self.__map_lookup(ip)
         except AddressNotFoundError:
             return
         except ValueError:
             return
 
+        location = getattr(response, 'location', None)
+        record = GeoRecord(
+            response.country.iso_code,
+            getattr(location, 'latitude', None),
+            getattr(location, 'longitude', None),
+        )
+
+        if self.__prefix_cache is not None:
+            network = getattr(response.traits, 'network', None)
+            if network is not None:
+                self.__prefix_cache.put(ip, network.prefixlen, record.country_code)
+
+        return record
+
+    def lookup(self, ip):
+        """
+        Return the GeoRecord of an IP address, or None when it is invalid or not found.
+        """
+        record = self.__cache.get(ip, cache.MISSING)
+
+        if record is cache.MISSING:
+            record = self._lookup(ip)
+            self.__cache.put(ip, record)
+
+        return record
+
+    def ip_to_country_code(self, ip):
+        if self.__prefix_cache is not None and ip not in self.__cache:
+            country_code = self.__prefix_cache.get(ip)
+            if country_code:
+                return country_code
+
+        record = self.lookup(ip)
+        if record:
+            return record.country_code
+
     def ip_to_geolocation(self, ip):
-        try:
-            return self.map.city(ip)
-        except AddressNotFoundError:
-            return
-        except ValueError:
-            return
+        return self.lookup(ip)
 
     def geolocation_to_str(self, map_geo, sep='\t'):
         try:
             return sep.join([str(i) for i in [
-                map_geo.location.latitude,
-                map_geo.location.longitude,
+                map_geo.latitude,
+                map_geo.longitude,
             ]])
         except AttributeError:
             return
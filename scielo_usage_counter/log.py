@@ -1,146 +1,75 @@
-import datetime
-import ipaddress
-import re
+import device_detector
+import hashlib
 import logging
+import os
 import time
-import urllib.parse
 
 from device_detector import DeviceDetector
 
-from . import exceptions, geo, values
+from . import cache, checkpoint, columnar, exceptions, geo, log_format, paths, profiling, robots, timestamp, values
 from .utils import file_utils, resource_utils
 
 
-class Stats:
-    def __init__(self):
-        self.__ignored_lines_static_resources = 0
-        self.__ignored_lines_bot = 0
-        self.__ignored_lines_invalid_method = 0
-        self.__ignored_lines_invalid_user_agent = 0
-        self.__ignored_lines_invalid_client_name = 0
-        self.__ignored_lines_invalid_client_version = 0
-        self.__ignored_lines_invalid_country_code = 0
-        self.__ignored_lines_invalid_local_datetime = 0
-        self.__ignored_lines_http_redirects = 0
-        self.__ignored_lines_http_errors = 0
-        self.__total_ignored_lines = 0
-        self.__total_imported_lines = 0
-        self.__lines_parsed = 0
-        self.__total_time = 0.0
-        self.__output = None
-
-
-    @property
-    def ignored_lines_static_resources(self):
-        return self.__ignored_lines_static_resources
+# columns of the .summary files, in their original order
+SUMMARY_MEASURES = (
+    'ignored_lines_static_resources',
+    'ignored_lines_bot',
+    'ignored_lines_invalid_method',
+    'ignored_lines_invalid_user_agent',
+    'ignored_lines_invalid_client_name',
+    'ignored_lines_invalid_client_version',
+    'ignored_lines_invalid_country_code',
+    'ignored_lines_invalid_local_datetime',
+    'ignored_lines_http_redirects',
+    'ignored_lines_http_errors',
+    'total_ignored_lines',
+    'total_imported_lines',
+    'lines_parsed',
+    'total_time',
+)
 
-    @ignored_lines_static_resources.setter
-    def ignored_lines_static_resources(self, value):
-        self.__ignored_lines_static_resources = value
+# counters that are not written to the .summary files
+EXTRA_MEASURES = (
+    'ua_cache_hits',
+    'ua_cache_misses',
+    'ua_cache_evictions',
+    'lines_format_ncsa_extended',
+    'lines_format_ncsa_extended_domain',
+    'lines_format_ncsa_extended_ip_list',
+    'lines_format_ncsa_extended_domain_ip_list',
+)
 
-    @property
-    def ignored_lines_bot(self):
-        return self.__ignored_lines_bot
+STATS_MEASURES = SUMMARY_MEASURES + EXTRA_MEASURES
 
-    @ignored_lines_bot.setter
-    def ignored_lines_bot(self, value):
-        self.__ignored_lines_bot = value
+STATS_INDEX = {m: i for i, m in enumerate(STATS_MEASURES)}
 
-    @property
-    def ignored_lines_invalid_method(self):
-        return self.__ignored_lines_invalid_method
 
-    @ignored_lines_invalid_method.setter
-    def ignored_lines_invalid_method(self, value):
-        self.__ignored_lines_invalid_method = value
+def _measure_property(index):
+    def getter(self):
+        return self._counters[index]
 
-    @property
-    def ignored_lines_invalid_user_agent(self):
-        return self.__ignored_lines_invalid_user_agent
+    def setter(self, value):
+        self._counters[index] = value
 
-    @ignored_lines_invalid_user_agent.setter
-    def ignored_lines_invalid_user_agent(self, value):
-        self.__ignored_lines_invalid_user_agent = value
+    return property(getter, setter)
 
-    @property
-    def ignored_lines_invalid_client_name(self):
-        return self.__ignored_lines_invalid_client_name
-
-    @ignored_lines_invalid_client_name.setter
-    def ignored_lines_invalid_client_name(self, value):
-        self.__ignored_lines_invalid_client_name = value
-
-    @property
-    def ignored_lines_invalid_client_version(self):
-        return self.__ignored_lines_invalid_client_version
-
-    @ignored_lines_invalid_client_version.setter
-    def ignored_lines_invalid_client_version(self, value):
-        self.__ignored_lines_invalid_client_version = value
-
-    @property
-    def ignored_lines_invalid_country_code(self):
-        return self.__ignored_lines_invalid_country_code
-
-    @ignored_lines_invalid_country_code.setter
-    def ignored_lines_invalid_country_code(self, value):
-        self.__ignored_lines_invalid_country_code = value
-
-    @property
-    def ignored_lines_invalid_local_datetime(self):
-        return self.__ignored_lines_invalid_local_datetime
 
-    @ignored_lines_invalid_local_datetime.setter
-    def ignored_lines_invalid_local_datetime(self, value):
-        self.__ignored_lines_invalid_local_datetime = value
-
-    @property
-    def ignored_lines_http_redirects(self):
-        return self.__ignored_lines_http_redirects
-
-    @ignored_lines_http_redirects.setter
-    def ignored_lines_http_redirects(self, value):
-        self.__ignored_lines_http_redirects = value
-
-    @property
-    def ignored_lines_http_errors(self):
-        return self.__ignored_lines_http_errors
-
-    @ignored_lines_http_errors.setter
-    def ignored_lines_http_errors(self, value):
-        self.__ignored_lines_http_errors = value
-
-    @property
-    def total_ignored_lines(self):
-        return self.__total_ignored_lines
-
-    @total_ignored_lines.setter
-    def total_ignored_lines(self, value):
-        self.__total_ignored_lines = value
-
-    @property
-    def total_imported_lines(self):
-        return self.__total_imported_lines
-
-    @total_imported_lines.setter
-    def total_imported_lines(self, value):
-        self.__total_imported_lines = value
-
-    @property
-    def lines_parsed(self):
-        return self.__lines_parsed
+class Stats:
+    """
+    Counters of a parsing, kept in a list indexed by STATS_INDEX.
+    Each measure is also available as an attribute, e.g. stats.lines_parsed.
+    get_stats and save cover the SUMMARY_MEASURES only; get_extra_stats returns the other counters.
+    """
+    __slots__ = ('_counters', '__output')
 
-    @lines_parsed.setter
-    def lines_parsed(self, value):
-        self.__lines_parsed = value
+    def __init__(self):
+        self._counters = [0] * len(STATS_MEASURES)
+        self._counters[STATS_INDEX['total_time']] = 0.0
+        self.__output = None
 
     @property
-    def total_time(self):
-        return self.__total_time
-
-    @total_time.setter
-    def total_time(self, value):
-        self.__total_time = value
+    def counters(self):
+        return self._counters
 
     @property
     def output(self):
@@ -152,54 +81,45 @@ class Stats:
             self.__output = open(path, 'w')
         except Exception as e:
             logging.error(f"Failed to open file: {e}")
-            logging.info(self.dump_to_str())
+            self.dump_to_str()
 
     def increment(self, measure):
-        current_value = getattr(self, measure)
-        new_value = current_value + 1
-        setattr(self, measure, new_value)
+        self._counters[STATS_INDEX[measure]] += 1
+
+    def merge(self, other):
+        """
+        Add the counters of another Stats object to this one.
+        The total_time measure is not merged, since it is wall-clock time.
+        """
+        total_time = self._counters[STATS_INDEX['total_time']]
+        self._counters = [a + b for a, b in zip(self._counters, other.counters)]
+        self._counters[STATS_INDEX['total_time']] = total_time
+
+    def to_dict(self):
+        return dict(zip(STATS_MEASURES, self._counters))
+
+    def update(self, stats_dict):
+        """
+        Set the measures from a dict, as returned by to_dict. Unknown measures are ignored.
+        """
+        for k, v in stats_dict.items():
+            if k in STATS_INDEX:
+                self._counters[STATS_INDEX[k]] = v
 
     def get_stats(self):
-        keys = [
-            'ignored_lines_static_resources',
-            'ignored_lines_bot',
-            'ignored_lines_invalid_method',
-            'ignored_lines_invalid_user_agent',
-            'ignored_lines_invalid_client_name',
-            'ignored_lines_invalid_client_version',
-            'ignored_lines_invalid_country_code',
-            'ignored_lines_invalid_local_datetime',
-            'ignored_lines_http_redirects',
-            'ignored_lines_http_errors',
-            'total_ignored_lines',
-            'total_imported_lines',
-            'lines_parsed',
-            'total_time',
-        ]
-
-        values = [
-            self.ignored_lines_static_resources,
-            self.ignored_lines_bot,
-            self.ignored_lines_invalid_method,
-            self.ignored_lines_invalid_user_agent,
-            self.ignored_lines_invalid_client_name,
-            self.ignored_lines_invalid_client_version,
-            self.ignored_lines_invalid_country_code,
-            self.ignored_lines_invalid_local_datetime,
-            self.ignored_lines_http_redirects,
-            self.ignored_lines_http_errors,
-            self.total_ignored_lines,
-            self.total_imported_lines,
-            self.lines_parsed,
-            self.total_time,
-        ]
-
-        return [keys, values]
+        return [list(SUMMARY_MEASURES), self._counters[:len(SUMMARY_MEASURES)]]
+
+    def get_extra_stats(self):
+        return [list(EXTRA_MEASURES), self._counters[len(SUMMARY_MEASURES):]]
 
     def dump_to_str(self, sep='\t'):
-        stats_kv = self.get_stats()
-        for i in stats_kv:
-            logging(sep.join(i))
+        """
+        Log the summary measures, one measure and its value per line, and return them as a string.
+        """
+        rows = [sep.join(str(v) for v in row) for row in zip(*self.get_stats())]
+        for row in rows:
+            logging.info(row)
+        return '\n'.join(rows)
 
     def save(self, sep='\t'):
         if self.output is None:
@@ -207,6 +127,7 @@ class Stats:
             return
 
         stats_kv = self.get_stats()
+        logging.info('Stats not in the summary: ' + ', '.join(f'{k}={v}' for k, v in zip(*self.get_extra_stats())))
 
         try:
             for i in stats_kv:
@@ -218,128 +139,251 @@ class Stats:
                 self.output.close()
 
 
-class Hit:
-    def __init__(self):
-        self.__is_valid = True
-
-    @property
-    def is_valid(self):
-        return self.__is_valid
+for _index, _measure in enumerate(STATS_MEASURES):
+    setattr(Stats, _measure, _measure_property(_index))
 
-    @is_valid.setter
-    def is_valid(self, value):
-        self.__is_valid = value
 
-    @property
-    def method(self):
-        return self.__method
+class Hit:
+    __slots__ = (
+        'is_valid',
+        'method',
+        'status',
+        'user_agent',
+        'client_name',
+        'client_version',
+        'ip',
+        'geolocation',
+        'country_code',
+        'local_datetime',
+        'action',
+    )
 
-    @method.setter
-    def method(self, value):
-        self.__method = value
+    def __init__(self):
+        self.is_valid = True
 
-    @property
-    def status(self):
-        return self.__status
 
-    @status.setter
-    def status(self, value):
-        self.__status = value
+class LogParser:
+    def __init__(
+        self,
+        mmdb_path=None,
+        robots_path=None,
+        mmdb_data=None,
+        robots_list=None,
+        ua_cache_size=values.UA_CACHE_SIZE,
+        ua_cache_max_bytes=values.UA_CACHE_MAX_BYTES,
+        ua_cache_eviction=cache.EVICTION_LRU,
+        ua_cache_path=None,
+        geoip_cache_size=values.GEOIP_CACHE_SIZE,
+        geoip_prefix_cache=False,
+        readahead_buffer_size=values.READAHEAD_BUFFER_SIZE,
+        readahead_queue_size=values.READAHEAD_QUEUE_SIZE,
+        evaluation_mode=values.EVALUATION_MODE_FULL,
+    ):
+        self.__mmdb_path = resource_utils.load_mmdb(
+            mmdb_data=mmdb_data,
+            mmdb_path=mmdb_path,
+        )
+        self.__geoip = geo.GeoIp(cache_size=geoip_cache_size, prefix_cache=geoip_prefix_cache)
+        self.__geoip.map = self.__mmdb_path
+        self.__robots = robots.RobotsMatcher(resource_utils.load_robots(
+            robots_list=robots_list, 
+            robots_path=robots_path,
+        ))
+        self.__stats = Stats()
+        self.__logfile = None
+        self.__output = None
+        self.__output_format = values.OUTPUT_FORMAT_TSV
+        self.evaluation_mode = evaluation_mode
+        self.__line_matcher = log_format.LogFormatMatcher()
+        self.__timestamp_converter = timestamp.TimestampConverter()
+        self.__path_classifier = paths.PathClassifier()
+        self.__checkpoint_path = None
+        self.__checkpoint_interval = 0
+        self.__keep_completed_checkpoint = False
+        self.__resumed_from = None
+        self.__readahead_buffer_size = readahead_buffer_size
+        self.__readahead_queue_size = readahead_queue_size
+        self.__profiler = None
+        self.__profile_path = None
+
+        self.__ua_cache = cache.LRUCache(
+            max_size=ua_cache_size,
+            max_bytes=ua_cache_max_bytes,
+            eviction=ua_cache_eviction,
+        )
+        self.__ua_cache_path = ua_cache_path
+        self.__ua_cache_counters = (0, 0, 0)
+        if ua_cache_path:
+            self.__ua_cache.load(ua_cache_path, self.ua_cache_fingerprint())
+            self.__ua_cache_counters = self.__ua_cache.counters()
 
     @property
-    def user_agent(self):
-        return self.__user_agent
+    def output(self):
+        return self.__output
 
-    @user_agent.setter
-    def user_agent(self, value):
-        self.__user_agent = value
+    @output.setter
+    def output(self, path):
+        if self.output_format == values.OUTPUT_FORMAT_COLUMNAR:
+            self.__output = columnar.ColumnarWriter(path)
+        else:
+            self.__output = open(path, 'w')
 
     @property
-    def client_name(self):
-        return self.__client_name
+    def output_format(self):
+        return self.__output_format
 
-    @client_name.setter
-    def client_name(self, value):
-        self.__client_name = value
+    @output_format.setter
+    def output_format(self, value):
+        if value not in values.OUTPUT_FORMATS:
+            raise ValueError(f'Invalid output format: {value}')
+        self.__output_format = value
 
     @property
-    def client_version(self):
-        return self.__client_version
+    def evaluation_mode(self):
+        return self.__evaluation_mode
 
-    @client_version.setter
-    def client_version(self, value):
-        self.__client_version = value
+    @evaluation_mode.setter
+    def evaluation_mode(self, value):
+        if value not in values.EVALUATION_MODES:
+            raise ValueError(f'Invalid evaluation mode: {value}')
+        self.__evaluation_mode = value
 
     @property
-    def ip(self):
-        return self.__ip
+    def logfile(self):
+        return self.__logfile
 
-    @ip.setter
-    def ip(self, value):
-        self.__ip = value
+    @logfile.setter
+    def logfile(self, file_path):
+        self.__logfile = file_utils.open_logfile(
+            file_path,
+            readahead_buffer_size=self.__readahead_buffer_size,
+            readahead_queue_size=self.__readahead_queue_size,
+        )
+        self.__logfile_path = file_path
+        self.__line_matcher.reset()
+        self.__resumed_from = None
 
     @property
-    def geolocation(self):
-        return self.__geolocation
-
-    @geolocation.setter
-    def geolocation(self, value):
-        self.__geolocation = value
+    def logfile_path(self):
+        return self.__logfile_path
 
     @property
-    def country_code(self):
-        return self.__country_code
-    
-    @country_code.setter
-    def country_code(self, value):
-        self.__country_code = value
+    def line_matcher(self):
+        return self.__line_matcher
 
     @property
-    def local_datetime(self):
-        return self.__local_datetime
-
-    @local_datetime.setter
-    def local_datetime(self, value):
-        self.__local_datetime = value
+    def checkpoint_path(self):
+        return self.__checkpoint_path
 
     @property
-    def action(self):
-        return self.__action
-
-    @action.setter
-    def action(self, value):
-        self.__action = value
+    def checkpoint_interval(self):
+        return self.__checkpoint_interval
 
-
-class LogParser:
-    def __init__(self, mmdb_path=None, robots_path=None, mmdb_data=None, robots_list=None):
-        self.__geoip = geo.GeoIp()
-        self.__geoip.map = resource_utils.load_mmdb(
-            mmdb_data=mmdb_data,
-            mmdb_path=mmdb_path,
-        )
-        self.__robots = resource_utils.load_robots(
-            robots_list=robots_list, 
-            robots_path=robots_path,
-        )
-        self.__stats = Stats()
-        self.__output = None
+    @property
+    def resumed_from(self):
+        return self.__resumed_from
 
     @property
-    def output(self):
-        return self.__output
+    def profiler(self):
+        return self.__profiler
+
+    def enable_profiling(self, profile_path, slowest_lines=values.PROFILE_SLOWEST_LINES):
+        """
+        Record the time and calls of each stage of parse_line and the slowest lines, saved to profile_path by finish.
+        The stage methods are wrapped on this instance only, so parsers that are not profiled are not slowed down.
+        Calling it again resets the profiler and changes the profile path.
+        """
+        self.__profile_path = profile_path
+
+        if self.__profiler is not None:
+            self.__profiler.slowest_lines = slowest_lines
+            self.__profiler.reset()
+            return
 
-    @output.setter
-    def output(self, path):
-        self.__output = open(path, 'w')
+        p = self.__profiler = profiling.StageProfiler(slowest_lines)
+        self.line_matcher.match = p.wrap_stage(self.line_matcher.match, 'regex')
+        self.classify_user_agent = p.wrap_stage(self.classify_user_agent, 'ua_cache')
+        self._classify_user_agent = p.wrap_stage(self._classify_user_agent, 'ua_detection')
+        self.user_agent_is_bot = p.wrap_stage(self.user_agent_is_bot, 'robots')
+        self.has_valid_path = p.wrap_stage(self.has_valid_path, 'path')
+        self.geoip.ip_to_country_code = p.wrap_stage(self.geoip.ip_to_country_code, 'geoip')
+        self.format_date = p.wrap_stage(self.format_date, 'date')
+        self.parse_line = p.wrap_line(self.parse_line)
+
+    def enable_checkpoints(self, checkpoint_path, interval=values.RESUMABLE_CHECKPOINT_INTERVAL, keep_completed=False):
+        """
+        Save a checkpoint every interval lines while parsing, so that an interrupted parsing can be resumed.
+        Checkpoints are only supported for the tsv output format. The completed checkpoint kept with keep_completed
+        is supported for every output format, even when interval is zero.
+
+        Parameters:
+        -----------
+            checkpoint_path (str): Path of the checkpoint file.
+            interval (int): Number of lines read between checkpoints. Zero disables checkpoints.
+            keep_completed (bool): Whether finish replaces the checkpoint with a completed one instead of removing it.
+        """
+        if interval and self.output_format != values.OUTPUT_FORMAT_TSV:
+            raise ValueError(f'Checkpoints are not supported for the output format {self.output_format}')
+
+        self.__checkpoint_path = checkpoint_path
+        self.__checkpoint_interval = interval
+        self.__keep_completed_checkpoint = keep_completed
+
+    def save_checkpoint(self, completed=False):
+        """
+        Record the log file position, the stats and the output position.
+        Should only be called when all the rows of the lines read so far were written to the output.
+        A completed checkpoint is saved by finish, after the output was closed, for any output format
+        and number of processes; it marks the log file as parsed and is never resumed, so it records no log file position.
+        """
+        if completed:
+            output_path = self.output.path if isinstance(self.output, columnar.ColumnarWriter) else self.output.name
+            output_position = os.path.getsize(output_path)
+            offset = 0
+        else:
+            self.output.flush()
+            os.fsync(self.output.fileno())
+            output_path = self.output.name
+            output_position = self.output.tell()
+            offset = self.logfile.tell()
+            self.collect_ua_cache_stats()
+
+        elapsed = time.time() - self.start
+        if self.resumed_from:
+            elapsed += self.resumed_from.elapsed
+
+        checkpoint.Checkpoint(
+            logfile_path=self.logfile_path,
+            output_path=output_path,
+            offset=offset,
+            output_position=output_position,
+            stats=self.stats.to_dict(),
+            elapsed=elapsed,
+            matcher_state=self.line_matcher.get_state(),
+            completed=completed,
+        ).save(self.checkpoint_path)
+
+    def resume(self, cp):
+        """
+        Continue a parsing from a checkpoint. The log file must be already set.
+        The output file is truncated at the checkpoint position and reopened for appending,
+        so that the final output is identical to the one of an uninterrupted parsing.
+        """
+        if self.output_format != values.OUTPUT_FORMAT_TSV:
+            raise ValueError(f'Checkpoints are not supported for the output format {self.output_format}')
+
+        self.logfile.seek(cp.offset)
+
+        os.truncate(cp.output_path, cp.output_position)
+        self.__output = open(cp.output_path, 'a')
+
+        self.stats.update(cp.stats)
+        self.line_matcher.set_state(cp.matcher_state)
+        self.__resumed_from = cp
 
     @property
-    def logfile(self):
-        return self.__logfile
-
-    @logfile.setter
-    def logfile(self, file_path):
-        self.__logfile = file_utils.open_logfile(file_path)
+    def mmdb_path(self):
+        return self.__mmdb_path
 
     @property
     def geoip(self):
@@ -351,18 +395,26 @@ class LogParser:
 
     @robots.setter
     def robots(self, robots_list, robots_path):
-        self.__robots = resource_utils.load_robots(
+        self.__robots = robots.RobotsMatcher(resource_utils.load_robots(
             robots_list=robots_list,
             robots_path=robots_path,
-        )
+        ))
 
     @property
     def stats(self):
         return self.__stats
 
+    @property
+    def ua_cache(self):
+        return self.__ua_cache
+
+    @property
+    def ua_cache_path(self):
+        return self.__ua_cache_path
+
     @stats.setter
-    def stats(self):
-        self.__stats = Stats()
+    def stats(self, value):
+        self.__stats = value
 
     def has_valid_method(self, method):
         if method.upper() in ('GET', 'HEAD'):
@@ -386,54 +438,27 @@ class LogParser:
         return False
 
     def user_agent_is_bot(self, user_agent):
-        for regex in self.robots:
-            if regex.search(user_agent):
-                return True
-        return False
+        return self.robots.is_bot(user_agent)
+
+    def user_agent_robot_pattern(self, user_agent):
+        return self.robots.match(user_agent)
 
     def has_valid_path(self, path):
-        if not self.action_is_static_file(path):
+        if not self.__path_classifier.flags(path) & paths.FLAG_STATIC:
             return True
         return False
 
     def action_is_static_file(self, path):
-        try:
-            file_from_url = urllib.parse.urlparse(path).path
-        except ValueError:
-            file_from_url = path.split('/')[-1]
-
-        ext = file_from_url.rsplit('.')[-1].lower()
-
-        if ext in values.EXTENSIONS_STATIC or file_from_url in values.EXTENSIONS_STATIC:
-            return True
-
-        return False
+        return self.__path_classifier.is_static_file(path)
 
     def action_is_download(self, path):
-        file_from_url = path.split('/')[-1]
-        ext = file_from_url.rsplit('.')[-1].lower()
-
-        if ext in values.EXTENSIONS_DOWNLOAD:
-            return True
-        return False
+        return self.__path_classifier.is_download(path)
 
     def timedelta_from_timezone(self, timezone):
-        timezone = int(timezone)
-        sign = 1 if timezone >= 0 else -1
-        n = abs(timezone)
-
-        hours = n / 100 * sign
-        minutes = n % 100 * sign
-
-        return datetime.timedelta(hours=hours, minutes=minutes)
+        return timestamp.timedelta_from_timezone(timezone)
 
     def format_date(self, date, timezone):
-        try:
-            date = datetime.datetime.strptime(date, '%d/%b/%Y:%H:%M:%S')
-            date -= self.timedelta_from_timezone(timezone)
-            return date.strftime('%Y-%m-%d %H:%M:%S')
-        except:
-            return
+        return self.__timestamp_converter.convert(date, timezone)
 
     def format_user_agent(self, user_agent):
         fmt_ua = user_agent
@@ -449,161 +474,278 @@ class LogParser:
     def format_client_version(self, device):
         return device.client_version() or device.UNKNOWN
 
-    def match_with_best_pattern(self, line):
-        patterns = [
-            values.PATTERN_NCSA_EXTENDED_LOG_FORMAT,
-            values.PATTERN_NCSA_EXTENDED_LOG_FORMAT_DOMAIN,
-            values.PATTERN_NCSA_EXTENDED_LOG_FORMAT_WITH_IP_LIST,
-            values.PATTERN_NCSA_EXTENDED_LOG_FORMAT_DOMAIN_WITH_IP_LIST,
-        ]
-
-        match = None
-        ip_type = 'unknown'
-        ip_value = ''
-
-        for pattern in patterns:
-            match = re.match(pattern, line)
-
-            if match:
-                content = match.groupdict()
-                
-                ip_value = content.get('ip')
-                ip_type = self.get_ip_type(ip_value)
-
-                if ip_type != 'unknown':
-                    return match, ip_value
-
-                else:
-                    for i in content.get('ip_list', '').split(','):
-                        ip_type = self.get_ip_type(i.strip())
-                        if ip_type != 'unknown':
-                            return match, i.strip()
-        
-        return match, ip_value
+    def ua_cache_fingerprint(self):
+        """
+        Identify the device detector version and the robots patterns used to classify user agents.
+        A persisted user agent cache is only reused when its fingerprint matches.
+        """
+        patterns = '\n'.join(sorted(r.pattern for r in self.robots))
+        content = f'{device_detector.__version__}\n{patterns}'
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def _classify_user_agent(self, user_agent):
+        parse_error = False
+        try:
+            device = DeviceDetector(user_agent).parse()
+        except ZeroDivisionError:
+            device = DeviceDetector('').parse()
+            parse_error = True
+            logging.error(exceptions.DeviceDetectionError(f'Não foi possível identificar UserAgent {user_agent}'))
+
+        return (
+            self.format_client_name(device),
+            self.format_client_version(device),
+            self.user_agent_is_bot(user_agent),
+            parse_error,
+        )
 
+    def classify_user_agent(self, user_agent):
+        """
+        Classify a user agent, using the user agent cache.
 
-    def get_ip_type(self, ip):
-        try:
-            ipa = ipaddress.ip_address(ip)
-        except ValueError:
-            return 'unknown'
+        Returns:
+        --------
+            tuple: (client_name, client_version, is_bot, parse_error)
+        """
+        return self.ua_cache.get_or_compute(user_agent, self._classify_user_agent)
+
+    def collect_ua_cache_stats(self):
+        """
+        Add to the stats the user agent cache hits, misses and evictions since the last collection.
+        """
+        counters = self.ua_cache.counters()
+        hits, misses, evictions = [c - p for c, p in zip(counters, self.__ua_cache_counters)]
+        self.__ua_cache_counters = counters
 
-        if ipa.is_global:
-            return 'remote'
-        elif ipa.is_private or ipa.is_loopback or ipa.is_link_local:
-            return 'local'
+        self.stats.ua_cache_hits += hits
+        self.stats.ua_cache_misses += misses
+        self.stats.ua_cache_evictions += evictions
 
-        return 'unknown'
+    def save_ua_cache(self):
+        if self.ua_cache_path:
+            self.ua_cache.save(self.ua_cache_path, self.ua_cache_fingerprint())
+
+    def match_with_best_pattern(self, line):
+        match, ip_value, _ = self.line_matcher.match(line)
+        return match, ip_value
+
+    def get_ip_type(self, ip):
+        return log_format.get_ip_type(ip)
 
     def parse_line(self, line):
         self.stats.increment('lines_parsed')
 
-        parsed_data = []
         try:
             decoded_line = line.decode().strip() if isinstance(line, bytes) else line.strip()
         except UnicodeDecodeError:
             decoded_line = line.decode('utf-8', errors='ignore').strip() if isinstance(line, bytes) else line.strip()
 
-        match, ip_value = self.match_with_best_pattern(decoded_line)
-
-        if match:
-            hit = Hit()
-
-            data = match.groupdict()
-
-            hit.method = data.get('method')
-            if not self.has_valid_method(hit.method):
-                self.stats.increment('ignored_lines_invalid_method')
-                hit.is_valid = False
-
-            hit.status = data.get('status')
-            if not self.has_valid_status(hit.status):
-                if self.status_is_redirect(hit.status):
-                    self.stats.increment('ignored_lines_http_redirects')
-                elif self.status_is_error(hit.status):
-                    self.stats.increment('ignored_lines_http_errors')
-                hit.is_valid = False
-
-            hit.user_agent = self.format_user_agent(data.get('user_agent'))
-
-            if self.user_agent_is_bot(hit.user_agent):
-                self.stats.increment('ignored_lines_bot')
-                hit.is_valid = False
-
-            try:
-                device = DeviceDetector(hit.user_agent).parse()
-            except ZeroDivisionError:
-                device = DeviceDetector('').parse()
-                self.stats.increment('ignored_lines_invalid_user_agent')
-                logging.error(exceptions.DeviceDetectionError(f'Não foi possível identificar UserAgent {hit.user_agent} from line {decoded_line}'))
-                hit.is_valid = False
-
-            hit.client_name = self.format_client_name(device)
-            if not hit.client_name:
-                self.stats.increment('ignored_lines_invalid_client_name')
-                hit.is_valid = False
-
-            hit.client_version = self.format_client_version(device)
-            if not hit.client_version:
-                self.stats.increment('ignored_lines_invalid_client_version')
-                hit.is_valid = False
-
-            hit.action = data.get('path')
-            if not self.has_valid_path(hit.action):
-                self.stats.increment('ignored_lines_static_resources')
-                hit.is_valid = False
-
-            hit.ip = ip_value
-            hit.country_code = self.geoip.ip_to_country_code(hit.ip)
-            if not hit.country_code:
-                self.stats.increment('ignored_lines_invalid_country_code')
-                hit.is_valid = False
-
-            date = data.get('date')
-            timezone = data.get('timezone')
-            hit.local_datetime = self.format_date(date, timezone)
-            if not hit.local_datetime:
-                self.stats.increment('ignored_lines_invalid_local_datetime')
-                hit.is_valid = False
-
-            if hit.is_valid:
-                self.stats.increment('total_imported_lines')
-
-                parsed_data.append(hit.local_datetime)
-                parsed_data.append(hit.client_name)
-                parsed_data.append(hit.client_version)
-                parsed_data.append(hit.ip)
-                parsed_data.append(hit.country_code)
-                parsed_data.append(hit.action)
-            else:
-                self.stats.increment('total_ignored_lines')
+        match, ip_value, format_name = self.line_matcher.match(decoded_line)
+
+        if format_name:
+            self.stats.increment('lines_format_' + format_name)
+
+        if not match:
+            self.stats.increment('total_ignored_lines')
+            return []
+
+        if self.evaluation_mode == values.EVALUATION_MODE_SHORT_CIRCUIT:
+            return self._evaluate_short_circuit(match.groupdict(), ip_value)
+        return self._evaluate_full(match.groupdict(), ip_value)
+
+    def _evaluate_full(self, data, ip_value):
+        """
+        Run every check on a matched line and count every reason for ignoring it.
+        """
+        parsed_data = []
+        hit = Hit()
+
+        hit.method = data.get('method')
+        if not self.has_valid_method(hit.method):
+            self.stats.increment('ignored_lines_invalid_method')
+            hit.is_valid = False
+
+        hit.status = data.get('status')
+        if not self.has_valid_status(hit.status):
+            if self.status_is_redirect(hit.status):
+                self.stats.increment('ignored_lines_http_redirects')
+            elif self.status_is_error(hit.status):
+                self.stats.increment('ignored_lines_http_errors')
+            hit.is_valid = False
+
+        hit.user_agent = self.format_user_agent(data.get('user_agent'))
+        client_name, client_version, is_bot, parse_error = self.classify_user_agent(hit.user_agent)
+
+        if is_bot:
+            self.stats.increment('ignored_lines_bot')
+            hit.is_valid = False
+
+        if parse_error:
+            self.stats.increment('ignored_lines_invalid_user_agent')
+            hit.is_valid = False
+
+        hit.client_name = client_name
+        if not hit.client_name:
+            self.stats.increment('ignored_lines_invalid_client_name')
+            hit.is_valid = False
+
+        hit.client_version = client_version
+        if not hit.client_version:
+            self.stats.increment('ignored_lines_invalid_client_version')
+            hit.is_valid = False
+
+        hit.action = data.get('path')
+        if not self.has_valid_path(hit.action):
+            self.stats.increment('ignored_lines_static_resources')
+            hit.is_valid = False
+
+        hit.ip = ip_value
+        hit.country_code = self.geoip.ip_to_country_code(hit.ip)
+        if not hit.country_code:
+            self.stats.increment('ignored_lines_invalid_country_code')
+            hit.is_valid = False
+
+        date = data.get('date')
+        timezone = data.get('timezone')
+        hit.local_datetime = self.format_date(date, timezone)
+        if not hit.local_datetime:
+            self.stats.increment('ignored_lines_invalid_local_datetime')
+            hit.is_valid = False
+
+        if hit.is_valid:
+            self.stats.increment('total_imported_lines')
+
+            parsed_data.append(hit.local_datetime)
+            parsed_data.append(hit.client_name)
+            parsed_data.append(hit.client_version)
+            parsed_data.append(hit.ip)
+            parsed_data.append(hit.country_code)
+            parsed_data.append(hit.action)
         else:
             self.stats.increment('total_ignored_lines')
 
         return parsed_data
 
+    def _reject(self, measure=None):
+        if measure:
+            self.stats.increment(measure)
+        self.stats.increment('total_ignored_lines')
+        return []
+
+    def _evaluate_short_circuit(self, data, ip_value):
+        """
+        Run the checks on a matched line from the cheapest to the most expensive and stop at the first failed one.
+        Only that reason, the primary one, is counted.
+        """
+        method = data.get('method')
+        if not self.has_valid_method(method):
+            return self._reject('ignored_lines_invalid_method')
+
+        status = data.get('status')
+        if not self.has_valid_status(status):
+            if self.status_is_redirect(status):
+                return self._reject('ignored_lines_http_redirects')
+            elif self.status_is_error(status):
+                return self._reject('ignored_lines_http_errors')
+            return self._reject()
+
+        action = data.get('path')
+        if not self.has_valid_path(action):
+            return self._reject('ignored_lines_static_resources')
+
+        client_name, client_version, is_bot, parse_error = self.classify_user_agent(self.format_user_agent(data.get('user_agent')))
+        if is_bot:
+            return self._reject('ignored_lines_bot')
+        if parse_error:
+            return self._reject('ignored_lines_invalid_user_agent')
+        if not client_name:
+            return self._reject('ignored_lines_invalid_client_name')
+        if not client_version:
+            return self._reject('ignored_lines_invalid_client_version')
+
+        country_code = self.geoip.ip_to_country_code(ip_value)
+        if not country_code:
+            return self._reject('ignored_lines_invalid_country_code')
+
+        local_datetime = self.format_date(data.get('date'), data.get('timezone'))
+        if not local_datetime:
+            return self._reject('ignored_lines_invalid_local_datetime')
+
+        self.stats.increment('total_imported_lines')
+        return [local_datetime, client_name, client_version, ip_value, country_code, action]
+
     def parse(self):
         self.start = time.time()
+
+        if self.checkpoint_path and self.checkpoint_interval:
+            yield from self._parse_with_checkpoints()
+            return
+
         for line in self.logfile:
             res = self.parse_line(line)
             if res:
                 yield res
 
+    def _parse_with_checkpoints(self):
+        # readline keeps tell usable, which is not the case when iterating over a text file;
+        # a checkpoint is saved before reading a line, when the consumer has already written the previous rows.
+        # The first one is saved right away, so that an interrupted parsing always resumes with the same output file
+        lines_read = self.checkpoint_interval
+        while True:
+            if lines_read == self.checkpoint_interval:
+                self.save_checkpoint()
+                lines_read = 0
+
+            line = self.logfile.readline()
+            if not line:
+                break
+            lines_read += 1
+
+            res = self.parse_line(line)
+            if res:
+                yield res
+
     def save(self, data, sep='\t'):
-        self.output.write(sep.join([
-            'server_date',
-            'browser_name',
-            'browser_version',
-            'user_ip',
-            'country_code',
-            'action_name']) + '\n')
-
-        [self.output.write(sep.join([str(di) for di in d]) + '\n') for d in data if d]
+        if self.output_format == values.OUTPUT_FORMAT_COLUMNAR:
+            self.output.write_rows(data)
+        else:
+            if not self.resumed_from:
+                self.output.write(sep.join(values.PARSED_FILE_HEADER) + '\n')
+            [self.output.write(sep.join([str(di) for di in d]) + '\n') for d in data if d]
         self.output.close()
-        self.logfile.close()
 
+        self.finish()
+
+    def close(self):
+        """
+        Close the log file, the output and the stats output, e.g. when parsing was interrupted by an error.
+        """
+        for f in (self.logfile, self.output, self.stats.output):
+            if f is not None:
+                f.close()
+
+    def finish(self, save_stats=True):
+        """
+        Close the log file and record the total time, the user agent cache stats and the persisted user agent cache.
+        Should be called after the lines yielded by parse were consumed.
+        """
         self.end = time.time()
         self.total_time = self.end - self.start
+        if self.resumed_from:
+            self.total_time += self.resumed_from.elapsed
 
         self.stats.total_time = self.total_time
-        self.stats.save()
+        self.collect_ua_cache_stats()
+        if save_stats:
+            self.stats.save()
+        self.save_ua_cache()
+
+        if self.profiler is not None and self.__profile_path:
+            self.profiler.save(self.__profile_path)
+
+        if self.checkpoint_path and self.__keep_completed_checkpoint:
+            self.save_checkpoint(completed=True)
+        elif self.checkpoint_path:
+            checkpoint.remove_checkpoint(self.checkpoint_path)
+
+        self.logfile.close()
@@ -0,0 +1,144 @@
+import collections
+import functools
+import ipaddress
+import re
+
+from . import values
+
+
+LOG_FORMATS = [
+    ('ncsa_extended', values.PATTERN_NCSA_EXTENDED_LOG_FORMAT),
+    ('ncsa_extended_domain', values.PATTERN_NCSA_EXTENDED_LOG_FORMAT_DOMAIN),
+    ('ncsa_extended_ip_list', values.PATTERN_NCSA_EXTENDED_LOG_FORMAT_WITH_IP_LIST),
+    ('ncsa_extended_domain_ip_list', values.PATTERN_NCSA_EXTENDED_LOG_FORMAT_DOMAIN_WITH_IP_LIST),
+]
+
+LOG_FORMAT_NAMES = [name for name, _ in LOG_FORMATS]
+
+COMPILED_LOG_FORMATS = [(name, re.compile(pattern)) for name, pattern in LOG_FORMATS]
+
+
+@functools.lru_cache(maxsize=65536)
+def get_ip_type(ip):
+    try:
+        ipa = ipaddress.ip_address(ip)
+    except ValueError:
+        return 'unknown'
+
+    if ipa.is_global:
+        return 'remote'
+    elif ipa.is_private or ipa.is_loopback or ipa.is_link_local:
+        return 'local'
+
+    return 'unknown'
+
+
+def _resolve_ip(content):
+    """
+    Return the first known IP address of a matched line, or None.
+    """
+    ip_value = content.get('ip')
+    if get_ip_type(ip_value) != 'unknown':
+        return ip_value
+
+    for i in (content.get('ip_list') or '').split(','):
+        i = i.strip()
+        if get_ip_type(i) != 'unknown':
+            return i
+
+    return None
+
+
+class LogFormatMatcher:
+    """
+    Match log lines against the known log formats.
+
+    The first lines of a file go through the full cascade of formats, in the
+    order of LOG_FORMATS. After sniff_lines matched lines, the matcher commits
+    to the format that matched most of them and tries it first; lines it does
+    not accept go through the full cascade again.
+
+    Parameters:
+    -----------
+        sniff_lines (int): Number of matched lines used to detect the file format.
+    """
+    def __init__(self, sniff_lines=values.LOG_FORMAT_SNIFF_LINES):
+        self.sniff_lines = sniff_lines
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the detected format. Should be called when a new file is read.
+        """
+        self.__format = None
+        self.__sniffed = collections.Counter()
+
+    @property
+    def format_name(self):
+        if self.__format is not None:
+            return LOG_FORMAT_NAMES[self.__format]
+
+    def get_state(self):
+        """
+        Return the detected format and the sniffed lines per format, so that matching can be resumed later.
+        """
+        return {
+            'format': self.format_name,
+            'sniffed': {LOG_FORMAT_NAMES[i]: c for i, c in self.__sniffed.items()},
+        }
+
+    def set_state(self, state):
+        self.reset()
+        if state.get('format') is not None:
+            self.__format = LOG_FORMAT_NAMES.index(state['format'])
+        for name, count in state.get('sniffed', {}).items():
+            self.__sniffed[LOG_FORMAT_NAMES.index(name)] = count
+
+    def _cascade(self, line):
+        match = None
+        ip_value = ''
+
+        for index, (_, pattern) in enumerate(COMPILED_LOG_FORMATS):
+            match = pattern.match(line)
+
+            if match:
+                content = match.groupdict()
+                ip_value = content.get('ip')
+
+                ip = _resolve_ip(content)
+                if ip is not None:
+                    return match, ip, index
+
+        return match, ip_value, None
+
+    def _sniff(self, index):
+        self.__sniffed[index] += 1
+
+        if sum(self.__sniffed.values()) >= self.sniff_lines:
+            self.__format = self.__sniffed.most_common(1)[0][0]
+
+    def match(self, line):
+        """
+        Match a log line.
+
+        Returns:
+        --------
+            tuple: (match, ip_value, format_name). The format_name is None when no format accepted the line.
+        """
+        if self.__format is not None:
+            match = COMPILED_LOG_FORMATS[self.__format][1].match(line)
+
+            if match:
+                ip = _resolve_ip(match.groupdict())
+                if ip is not None:
+                    return match, ip, LOG_FORMAT_NAMES[self.__format]
+
+        match, ip_value, index = self._cascade(line)
+
+        if index is None:
+            return match, ip_value, None
+
+        if self.__format is None:
+            self._sniff(index)
+
+        return match, ip_value, LOG_FORMAT_NAMES[index]
@@ -0,0 +1,314 @@
+import collections
+import heapq
+import os
+import pickle
+import re
+import tempfile
+
+from . import pretable, sessions, values
+
+
+ARTICLE_DETAILED = 'metric_article_detailed'
+ARTICLE_DAILY = 'metric_article_daily'
+ARTICLE_DAILY_GEO = 'metric_article_daily_geolocation'
+ARTICLE_DAILY_GEO_FOR = 'metric_article_daily_geolocation_format'
+ARTICLE_DAILY_GEO_LAN = 'metric_article_daily_geolocation_language'
+JOURNAL_DETAILED = 'metric_journal_detailed'
+JOURNAL_DAILY = 'metric_journal_daily'
+JOURNAL_DAILY_YOP = 'metric_journal_daily_yop'
+JOURNAL_DAILY_GEO = 'metric_journal_daily_geolocation'
+JOURNAL_DAILY_GEO_FOR = 'metric_journal_daily_geolocation_format'
+JOURNAL_DAILY_GEO_LAN = 'metric_journal_daily_geolocation_language'
+
+# key columns of each metric table, in the order of the natural keys built by MetricsAggregator
+#
+# a user-session has one IP, hence one geolocation, and an item has one year of publication, so the unique
+# measures of these tables can be summed across geolocations and years of publication, but not across
+# formats or languages: an item accessed in two formats in one session is one unique item request.
+# The tables split by geolocation alone, or by geolocation and format or language, count unique items
+# by exactly those dimensions, for the monthly tables that leave the format or the language out.
+METRIC_TABLE_KEYS = {
+    ARTICLE_DETAILED: ('article', 'format', 'language', 'geolocation'),
+    ARTICLE_DAILY: ('article',),
+    ARTICLE_DAILY_GEO: ('article', 'geolocation'),
+    ARTICLE_DAILY_GEO_FOR: ('article', 'geolocation', 'format'),
+    ARTICLE_DAILY_GEO_LAN: ('article', 'geolocation', 'language'),
+    JOURNAL_DETAILED: ('journal', 'format', 'language', 'geolocation', 'yop'),
+    JOURNAL_DAILY: ('journal',),
+    JOURNAL_DAILY_YOP: ('journal', 'yop'),
+    JOURNAL_DAILY_GEO: ('journal', 'geolocation'),
+    JOURNAL_DAILY_GEO_FOR: ('journal', 'geolocation', 'format'),
+    JOURNAL_DAILY_GEO_LAN: ('journal', 'geolocation', 'language'),
+}
+
+# same order as the columns of database.declararive.MetricMixin
+MEASURES = (
+    'total_item_requests',
+    'total_item_investigations',
+    'unique_item_requests',
+    'unique_item_investigations',
+)
+
+# script of the classic site: (format, whether the access is a request, i.e. to the full text)
+ARTICLE_SCRIPTS = {
+    'sci_arttext': (values.METRIC_FORMAT_HTML, True),
+    'sci_arttext_plus': (values.METRIC_FORMAT_HTML, True),
+    'sci_pdf': (values.METRIC_FORMAT_PDF, True),
+    'sci_abstract': (values.METRIC_FORMAT_HTML, False),
+}
+
+PID_PATTERN = re.compile(r'^S\d{4}-\d{3}[\dX]\d{13}$')
+
+MAX_CACHED_ACTIONS = 65536
+
+SPILL_CHUNK_SIZE = 10000
+
+Action = collections.namedtuple('Action', ['pid', 'issn', 'yop', 'format', 'language', 'is_request'])
+
+_MISSING = object()
+
+
+class ActionTranslator:
+    """
+    Translates pretable action names into the article accessed.
+
+    Only article pages of the classic site are translated, e.g.
+    /scielo.php?script=sci_arttext&pid=S0102-69092018000300512&tlng=pt.
+    The journal ISSN and the year of publication are taken from the PID.
+    PIDs of one journal may start with any of its ISSNs, so the ISSN is replaced by
+    the canonical ISSN of its journal, when known, and all the accesses to a journal
+    share its keys.
+    Other actions, such as PDF paths that do not carry a PID, are not translated.
+    Results are cached, since the same articles are accessed many times.
+
+    Parameters:
+    -----------
+        max_cached_actions (int): Number of actions after which the cache is cleared.
+        journal_issns (dict): Canonical ISSN of the journal by each of its ISSNs, as returned by db.get_journal_issns (optional).
+    """
+    def __init__(self, max_cached_actions=MAX_CACHED_ACTIONS, journal_issns=None):
+        self.max_cached_actions = max_cached_actions
+        self.journal_issns = journal_issns or {}
+        self.__actions = {}
+
+    def _parse(self, action_name):
+        path, _, query = action_name.partition('?')
+        if not path.endswith('scielo.php') or not query:
+            return None
+
+        params = {}
+        for param in query.split('#', 1)[0].split('&'):
+            name, _, value = param.partition('=')
+            params.setdefault(name.lower(), value)
+
+        script = ARTICLE_SCRIPTS.get(params.get('script', '').lower())
+        pid = params.get('pid', '').upper()
+        if script is None or not PID_PATTERN.match(pid):
+            return None
+
+        issn = pid[1:10]
+        language = params.get('tlng', '').lower()[:6] or values.METRIC_UNKNOWN_LANGUAGE
+        return Action(pid, self.journal_issns.get(issn, issn), pid[10:14], script[0], language, script[1])
+
+    def translate(self, action_name):
+        """
+        Returns:
+        --------
+            Action: The article accessed, or None if the action is not an article access.
+        """
+        action = self.__actions.get(action_name, _MISSING)
+
+        if action is _MISSING:
+            if len(self.__actions) >= self.max_cached_actions:
+                self.__actions.clear()
+
+            action = self._parse(action_name)
+            self.__actions[action_name] = action
+
+        return action
+
+
+class MetricsAggregator:
+    """
+    Aggregates the COUNTER R5 measures of a day, in the MEASURES order, per metric table key.
+
+    Every article access is an investigation and accesses to the full text are also requests.
+    Hits go through a sessions.SessionBuilder, which removes double-clicks and identifies the
+    user-sessions; unique measures count each item once per user-session. The hits must be
+    grouped by IP, as in sorted pretables: the items already seen are kept only until the
+    sessions of the builder are over. Since each item is counted once per session, the unique
+    measures of partial aggregates can be summed.
+
+    Counters are kept in a dictionary by key. When it holds max_keys keys, it is written sorted
+    to a temporary file and emptied, and the files are merged when the results are read,
+    so that memory stays bounded however many articles, languages and places a day has.
+
+    Parameters:
+    -----------
+        translator (ActionTranslator): Translator of action names.
+        session_builder (sessions.SessionBuilder): Builder of user-sessions.
+        max_keys (int): Number of keys kept in memory.
+        tmp_dir (str): Directory of the temporary files.
+    """
+    def __init__(self, translator=None, session_builder=None, max_keys=values.METRIC_MAX_KEYS, tmp_dir=None):
+        self.translator = translator or ActionTranslator()
+        self.session_builder = session_builder or sessions.SessionBuilder()
+        self.max_keys = max(1, max_keys)
+        self.tmp_dir = tmp_dir
+        self.hits = 0
+        self.ignored_hits = 0
+        self.__counts = {}
+        self.__runs = []
+        self.__seen = {}
+        self.__window = None
+
+    @property
+    def runs(self):
+        return len(self.__runs)
+
+    @property
+    def double_clicks(self):
+        return self.session_builder.double_clicks
+
+    def add(self, server_time, browser_name, browser_version, ip, latitude, longitude, action_name):
+        action = self.translator.translate(action_name)
+        if action is None:
+            self.ignored_hits += 1
+            return
+
+        hit = self.session_builder.push(server_time, browser_name, browser_version, ip, latitude, longitude, action_name)
+        if hit is None:
+            return
+
+        self.hits += 1
+
+        if hit.window != self.__window:
+            self.__seen.clear()
+            self.__window = hit.window
+
+        session = hit.session
+        geolocation = (latitude, longitude)
+        is_request = action.is_request
+        counts = self.__counts
+        seen = self.__seen
+
+        # each key has its own items seen, so unique measures are counted per key and not per detailed key
+        for key in (
+            (ARTICLE_DETAILED, action.pid, action.format, action.language, geolocation),
+            (ARTICLE_DAILY, action.pid),
+            (ARTICLE_DAILY_GEO, action.pid, geolocation),
+            (ARTICLE_DAILY_GEO_FOR, action.pid, geolocation, action.format),
+            (ARTICLE_DAILY_GEO_LAN, action.pid, geolocation, action.language),
+            (JOURNAL_DETAILED, action.issn, action.format, action.language, geolocation, action.yop),
+            (JOURNAL_DAILY, action.issn),
+            (JOURNAL_DAILY_YOP, action.issn, action.yop),
+            (JOURNAL_DAILY_GEO, action.issn, geolocation),
+            (JOURNAL_DAILY_GEO_FOR, action.issn, geolocation, action.format),
+            (JOURNAL_DAILY_GEO_LAN, action.issn, geolocation, action.language),
+        ):
+            c = counts.get(key)
+            if c is None:
+                c = counts[key] = [0, 0, 0, 0]
+
+            # journal measures count unique items, hence the PID in the session key
+            session_key = (session, action.pid, key)
+            flags = seen.get(session_key, 0)
+
+            c[1] += 1
+            if not flags & 1:
+                c[3] += 1
+            if is_request:
+                c[0] += 1
+                if not flags & 2:
+                    c[2] += 1
+
+            new_flags = flags | (3 if is_request else 1)
+            if new_flags != flags:
+                seen[session_key] = new_flags
+
+        if len(counts) >= self.max_keys:
+            self._spill()
+
+    def _spill(self):
+        fd, path = tempfile.mkstemp(prefix='metrics-', suffix='.run', dir=self.tmp_dir)
+        self.__runs.append(path)
+
+        items = sorted(self.__counts.items())
+        self.__counts = {}
+
+        with os.fdopen(fd, 'wb') as fout:
+            for i in range(0, len(items), SPILL_CHUNK_SIZE):
+                pickle.dump(items[i:i + SPILL_CHUNK_SIZE], fout, pickle.HIGHEST_PROTOCOL)
+
+    def _read_run(self, path):
+        with open(path, 'rb') as fin:
+            while True:
+                try:
+                    chunk = pickle.load(fin)
+                except EOFError:
+                    return
+                yield from chunk
+
+    def _merge_runs(self):
+        previous_key, previous_counts = None, None
+
+        for key, counts in heapq.merge(*[self._read_run(p) for p in self.__runs]):
+            if key == previous_key:
+                for i, v in enumerate(counts):
+                    previous_counts[i] += v
+                continue
+
+            if previous_key is not None:
+                yield previous_key, previous_counts
+            previous_key, previous_counts = key, counts
+
+        if previous_key is not None:
+            yield previous_key, previous_counts
+
+    def results(self):
+        """
+        Yields the aggregated measures and removes the temporary files.
+        Keys are sorted only when some of them were written to temporary files.
+
+        Yields:
+        -------
+            tuple: Key, whose first item is the metric table, and the measures, in the MEASURES order.
+        """
+        if not self.__runs:
+            yield from self.__counts.items()
+            return
+
+        if self.__counts:
+            self._spill()
+
+        try:
+            yield from self._merge_runs()
+        finally:
+            self.close()
+
+    def close(self):
+        for path in self.__runs:
+            if os.path.exists(path):
+                os.remove(path)
+        self.__runs = []
+
+
+def aggregate_pretable(path, aggregator, delimiter='\t'):
+    """
+    Adds the hits of a pretable to an aggregator.
+
+    Parameters:
+    -----------
+        path (str): Sorted pretable.
+        aggregator (MetricsAggregator): Aggregator of the measures.
+        delimiter (str): Column separator.
+
+    Returns:
+    --------
+        MetricsAggregator: The aggregator.
+    """
+    add = aggregator.add
+    for row in pretable.iter_pretable_rows(path, delimiter):
+        add(*row)
+
+    return aggregator
@@ -0,0 +1,131 @@
+import collections
+import io
+import itertools
+import multiprocessing
+import time
+
+from . import log, values
+from .utils import file_utils
+
+
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
+
+DEFAULT_CHUNK_LINES = 100000
+
+
+_worker_parser = None
+
+
+def _init_worker(mmdb_path, robots_path, robots_list, parser_options):
+    """
+    Build, once per worker process, the LogParser used to parse the chunks.
+    The GeoIP reader, the robots patterns and the user agent cache are kept for the worker lifetime.
+    """
+    global _worker_parser
+    _worker_parser = log.LogParser(
+        mmdb_path=mmdb_path,
+        robots_path=robots_path,
+        robots_list=robots_list,
+        **parser_options,
+    )
+
+
+def _parse_lines(lines):
+    lp = _worker_parser
+    lp.stats = log.Stats()
+
+    rows = []
+    for line in lines:
+        res = lp.parse_line(line)
+        if res:
+            rows.append(res)
+
+    lp.collect_ua_cache_stats()
+    return rows, lp.stats
+
+
+def _parse_range(file_path, start, end):
+    with open(file_path, 'rb') as fin:
+        fin.seek(start)
+        data = fin.read(end - start)
+
+    # decoded as file_utils.open_logfile reads a plain text file, so that the lines are the same as in sequential mode
+    return _parse_lines(io.TextIOWrapper(io.BytesIO(data)))
+
+
+class ParallelLogParser(log.LogParser):
+    """
+    LogParser that distributes the lines of a log file across a process pool.
+
+    Uncompressed files are split into line-aligned byte ranges that each worker
+    reads on its own. Compressed files (gzip, bz2) are decompressed by a readahead
+    thread of the main process and sent to the workers in batches of lines. Results are collected
+    in submission order, so the output rows keep the order of the log file,
+    and the Stats of each chunk are merged into the parser Stats.
+
+    Each worker keeps its own user agent cache. When ua_cache_path is given,
+    workers start from the persisted cache, but it is not updated in this mode.
+    """
+    def __init__(
+        self,
+        mmdb_path=None,
+        robots_path=None,
+        mmdb_data=None,
+        robots_list=None,
+        workers=2,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        chunk_lines=DEFAULT_CHUNK_LINES,
+        readahead_buffer_size=values.READAHEAD_BUFFER_SIZE,
+        readahead_queue_size=values.READAHEAD_QUEUE_SIZE,
+        **parser_options,
+    ):
+        super().__init__(
+            mmdb_path=mmdb_path,
+            robots_path=robots_path,
+            mmdb_data=mmdb_data,
+            robots_list=robots_list,
+            readahead_buffer_size=readahead_buffer_size,
+            readahead_queue_size=readahead_queue_size,
+        )
+        self.__robots_path = robots_path
+        self.__robots_list = robots_list
+        self.__parser_options = parser_options
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.chunk_lines = chunk_lines
+
+    def _tasks(self):
+        if file_utils.is_plain_text(self.logfile_path):
+            for start, end in file_utils.get_line_aligned_ranges(self.logfile_path, self.chunk_size):
+                yield _parse_range, (self.logfile_path, start, end)
+        else:
+            while True:
+                lines = list(itertools.islice(self.logfile, self.chunk_lines))
+                if not lines:
+                    break
+                yield _parse_lines, (lines,)
+
+    def _collect(self, async_result):
+        rows, stats = async_result.get()
+        self.stats.merge(stats)
+        return rows
+
+    def parse(self):
+        self.start = time.time()
+
+        with multiprocessing.Pool(
+            self.workers,
+            initializer=_init_worker,
+            initargs=(self.mmdb_path, self.__robots_path, self.__robots_list, self.__parser_options),
+        ) as pool:
+            # keeps a bounded number of chunks in flight to limit memory usage
+            pending = collections.deque()
+
+            for func, args in self._tasks():
+                pending.append(pool.apply_async(func, args))
+
+                if len(pending) >= self.workers * 2:
+                    yield from self._collect(pending.popleft())
+
+            while pending:
+                yield from self._collect(pending.popleft())
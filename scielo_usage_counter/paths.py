@@ -0,0 +1,134 @@
+import urllib.parse
+
+from . import values
+
+
+PATH_PAGE = 'page'
+PATH_STATIC = 'static'
+PATH_DOWNLOAD = 'download'
+
+FLAG_STATIC = 1
+FLAG_DOWNLOAD = 2
+
+MAX_CACHED_PATHS = 65536
+
+# characters that urlparse removes or interprets specially, see PathClassifier
+_UNSAFE_CHARS = ('\t', '\r', '\n')
+
+
+def legacy_is_static_file(path):
+    """
+    Check, with urlparse, whether the file of a request path has a static resource extension.
+    """
+    try:
+        file_from_url = urllib.parse.urlparse(path).path
+    except ValueError:
+        file_from_url = path.split('/')[-1]
+
+    ext = file_from_url.rsplit('.')[-1].lower()
+
+    if ext in values.EXTENSIONS_STATIC or file_from_url in values.EXTENSIONS_STATIC:
+        return True
+
+    return False
+
+
+def legacy_is_download(path):
+    """
+    Check whether the last segment of a request path has a download extension.
+    """
+    file_from_url = path.split('/')[-1]
+    ext = file_from_url.rsplit('.')[-1].lower()
+
+    if ext in values.EXTENSIONS_DOWNLOAD:
+        return True
+    return False
+
+
+class PathClassifier:
+    """
+    Classifies request paths as static resources, downloads or pages.
+
+    The answers are the same as those of legacy_is_static_file and legacy_is_download:
+    the static resource extension is taken from the path without its query string,
+    fragment and parameters, and the download extension from the last segment of
+    the whole path. For paths rooted at a single '/' and without tabs or line breaks,
+    which is the case of nearly all request paths, the query string boundary and
+    both extensions are found with string searches instead of urlparse. Other paths,
+    such as absolute URLs, are classified by the legacy functions.
+    Results are cached, since the same paths (e.g. PDFs and images) are requested many times.
+
+    Parameters:
+    -----------
+        max_cached_paths (int): Number of paths after which the cache is cleared.
+    """
+    def __init__(self, max_cached_paths=MAX_CACHED_PATHS):
+        self.max_cached_paths = max_cached_paths
+        self.__flags = {}
+
+    def _compute_flags(self, path):
+        if not path.startswith('/') or path.startswith('//') or any(c in path for c in _UNSAFE_CHARS):
+            flags = FLAG_STATIC if legacy_is_static_file(path) else 0
+            if legacy_is_download(path):
+                flags |= FLAG_DOWNLOAD
+            return flags
+
+        # urlparse splits the fragment, then the query string, then the parameters of the last segment
+        end = path.find('#')
+        if end < 0:
+            end = len(path)
+
+        query = path.find('?', 0, end)
+        if query >= 0:
+            end = query
+
+        params = path.find(';', path.rfind('/', 0, end), end)
+        if params >= 0:
+            end = params
+
+        flags = 0
+
+        if path[path.rfind('.', 0, end) + 1:end].lower() in values.EXTENSIONS_STATIC:
+            flags = FLAG_STATIC
+
+        if path[max(path.rfind('/'), path.rfind('.')) + 1:].lower() in values.EXTENSIONS_DOWNLOAD:
+            flags |= FLAG_DOWNLOAD
+
+        return flags
+
+    def flags(self, path):
+        """
+        Returns:
+        --------
+            int: FLAG_STATIC and FLAG_DOWNLOAD bits of the path.
+        """
+        flags = self.__flags.get(path)
+
+        if flags is None:
+            if len(self.__flags) >= self.max_cached_paths:
+                self.__flags.clear()
+
+            flags = self._compute_flags(path)
+            self.__flags[path] = flags
+
+        return flags
+
+    def is_static_file(self, path):
+        return bool(self.flags(path) & FLAG_STATIC)
+
+    def is_download(self, path):
+        return bool(self.flags(path) & FLAG_DOWNLOAD)
+
+    def classify(self, path):
+        """
+        Returns:
+        --------
+            str: PATH_STATIC, PATH_DOWNLOAD or PATH_PAGE. Paths that are both static and download (e.g. xml) are static.
+        """
+        flags = self.flags(path)
+
+        if flags & FLAG_STATIC:
+            return PATH_STATIC
+        if flags & FLAG_DOWNLOAD:
+            return PATH_DOWNLOAD
+        return PATH_PAGE
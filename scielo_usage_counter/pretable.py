@@ -0,0 +1,136 @@
+import logging
+import os
+
+from . import values
+from .utils import file_utils
+
+
+PRETABLE_SOURCE_FIELDS = values.PARSED_FILE_HEADER + ['latitude', 'longitude']
+
+
+class PretableFormatter:
+    """
+    Formats parsed hits (rows in the values.PARSED_FILE_HEADER order) as pretable lines.
+    Pretable fields that are not available are left empty.
+
+    Parameters:
+    -----------
+        header (list): Pretable fields, in output order.
+        delimiter (str): Column separator.
+    """
+    def __init__(self, header=values.PRETABLE_FILE_HEADER, delimiter='\t'):
+        self.header = header
+        self.delimiter = delimiter
+        self.__indexes = []
+
+        for h in header:
+            field = values.PRETABLE_TO_PARSED_FILE_HEADER.get(h, h)
+            self.__indexes.append(PRETABLE_SOURCE_FIELDS.index(field) if field in PRETABLE_SOURCE_FIELDS else None)
+
+    def format(self, row, latitude='', longitude=''):
+        source = list(row) + [latitude, longitude]
+        return self.delimiter.join(['' if i is None else str(source[i]) for i in self.__indexes])
+
+
+class PretableWriter:
+    """
+    Appends pretable lines to one unsorted file per day, keeping the files open until close is called.
+    A file that does not exist yet is created with the header.
+
+    Parameters:
+    -----------
+        output_directory (str): Directory of the unsorted pretables.
+        header (list): Pretable fields, written as the first line of new files.
+        posfix (str): Posfix of the file names.
+        extension (str): Extension of the file names.
+        delimiter (str): Column separator.
+    """
+    def __init__(self, output_directory, header=values.PRETABLE_FILE_HEADER, posfix='unsorted', extension='tsv', delimiter='\t'):
+        self.output_directory = output_directory
+        self.header = header
+        self.posfix = posfix
+        self.extension = extension
+        self.delimiter = delimiter
+        self.__files = {}
+        self.__paths = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def paths(self):
+        """
+        Files written since the writer was created, by date (yyyy-mm-dd).
+        """
+        return dict(self.__paths)
+
+    def _open(self, ymd):
+        path = file_utils.generate_filepath_with_filename(
+            directory=self.output_directory,
+            filename=ymd,
+            posfix=self.posfix,
+            extension=self.extension,
+        )
+
+        if not os.path.exists(path):
+            logging.info('Criado arquivo %s' % path)
+            file_utils.create_file_with_header(path, self.header, self.delimiter)
+
+        self.__paths[ymd] = path
+        self.__files[ymd] = open(path, 'a')
+        return self.__files[ymd]
+
+    def write(self, ymd, line):
+        fout = self.__files.get(ymd) or self._open(ymd)
+        fout.write(line + '\n')
+
+    def flush(self):
+        """
+        Write the lines appended so far to disk.
+        """
+        for fout in self.__files.values():
+            fout.flush()
+            os.fsync(fout.fileno())
+
+    def close(self):
+        for fout in self.__files.values():
+            fout.close()
+        self.__files = {}
+
+
+def iter_pretable_rows(path, delimiter='\t'):
+    """
+    Reads the rows of a pretable, with the fields in the values.PRETABLE_FILE_HEADER order.
+    The header is read from the first line; a file without header must follow values.PRETABLE_FILE_HEADER.
+    Header lines found elsewhere (e.g. sorted into the file) and incomplete lines are skipped.
+
+    Yields:
+    -------
+        list: Fields of a row.
+    """
+    with open(path) as fin:
+        first_line = fin.readline()
+        fields = first_line.rstrip('\n').split(delimiter)
+
+        if 'actionName' in fields and 'ip' in fields:
+            header_line = first_line
+        else:
+            header_line, fields = None, values.PRETABLE_FILE_HEADER
+            fin.seek(0)
+
+        indexes = [fields.index(h) for h in values.PRETABLE_FILE_HEADER]
+        in_order = indexes == list(range(len(indexes)))
+        size = len(indexes)
+
+        for line in fin:
+            if line == header_line:
+                continue
+
+            row = line.rstrip('\n').split(delimiter)
+            if len(row) < len(fields):
+                continue
+
+            yield row[:size] if in_order else [row[i] for i in indexes]
@@ -2,10 +2,8 @@ import argparse
 import csv
 import logging
 import os
-import shlex
-import subprocess
 
-from scielo_usage_counter import exceptions, values
+from scielo_usage_counter import columnar, exceptions, external_sort, geo, pretable, values
 from scielo_usage_counter.database import db
 from scielo_usage_counter.utils import file_utils
 
@@ -45,9 +43,39 @@ UNSORTED_PRETABLES_DIRECTORY = os.environ.get(
     'data/unsorted_pretables/'
 )
 
-SCRIPT_SORT_PATH = os.environ.get(
-    'GENERATE_PRETABLE_SCRIPT_SORT_PATH',
-    'scripts/sort_uniq.sh'
+SORT_MODE = os.environ.get(
+    'GENERATE_PRETABLE_SORT_MODE',
+    external_sort.SORT_MODE_IP_TIME
+)
+
+SORT_MEMORY_BUDGET = int(os.environ.get(
+    'GENERATE_PRETABLE_SORT_MEMORY_BUDGET',
+    external_sort.DEFAULT_MEMORY_BUDGET // (1024 * 1024)
+))
+
+SORT_WORKERS = int(os.environ.get(
+    'GENERATE_PRETABLE_SORT_WORKERS',
+    1
+))
+
+SORT_TMP_DIRECTORY = os.environ.get(
+    'GENERATE_PRETABLE_SORT_TMP_DIRECTORY',
+    None
+)
+
+PROCESSED_FILES_INDEX = os.environ.get(
+    'GENERATE_PRETABLE_PROCESSED_FILES_INDEX',
+    None
+)
+
+STATUS_FLUSH_INTERVAL = int(os.environ.get(
+    'GENERATE_PRETABLE_STATUS_FLUSH_INTERVAL',
+    values.DB_STATUS_FLUSH_INTERVAL
+))
+
+MMDB_PATH = os.environ.get(
+    'GENERATE_PRETABLE_MMDB_PATH',
+    None
 )
 
 
@@ -76,7 +104,97 @@ def extract_values(data, header, delimiter):
     str
         Uma string delimitada por join_char que representa os valores obtidos de data
     """
-    return delimiter.join([data.get(h) for h in header])
+    return delimiter.join([data.get(values.PRETABLE_TO_PARSED_FILE_HEADER.get(h, h)) or '' for h in header])
+
+
+def load_geoip(mmdb):
+    """Carrega o mapa de geolocalizações usado para obter as coordenadas dos IPs.
+
+    Parameters
+    ----------
+    mmdb : str
+        Arquivo de mapa de geolocalizações
+
+    Returns
+    -------
+    geo.GeoIp
+        Geolocalizador de IPs
+    """
+    if not file_utils.is_valid_path(mmdb):
+        raise exceptions.InvalidFilePath('%s não é um caminho válido' % mmdb)
+
+    geoip = geo.GeoIp()
+    geoip.map = mmdb
+    return geoip
+
+
+def format_geolocation(geoip, ip):
+    """Obtém a latitude e a longitude de um IP, em texto, ou strings vazias se o IP não for encontrado.
+
+    Returns
+    -------
+    tuple
+        Latitude e longitude
+    """
+    geolocation = geoip.ip_to_geolocation(ip)
+
+    if geolocation is None:
+        return '', ''
+
+    latitude = '' if geolocation.latitude is None else str(geolocation.latitude)
+    longitude = '' if geolocation.longitude is None else str(geolocation.longitude)
+
+    return latitude, longitude
+
+
+def read_pretable_lines(parsed_file, header, delimiter='\t', geoip=None):
+    """Lê um arquivo de log processado, em formato tabular ou colunar, e obtém as linhas de pré-tabela.
+
+    Parameters
+    ----------
+    parsed_file : str
+        Nome do arquivo contendo dados de log processados
+    header : list
+        Lista de nomes de campos a serem gravados no arquivo de pré-tabela
+    delimiter: str
+        Separador de colunas
+    geoip : geo.GeoIp
+        Geolocalizador usado para preencher latitude e longitude a partir do IP; sem ele, as coordenadas ficam vazias
+
+    Yields
+    ------
+    tuple
+        Data do acesso (yyyy-mm-dd) e linha moldada ao formato pré-tabela
+    """
+    # arquivos de log processados não têm coordenadas, que são obtidas do IP
+    coordinates = geoip is not None and 'latitude' in header and 'longitude' in header
+
+    if columnar.is_columnar_file(parsed_file):
+        date_index = values.PARSED_FILE_HEADER.index('server_date')
+        ip_index = values.PARSED_FILE_HEADER.index('user_ip')
+        indexes = []
+        for h in header:
+            parsed_field = values.PRETABLE_TO_PARSED_FILE_HEADER.get(h, h)
+            indexes.append(values.PARSED_FILE_HEADER.index(parsed_field) if parsed_field in values.PARSED_FILE_HEADER else None)
+
+        # percorre os dados por bloco de colunas, sem montar um dicionário por linha
+        for block in columnar.ColumnarReader(parsed_file).iter_blocks():
+            empty = [''] * len(block[date_index])
+            columns = [block[i] if i is not None else empty for i in indexes]
+
+            if coordinates:
+                geolocations = [format_geolocation(geoip, ip) for ip in block[ip_index]]
+                columns[header.index('latitude')] = [g[0] for g in geolocations]
+                columns[header.index('longitude')] = [g[1] for g in geolocations]
+
+            for server_date, row in zip(block[date_index], zip(*columns)):
+                yield server_date[:10], delimiter.join(row)
+    else:
+        with open(parsed_file) as fin:
+            for row in csv.DictReader(fin, delimiter=delimiter):
+                if coordinates:
+                    row['latitude'], row['longitude'] = format_geolocation(geoip, row.get('user_ip'))
+                yield row.get('server_date').split(' ')[0], extract_values(row, header, delimiter)
 
 
 def generate_pretables(
@@ -84,7 +202,8 @@ def generate_pretables(
     output_directory, 
     header=values.PRETABLE_FILE_HEADER, 
     extension='tsv', 
-    delimiter='\t'
+    delimiter='\t',
+    geoip=None,
 ):
     """
     Gera arquivo(s) com os dados de log processados.
@@ -102,47 +221,26 @@ def generate_pretables(
         Extensão do nome dos arquivos a serem gerados
     delimiter : str
         Separador de colunas dos arquivos a serem gerados
+    geoip : geo.GeoIp
+        Geolocalizador usado para preencher latitude e longitude a partir do IP
     """
     logging.info('Lendo %s' % parsed_file)
-    with open(parsed_file) as fin:
-        output_files = {}
-
-        csv_reader = csv.DictReader(fin, delimiter=delimiter)
 
-        try:
-            for row in csv_reader:
-                # obtém yyyy-mm-dd do acesso
-                ymd = row.get('serverTime').split(' ')[0]
+    if geoip is None:
+        logging.warning('Sem mapa de geolocalizações, as pré-tabelas não terão latitude e longitude')
 
-                # gera nome de arquivo relacionado a ymd
-                ymd_output_path = file_utils.generate_filepath_with_filename(
-                    directory=output_directory,
-                    filename=ymd,
-                    posfix=UNSORTED_POSFIX,
-                    extension=extension,
-                )
+    with pretable.PretableWriter(
+        output_directory=output_directory,
+        header=header,
+        posfix=UNSORTED_POSFIX,
+        extension=extension,
+        delimiter=delimiter,
+    ) as writer:
+        # obtém yyyy-mm-dd do acesso e a linha moldada ao formato pré-tabela, e grava a linha no arquivo da data correta
+        for ymd, fmt_values in read_pretable_lines(parsed_file, header, delimiter, geoip):
+            writer.write(ymd, fmt_values)
 
-                # verifica se arquivo já existe
-                if not os.path.exists(ymd_output_path):
-                    logging.info('Criado arquivo %s' % ymd_output_path)
-                    file_utils.create_file_with_header(ymd_output_path, header)
-
-                # abre arquivo em modo append, caso ainda não esteja aberto. adiciona em dicionário uma referência ao arquivo
-                if ymd not in output_files:
-                    output_files[ymd] = open(ymd_output_path, 'a')
-
-                # obtém uma linha moldada ao formato pré-tabela
-                fmt_values = extract_values(row, header, delimiter)
-
-                # grava linha no arquivo de data correta
-                output_files[ymd].write(fmt_values + '\n')
-
-        finally:
-            # garante fechamento dos arquivos
-            for v in output_files.values():
-                v.close()
-
-        return output_files
+    return writer.paths
 
 
 def generate_pretables_db(
@@ -153,21 +251,29 @@ def generate_pretables_db(
     extension='tsv', 
     delimiter='\t', 
     processed_logs_directory=PROCESSED_LOGS_DIRECTORY,
+    status_flush_interval=STATUS_FLUSH_INTERVAL,
+    processed_files_index=PROCESSED_FILES_INDEX,
+    mmdb=MMDB_PATH,
 ):
+    geoip = load_geoip(mmdb) if mmdb else None
     non_pretable_dates = db.get_non_pretable_dates(str_connection, collection)
+
+    # o diretório é lido uma única vez; com processed_files_index, o índice é reaproveitado entre execuções
+    index = file_utils.ProcessedFilesIndex(processed_logs_directory, extension=values.OUTPUT_FORMATS, index_path=processed_files_index)
     processed_files = []
     for npt in non_pretable_dates:
-        processed_files.extend(file_utils.get_processed_files(npt, processed_logs_directory))
+        processed_files.extend(index.get_files(npt))
 
     output_files = {}
     for pf in set(sorted(processed_files)):
-        pf_results = generate_pretables(parsed_file=pf, output_directory=output_directory, header=header, extension=extension, delimiter=delimiter)
+        pf_results = generate_pretables(parsed_file=pf, output_directory=output_directory, header=header, extension=extension, delimiter=delimiter, geoip=geoip)
         output_files.update(pf_results)
 
     non_pretable_dates_str = [d.strftime('%Y-%m-%d') for d in non_pretable_dates]
-    for k in output_files:
-        if k in non_pretable_dates_str:
-            db.set_control_date_status(str_connection, collection, k, values.DATE_STATUS_EXTRACTING_PRETABLE)
+    with db.StatusBuffer(str_connection, db.set_control_date_statuses, status_flush_interval) as statuses:
+        for k in output_files:
+            if k in non_pretable_dates_str:
+                statuses.add((collection, k, values.DATE_STATUS_EXTRACTING_PRETABLE))
 
 
 def sort_pretables(
@@ -175,25 +281,59 @@ def sort_pretables(
     collection,
     output_directory,
     unsorted_pretables_directory=UNSORTED_PRETABLES_DIRECTORY,
+    sort_mode=SORT_MODE,
+    sort_memory_budget=SORT_MEMORY_BUDGET,
+    sort_workers=SORT_WORKERS,
+    sort_tmp_directory=SORT_TMP_DIRECTORY,
+    status_flush_interval=STATUS_FLUSH_INTERVAL,
     ):
+    """
+    Ordena e remove linhas duplicadas das pré-tabelas completas.
+
+    Parameters
+    ----------
+    sort_mode : str
+        ip_time (IP e data do acesso) ou compat (idêntico a sort -r -t $'\\t' -k 4 | uniq)
+    sort_memory_budget : int
+        Memória aproximada, em MiB, usada na ordenação
+    sort_workers : int
+        Número de processos usados na ordenação
+    sort_tmp_directory : str
+        Diretório de arquivos temporários
+    status_flush_interval : int
+        Número de pré-tabelas ordenadas cujos status são gravados de uma vez no banco de dados
+    """
+    sorter = external_sort.ExternalSorter(
+        mode=sort_mode,
+        memory_budget=sort_memory_budget * 1024 * 1024,
+        workers=sort_workers,
+        tmp_dir=sort_tmp_directory,
+    )
+
     unsorted_pretables = db.get_unsorted_pretables(str_connection, collection)
-    for upt_date in unsorted_pretables:
-        unsorted_pt_path = file_utils.translate_date_to_output_path(
-            date=upt_date, 
-            output_directory=unsorted_pretables_directory, 
-            posfix=UNSORTED_POSFIX,
-        )
-        if not file_utils.is_valid_path(unsorted_pt_path):
-            raise exceptions.InvalidFilePath('%s não é um caminho válido' % unsorted_pt_path)
-
-        sorted_pt_path = file_utils.translate_date_to_output_path(
-            date=upt_date,
-            output_directory=output_directory,
-        )
-        
-        sort_result = subprocess.call(shlex.split('%s -i %s -o %s' % (SCRIPT_SORT_PATH, unsorted_pt_path, sorted_pt_path)))
-        if sort_result == values.SORT_RESULT_SUCCESS:
-            db.set_control_date_status(str_connection, collection, upt_date, values.DATE_STATUS_PRETABLE)
+    with db.StatusBuffer(str_connection, db.set_control_date_statuses, status_flush_interval) as statuses:
+        for upt_date in unsorted_pretables:
+            unsorted_pt_path = file_utils.translate_date_to_output_path(
+                date=upt_date, 
+                output_directory=unsorted_pretables_directory, 
+                posfix=UNSORTED_POSFIX,
+            )
+            if not file_utils.is_valid_path(unsorted_pt_path):
+                raise exceptions.InvalidFilePath('%s não é um caminho válido' % unsorted_pt_path)
+
+            sorted_pt_path = file_utils.translate_date_to_output_path(
+                date=upt_date,
+                output_directory=output_directory,
+            )
+
+            logging.info('Ordenando %s em %s' % (unsorted_pt_path, sorted_pt_path))
+            try:
+                sorter.sort(unsorted_pt_path, sorted_pt_path)
+            except (OSError, exceptions.InvalidFilePath) as e:
+                logging.error('Não foi possível ordenar %s: %s' % (unsorted_pt_path, e))
+                continue
+
+            statuses.add((collection, upt_date, values.DATE_STATUS_PRETABLE))
 
 
 def main():
@@ -218,6 +358,13 @@ def main():
         help='Caminho de arquivo de log processado',
     )
 
+    file_parser.add_argument(
+        '-m',
+        '--mmdb',
+        default=MMDB_PATH,
+        help='Arquivo de mapa de geolocalizações, usado para obter a latitude e a longitude dos IPs (sem ele, as coordenadas ficam vazias)',
+    )
+
     database_parser = subparsers.add_parser('database', help='Modo de banco de dados')
 
     database_parser.add_argument(
@@ -234,6 +381,13 @@ def main():
         help='Acrônimo de coleção',
     )
 
+    database_parser.add_argument(
+        '--status_flush_interval',
+        type=int,
+        default=STATUS_FLUSH_INTERVAL,
+        help='Número de datas cujos status são gravados de uma vez no banco de dados',
+    )
+
     database_parser_subparsers = database_parser.add_subparsers(title='command')
 
     database_parser_subparsers_generate = database_parser_subparsers.add_parser('generate')
@@ -245,6 +399,19 @@ def main():
         help='Diretório de arquivos de log pré-processados'
     )
 
+    database_parser_subparsers_generate.add_argument(
+        '--processed_files_index',
+        default=PROCESSED_FILES_INDEX,
+        help='Arquivo em que o índice de datas dos arquivos de log pré-processados é persistido entre execuções (opcional)'
+    )
+
+    database_parser_subparsers_generate.add_argument(
+        '-m',
+        '--mmdb',
+        default=MMDB_PATH,
+        help='Arquivo de mapa de geolocalizações, usado para obter a latitude e a longitude dos IPs (sem ele, as coordenadas ficam vazias)',
+    )
+
     database_parser_subparsers_sort = database_parser_subparsers.add_parser('sort')
 
     database_parser_subparsers_sort.add_argument(
@@ -254,6 +421,33 @@ def main():
         help='Diretório de pré-tabelas não ordenadas'
     )
 
+    database_parser_subparsers_sort.add_argument(
+        '--sort_mode',
+        choices=external_sort.SORT_MODES,
+        default=SORT_MODE,
+        help='Ordem das pré-tabelas: ip_time (IP e data do acesso) ou compat (idêntica a sort -r -k 4 | uniq)',
+    )
+
+    database_parser_subparsers_sort.add_argument(
+        '--sort_memory_budget',
+        type=int,
+        default=SORT_MEMORY_BUDGET,
+        help='Memória aproximada, em MiB, usada na ordenação',
+    )
+
+    database_parser_subparsers_sort.add_argument(
+        '--sort_workers',
+        type=int,
+        default=SORT_WORKERS,
+        help='Número de processos usados na ordenação',
+    )
+
+    database_parser_subparsers_sort.add_argument(
+        '--sort_tmp_directory',
+        default=SORT_TMP_DIRECTORY,
+        help='Diretório de arquivos temporários da ordenação',
+    )
+
     args = parser.parse_args()
 
     logging.basicConfig(
@@ -266,7 +460,7 @@ def main():
 
     if getattr(args, 'parsed_file', None):
         logging.info('Inicializado em modo de arquivo')
-        generate_pretables(**args.__dict__)
+        generate_pretables(args.parsed_file, args.output_directory, geoip=load_geoip(args.mmdb) if args.mmdb else None)
 
     elif getattr(args, 'str_connection', None):
         logging.info('Inicializado em modo de banco de dados')
@@ -280,3 +474,5 @@ def main():
             logging.info('Ordenando pré-tabelas')
             params = _args_to_param(args, ignore=['processed_logs_directory'])
             sort_pretables(**params)
+
+        db.dispose()
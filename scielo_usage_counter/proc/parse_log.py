@@ -1,10 +1,14 @@
 #!/usr/env python
 import argparse
+import datetime
+import glob
 import logging
+import multiprocessing
 import os
+import time
 
 from scielo_log_validator import validator
-from scielo_usage_counter import log, values
+from scielo_usage_counter import cache, checkpoint, log, parallel, values
 from scielo_usage_counter.utils import file_utils
 from scielo_usage_counter.database import db 
 
@@ -34,8 +38,74 @@ OUTPUT_DIRECTORY = os.environ.get(
     'data'
 )
 
+WORKERS = int(os.environ.get(
+    'PARSE_LOG_WORKERS',
+    1
+))
 
-def parse_file(logfile: str, output_directory: str, mmdb: str, robots: str):
+UA_CACHE_SIZE = int(os.environ.get(
+    'PARSE_LOG_UA_CACHE_SIZE',
+    values.UA_CACHE_SIZE
+))
+
+UA_CACHE_PATH = os.environ.get(
+    'PARSE_LOG_UA_CACHE_PATH',
+    None
+)
+
+GEOIP_CACHE_SIZE = int(os.environ.get(
+    'PARSE_LOG_GEOIP_CACHE_SIZE',
+    values.GEOIP_CACHE_SIZE
+))
+
+OUTPUT_FORMAT = os.environ.get(
+    'PARSE_LOG_OUTPUT_FORMAT',
+    values.OUTPUT_FORMAT_TSV
+)
+
+READAHEAD_BUFFER_SIZE = int(os.environ.get(
+    'PARSE_LOG_READAHEAD_BUFFER_SIZE',
+    values.READAHEAD_BUFFER_SIZE
+))
+
+READAHEAD_QUEUE_SIZE = int(os.environ.get(
+    'PARSE_LOG_READAHEAD_QUEUE_SIZE',
+    values.READAHEAD_QUEUE_SIZE
+))
+
+PROFILE_SLOWEST_LINES = int(os.environ.get(
+    'PARSE_LOG_PROFILE_SLOWEST_LINES',
+    values.PROFILE_SLOWEST_LINES
+))
+
+CHECKPOINT_INTERVAL = int(os.environ.get(
+    'PARSE_LOG_CHECKPOINT_INTERVAL',
+    values.CHECKPOINT_INTERVAL
+))
+
+RESUMABLE_CHECKPOINT_INTERVAL = int(os.environ.get(
+    'PARSE_LOG_RESUMABLE_CHECKPOINT_INTERVAL',
+    values.RESUMABLE_CHECKPOINT_INTERVAL
+))
+
+STATUS_FLUSH_INTERVAL = int(os.environ.get(
+    'PARSE_LOG_STATUS_FLUSH_INTERVAL',
+    values.DB_STATUS_FLUSH_INTERVAL
+))
+
+EVALUATION_MODE = os.environ.get(
+    'PARSE_LOG_EVALUATION_MODE',
+    values.EVALUATION_MODE_FULL
+)
+
+
+def create_parser(mmdb: str, robots: str, workers: int = WORKERS, **parser_options):
+    if workers > 1:
+        return parallel.ParallelLogParser(mmdb_path=mmdb, robots_path=robots, workers=workers, **parser_options)
+    return log.LogParser(mmdb_path=mmdb, robots_path=robots, **parser_options)
+
+
+def validate_logfile(logfile: str):
     logging.info(f'Validação iniciada para arquivo {logfile}')
     validation_results = validator.pipeline_validate(
         path=logfile, 
@@ -43,31 +113,208 @@ def parse_file(logfile: str, output_directory: str, mmdb: str, robots: str):
     )
 
     if validation_results.get('is_valid', {}).get('all', False):
-        output_filepath = file_utils.generate_filepath(output_directory, logfile)
+        return True
 
-        lp = log.LogParser(mmdb_path=mmdb, robots_path=robots)
-        lp.logfile = logfile
-        lp.output = output_filepath
-        lp.stats.output = output_filepath + '.summary'
+    logging.warning(f'Arquivo {logfile} foi invalidado')
+    return False
+
+
+def parse_logfile(lp: log.LogParser, logfile: str, output_directory: str, output_format: str = OUTPUT_FORMAT, checkpoint_interval: int = CHECKPOINT_INTERVAL, profile: bool = False, profile_slowest_lines: int = PROFILE_SLOWEST_LINES, keep_completed_checkpoint: bool = False):
+    """
+    Processa um arquivo de log já validado com um parser existente, retomando do último checkpoint quando houver.
+    Com keep_completed_checkpoint, o checkpoint de um arquivo processado é mantido, marcado como concluído,
+    até ser removido por quem registra o novo status do arquivo; enquanto existir, o arquivo não é processado novamente.
+    """
+    checkpoint_path = checkpoint.get_checkpoint_path(output_directory, logfile)
+
+    # um checkpoint concluído é mantido com qualquer formato de saída e número de processos
+    cp = checkpoint.load_checkpoint(checkpoint_path, logfile)
+    if cp and cp.completed:
+        logging.info(f'Arquivo {logfile} já foi processado com saída em {cp.output_path}')
+        return
 
+    if checkpoint_interval and (isinstance(lp, parallel.ParallelLogParser) or output_format != values.OUTPUT_FORMAT_TSV):
+        logging.info('Checkpoints são gravados apenas com um processo e formato de saída tsv')
+        checkpoint_interval = 0
+
+    if not checkpoint_interval:
+        cp = None
+
+    output_filepath = cp.output_path if cp else file_utils.generate_filepath(output_directory, logfile, extension=output_format)
+
+    lp.logfile = logfile
+    lp.output_format = output_format
+    lp.enable_checkpoints(checkpoint_path, checkpoint_interval, keep_completed_checkpoint)
+
+    if profile and isinstance(lp, parallel.ParallelLogParser):
+        logging.info('Perfis de desempenho são gravados apenas com um processo')
+    elif profile:
+        lp.enable_profiling(output_filepath + '.profile', profile_slowest_lines)
+
+    if cp:
+        logging.info(f'Processamento retomado para arquivo {logfile} a partir da linha {cp.stats.get("lines_parsed", 0)} com saída em {output_filepath}')
+        lp.resume(cp)
+    else:
         logging.info(f'Processamento iniciado para arquivo {logfile} com saída em {output_filepath}')
-        data = lp.parse()
-        lp.save(data)
+        lp.output = output_filepath
+    lp.stats.output = output_filepath + '.summary'
+
+    data = lp.parse()
+    lp.save(data)
+
+    logging.info(f'Arquivo {logfile} foi processado em {lp.total_time} segundos')
+
 
-        logging.info(f'Arquivo {logfile} foi processado em {lp.total_time} segundos')
+def parse_file(logfile: str, output_directory: str, mmdb: str, robots: str, workers: int = WORKERS, output_format: str = OUTPUT_FORMAT, checkpoint_interval: int = CHECKPOINT_INTERVAL, profile: bool = False, profile_slowest_lines: int = PROFILE_SLOWEST_LINES, keep_completed_checkpoint: bool = False, **parser_options):
+    if validate_logfile(logfile):
+        lp = create_parser(mmdb, robots, workers, **parser_options)
+        parse_logfile(lp, logfile, output_directory, output_format, checkpoint_interval, profile, profile_slowest_lines, keep_completed_checkpoint)
         return values.LOGFILE_STATUS_LOADED
     else:
-        logging.warning(f'Arquivo {logfile} foi invalidado')
         return values.LOGFILE_STATUS_INVALIDATED
 
 
-def parse_files_db(str_connection: str, collection: str, output_directory: str, mmdb: str, robots: str):
+def parse_files_db(str_connection: str, collection: str, output_directory: str, mmdb: str, robots: str, workers: int = WORKERS, output_format: str = OUTPUT_FORMAT, checkpoint_interval: int = RESUMABLE_CHECKPOINT_INTERVAL, profile: bool = False, profile_slowest_lines: int = PROFILE_SLOWEST_LINES, status_flush_interval: int = STATUS_FLUSH_INTERVAL, **parser_options):
+    """
+    Processa os arquivos de log não processados de uma coleção.
+    Os arquivos passam ao status parcial em lote, a cada status_flush_interval arquivos, antes de serem processados.
+    Os demais status também são gravados em lote a cada status_flush_interval arquivos, e os checkpoints concluídos,
+    que impedem que um arquivo seja processado novamente, são removidos apenas depois que o status de seus arquivos é gravado.
+    """
     non_parsed_logs = db.get_non_parsed_logs(str_connection, collection)
 
-    for lf in non_parsed_logs:
-        lf_path = file_utils.translate_path(lf.full_path)
-        lf_status = parse_file(lf_path, output_directory, mmdb, robots)
-        db.set_logfile_status(str_connection, lf.id, lf_status)
+    with db.StatusBuffer(str_connection, db.set_logfile_statuses, status_flush_interval) as statuses:
+        # um arquivo interrompido, inclusive por falta de memória ou desligamento, permanece parcial
+        # e é retomado do último checkpoint na próxima execução
+        for lf in db.iter_partial_logfiles(str_connection, non_parsed_logs, status_flush_interval):
+            lf_path = file_utils.translate_path(lf.full_path)
+            lf_status = parse_file(lf_path, output_directory, mmdb, robots, workers, output_format, checkpoint_interval, profile, profile_slowest_lines, True, **parser_options)
+
+            checkpoint_path = checkpoint.get_checkpoint_path(output_directory, lf_path)
+            statuses.add((lf.id, lf_status), on_flush=lambda path=checkpoint_path: checkpoint.remove_checkpoint(path))
+
+
+_batch_parser = None
+
+_batch_ua_cache_path = None
+
+
+def get_worker_ua_cache_path(ua_cache_path: str, pid: int):
+    return f'{ua_cache_path}.worker-{pid}'
+
+
+def _init_batch_worker(mmdb: str, robots: str, parser_options: dict, worker_ua_cache: bool = False):
+    """
+    Cria, uma vez por processo, o parser usado para todos os arquivos do lote.
+    O mapa de geolocalizações, os padrões de robôs e o cache de user agents são mantidos entre arquivos.
+    Com worker_ua_cache, cada processo grava o seu cache de user agents em um arquivo próprio, combinado ao final do lote.
+    """
+    global _batch_parser, _batch_ua_cache_path
+
+    # o parser não persiste o cache de user agents; ele é carregado uma vez e gravado pelo lote após cada arquivo
+    ua_cache_path = parser_options.pop('ua_cache_path', None)
+    _batch_parser = log.LogParser(mmdb_path=mmdb, robots_path=robots, **parser_options)
+    if ua_cache_path:
+        _batch_parser.ua_cache.load(ua_cache_path, _batch_parser.ua_cache_fingerprint())
+        _batch_ua_cache_path = get_worker_ua_cache_path(ua_cache_path, os.getpid()) if worker_ua_cache else ua_cache_path
+    else:
+        _batch_ua_cache_path = None
+
+
+def _parse_batch_file(logfile: str, output_directory: str, output_format: str, checkpoint_interval: int, profile: bool, profile_slowest_lines: int):
+    lp = _batch_parser
+    lp.stats = log.Stats()
+
+    try:
+        if not validate_logfile(logfile):
+            return logfile, values.LOGFILE_STATUS_INVALIDATED, None
+        parse_logfile(lp, logfile, output_directory, output_format, checkpoint_interval, profile, profile_slowest_lines)
+    except Exception as e:
+        logging.error(f'Arquivo {logfile} não pôde ser processado: {e}')
+        return logfile, values.LOGFILE_STATUS_QUEUE, None
+    finally:
+        lp.close()
+        if _batch_ua_cache_path:
+            lp.ua_cache.save(_batch_ua_cache_path, lp.ua_cache_fingerprint())
+
+    return logfile, values.LOGFILE_STATUS_LOADED, lp.stats.to_dict()
+
+
+def save_batch_summary(path: str, results: list, total_time: float, sep='\t'):
+    """
+    Grava o resumo de um lote: uma linha por arquivo, com sua situação e estatísticas, e uma linha com os totais.
+    """
+    keys = list(log.STATS_MEASURES)
+    total = log.Stats()
+
+    with open(path, 'w') as fout:
+        fout.write(sep.join(['logfile', 'status'] + keys) + '\n')
+
+        for logfile, status, stats in results:
+            if stats:
+                file_stats = log.Stats()
+                file_stats.update(stats)
+                total.merge(file_stats)
+
+            fout.write(sep.join([logfile, str(status)] + [str((stats or {}).get(k, '')) for k in keys]) + '\n')
+
+        total.total_time = total_time
+        fout.write(sep.join(['total', ''] + [str(v) for v in total.to_dict().values()]) + '\n')
+
+
+def parse_batch(
+    output_directory: str,
+    mmdb: str,
+    robots: str,
+    directories: list = (),
+    patterns: list = (),
+    list_files: list = (),
+    workers: int = WORKERS,
+    output_format: str = OUTPUT_FORMAT,
+    checkpoint_interval: int = RESUMABLE_CHECKPOINT_INTERVAL,
+    profile: bool = False,
+    profile_slowest_lines: int = PROFILE_SLOWEST_LINES,
+    **parser_options,
+):
+    """
+    Processa um lote de arquivos de log, reaproveitando em cada processo o parser e seus recursos.
+    Os arquivos são distribuídos entre os processos do maior para o menor.
+
+    Returns:
+    --------
+        str: Caminho do resumo do lote.
+    """
+    logfiles = file_utils.get_logfiles(directories, patterns, list_files)
+    logfiles.sort(key=os.path.getsize, reverse=True)
+    logging.info(f'{len(logfiles)} arquivos de log encontrados para o lote')
+
+    start = time.time()
+    tasks = [(lf, output_directory, output_format, checkpoint_interval, profile, profile_slowest_lines) for lf in logfiles]
+    ua_cache_path = parser_options.get('ua_cache_path')
+
+    if workers > 1 and len(tasks) > 1:
+        init_args = (mmdb, robots, dict(parser_options), True)
+        with multiprocessing.Pool(min(workers, len(tasks)), initializer=_init_batch_worker, initargs=init_args) as pool:
+            results = pool.starmap(_parse_batch_file, tasks, chunksize=1)
+
+        # os caches dos processos são combinados ao cache persistido
+        if ua_cache_path:
+            cache.merge_files(
+                ua_cache_path,
+                sorted(glob.glob(glob.escape(ua_cache_path) + '.worker-*')),
+                max_size=parser_options.get('ua_cache_size', values.UA_CACHE_SIZE),
+            )
+    else:
+        _init_batch_worker(mmdb, robots, dict(parser_options))
+        results = [_parse_batch_file(*t) for t in tasks]
+
+    summary_path = os.path.join(output_directory, f'batch.{datetime.datetime.utcnow().timestamp()}.summary')
+    save_batch_summary(summary_path, results, time.time() - start)
+
+    loaded = sum(1 for r in results if r[1] == values.LOGFILE_STATUS_LOADED)
+    logging.info(f'Lote processado em {time.time() - start} segundos: {loaded} de {len(results)} arquivos carregados, resumo em {summary_path}')
+
+    return summary_path
 
 
 def main():
@@ -94,6 +341,88 @@ def main():
         help='Diretório de saída',
     )
 
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=WORKERS,
+        help='Número de processos usados para processar cada arquivo de log',
+    )
+
+    parser.add_argument(
+        '--output_format',
+        choices=values.OUTPUT_FORMATS,
+        default=OUTPUT_FORMAT,
+        help='Formato do arquivo de saída: tabular (tsv) ou colunar binário (col)',
+    )
+
+    parser.add_argument(
+        '--checkpoint_interval',
+        type=int,
+        default=None,
+        help=f'Número de linhas entre checkpoints usados para retomar processamentos interrompidos (0 desativa; padrão {CHECKPOINT_INTERVAL} no modo de arquivo e {RESUMABLE_CHECKPOINT_INTERVAL} nos modos de lote e de banco de dados)',
+    )
+
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Grava, ao lado do resumo, o tempo de cada etapa do processamento de linhas e as linhas mais lentas (arquivo .profile)',
+    )
+
+    parser.add_argument(
+        '--profile_slowest_lines',
+        type=int,
+        default=PROFILE_SLOWEST_LINES,
+        help='Número de linhas mais lentas gravadas no perfil',
+    )
+
+    parser.add_argument(
+        '--evaluation_mode',
+        choices=values.EVALUATION_MODES,
+        default=EVALUATION_MODE,
+        help='Modo de avaliação das linhas: full conta todos os motivos de descarte de cada linha (auditoria); short_circuit interrompe a avaliação no primeiro motivo, contando apenas o motivo principal',
+    )
+
+    parser.add_argument(
+        '--readahead_buffer_size',
+        type=int,
+        default=READAHEAD_BUFFER_SIZE,
+        help='Tamanho, em bytes, dos blocos descompactados antecipadamente de arquivos gzip e bz2 (0 desativa a leitura antecipada)',
+    )
+
+    parser.add_argument(
+        '--readahead_queue_size',
+        type=int,
+        default=READAHEAD_QUEUE_SIZE,
+        help='Número máximo de blocos descompactados mantidos em memória',
+    )
+
+    parser.add_argument(
+        '--ua_cache_size',
+        type=int,
+        default=UA_CACHE_SIZE,
+        help='Número máximo de user agents mantidos em cache',
+    )
+
+    parser.add_argument(
+        '--ua_cache_path',
+        default=UA_CACHE_PATH,
+        help='Arquivo em que o cache de user agents é persistido entre execuções',
+    )
+
+    parser.add_argument(
+        '--geoip_cache_size',
+        type=int,
+        default=GEOIP_CACHE_SIZE,
+        help='Número máximo de IPs mantidos em cache de geolocalização',
+    )
+
+    parser.add_argument(
+        '--geoip_prefix_cache',
+        action='store_true',
+        help='Mantém cache de códigos de país por prefixo de rede (/24 e /48)',
+    )
+
     subparsers = parser.add_subparsers(
         title='mode',
     )
@@ -106,6 +435,32 @@ def main():
         help='Caminho de arquivo de log de acesso',
     )
 
+    batch_parser = subparsers.add_parser('batch', help='Modo de lote (o parâmetro -w indica o número de arquivos processados simultaneamente)')
+
+    batch_parser.add_argument(
+        '-d',
+        '--directories',
+        nargs='+',
+        default=[],
+        help='Diretórios de arquivos de log de acesso',
+    )
+
+    batch_parser.add_argument(
+        '-g',
+        '--patterns',
+        nargs='+',
+        default=[],
+        help='Padrões glob de arquivos de log de acesso',
+    )
+
+    batch_parser.add_argument(
+        '-l',
+        '--list_files',
+        nargs='+',
+        default=[],
+        help='Arquivos com caminhos de arquivos de log de acesso, um por linha',
+    )
+
     database_parser = subparsers.add_parser('database', help='Modo de banco de dados')
 
     database_parser.add_argument(
@@ -122,6 +477,13 @@ def main():
         help='Acrônimo de coleção',
     )
 
+    database_parser.add_argument(
+        '--status_flush_interval',
+        type=int,
+        default=STATUS_FLUSH_INTERVAL,
+        help='Número de arquivos processados cujos status são gravados de uma vez no banco de dados',
+    )
+
     args = parser.parse_args()
 
     logging.basicConfig(
@@ -130,9 +492,17 @@ def main():
         datefmt='%d/%b/%Y %H:%M:%S',
     )
 
+    # sem --checkpoint_interval, vale o padrão de cada modo
+    if args.checkpoint_interval is None:
+        del args.checkpoint_interval
+
     if getattr(args, 'logfile', None):
         logging.info('Inicializado em modo de arquivo')
         parse_file(**args.__dict__)
+    elif any(getattr(args, a, None) for a in ('directories', 'patterns', 'list_files')):
+        logging.info('Inicializado em modo de lote')
+        parse_batch(**args.__dict__)
     elif getattr(args, 'str_connection', None):
         logging.info('Inicializado em modo de banco de dados')
         parse_files_db(**args.__dict__)
+        db.dispose()
@@ -0,0 +1,134 @@
+import heapq
+import itertools
+import time
+
+
+STAGE_OTHER = 'other'
+
+MAX_LINE_LENGTH = 1000
+
+
+class StageProfiler:
+    """
+    Records the time and the number of calls of the stages of parse_line, and the slowest lines.
+
+    Stages are measured by wrapping the methods that implement them, so a parser
+    that is not profiled runs unchanged. The time of a stage called by another
+    stage (e.g. robots, called by the user agent detection) is only counted in
+    the inner stage. The time of a line that is not spent in any stage is counted
+    in the 'other' stage.
+
+    Parameters:
+    -----------
+        slowest_lines (int): Number of slowest lines kept.
+    """
+    def __init__(self, slowest_lines=20):
+        self.slowest_lines = slowest_lines
+        self.reset()
+
+    def reset(self):
+        self.__seconds = {}
+        self.__calls = {}
+        self.__lines = 0
+        self.__total = 0.0
+        self.__slowest = []
+        self.__counter = itertools.count()
+        self.__stack = []
+        self.__line_stages = None
+
+    @property
+    def lines(self):
+        return self.__lines
+
+    @property
+    def total_time(self):
+        return self.__total
+
+    def _add(self, stage, seconds):
+        self.__seconds[stage] = self.__seconds.get(stage, 0.0) + seconds
+        self.__calls[stage] = self.__calls.get(stage, 0) + 1
+
+        if self.__line_stages is not None:
+            self.__line_stages[stage] = self.__line_stages.get(stage, 0.0) + seconds
+
+    def wrap_stage(self, func, stage):
+        def wrapper(*args, **kwargs):
+            self.__stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                inner = self.__stack.pop()
+                if self.__stack:
+                    self.__stack[-1] += elapsed
+                self._add(stage, elapsed - inner)
+        return wrapper
+
+    def wrap_line(self, func):
+        def wrapper(line):
+            self.__stack.append(0.0)
+            self.__line_stages = {}
+            start = time.perf_counter()
+            try:
+                return func(line)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.__stack.pop()
+                self._add(STAGE_OTHER, elapsed - sum(self.__line_stages.values()))
+                self._record_line(line, elapsed, self.__line_stages)
+                self.__line_stages = None
+        return wrapper
+
+    def _record_line(self, line, seconds, stages):
+        self.__lines += 1
+        self.__total += seconds
+
+        if self.slowest_lines <= 0:
+            return
+
+        if len(self.__slowest) < self.slowest_lines:
+            heapq.heappush(self.__slowest, (seconds, next(self.__counter), line, stages))
+        elif seconds > self.__slowest[0][0]:
+            heapq.heapreplace(self.__slowest, (seconds, next(self.__counter), line, stages))
+
+    def get_stages(self):
+        """
+        Returns:
+        --------
+            list: (stage, seconds, calls) tuples, from the slowest stage to the fastest one.
+        """
+        return sorted(
+            ((s, self.__seconds[s], self.__calls[s]) for s in self.__seconds),
+            key=lambda x: x[1],
+            reverse=True,
+        )
+
+    def get_slowest_lines(self):
+        """
+        Returns:
+        --------
+            list: (seconds, slowest stage, seconds of the slowest stage, line) tuples, from the slowest line.
+        """
+        slowest = []
+
+        for seconds, _, line, stages in sorted(self.__slowest, reverse=True):
+            stage, stage_seconds = max(stages.items(), key=lambda x: x[1])
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', errors='replace')
+            slowest.append((seconds, stage, stage_seconds, line.strip()[:MAX_LINE_LENGTH]))
+
+        return slowest
+
+    def save(self, path, sep='\t'):
+        with open(path, 'w') as fout:
+            fout.write(sep.join(['stage', 'seconds', 'calls', 'share']) + '\n')
+            for stage, seconds, calls in self.get_stages():
+                share = seconds / self.__total if self.__total else 0.0
+                fout.write(sep.join([stage, f'{seconds:.6f}', str(calls), f'{share:.4f}']) + '\n')
+            fout.write(sep.join(['total', f'{self.__total:.6f}', str(self.__lines), '1.0000']) + '\n')
+
+            fout.write('\n')
+            fout.write(sep.join(['line_seconds', 'slowest_stage', 'stage_seconds', 'line']) + '\n')
+            for seconds, stage, stage_seconds, line in self.get_slowest_lines():
+                fout.write(sep.join([f'{seconds:.6f}', stage, f'{stage_seconds:.6f}', line]) + '\n')
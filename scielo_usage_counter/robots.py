@@ -0,0 +1,164 @@
+import re
+
+
+_META_CHARS = set('\\^$.|?*+()[]{}')
+
+_OPTIONAL_QUANTIFIERS = set('?*{')
+
+
+def _scan_literal(pattern):
+    """
+    Read the literal text at the start of a pattern.
+
+    Returns:
+    --------
+        tuple: (literal, is_complete), where is_complete indicates that the whole pattern is the literal.
+    """
+    i = 1 if pattern.startswith('^') else 0
+    chars = []
+
+    while i < len(pattern):
+        c = pattern[i]
+
+        if c == '\\' and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            char, nxt = pattern[i + 1], i + 2
+        elif c in _META_CHARS:
+            break
+        else:
+            char, nxt = c, i + 1
+
+        # a quantifier can make the last character optional
+        if nxt < len(pattern) and pattern[nxt] in _OPTIONAL_QUANTIFIERS:
+            break
+
+        chars.append(char)
+        i = nxt
+
+    return ''.join(chars), i == len(pattern) and not pattern.startswith('^')
+
+
+def _has_top_level_alternation(pattern):
+    depth = 0
+    in_class = False
+    escaped = False
+
+    for c in pattern:
+        if escaped:
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif in_class:
+            in_class = c != ']'
+        elif c == '[':
+            in_class = True
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            return True
+
+    return False
+
+
+def _build_trie_pattern(words):
+    trie = {}
+    for w in words:
+        node = trie
+        for c in w:
+            node = node.setdefault(c, {})
+        node[''] = None
+
+    def _build(node):
+        # any word ending here already matches, so longer words are redundant
+        if '' in node:
+            return ''
+
+        branches = [re.escape(c) + _build(child) for c, child in sorted(node.items())]
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+
+    return _build(trie)
+
+
+class RobotsMatcher:
+    """
+    Single-pass matcher for a list of robots patterns.
+
+    Patterns that are plain ASCII literals are merged into one trie-shaped
+    regular expression, searched once per user agent. The remaining patterns
+    are only searched when the literal text they must start with is present in
+    the user agent. The verdict is the same as searching every pattern one by one.
+
+    Parameters:
+    -----------
+        robots (iterable): Compiled patterns, as returned by resource_utils.load_robots.
+    """
+    def __init__(self, robots):
+        self.__robots = list(robots)
+        self.__literals = {}
+        self.__literal_patterns = []
+        self.__fallback = []
+
+        for regex in self.__robots:
+            literal, is_complete = _scan_literal(regex.pattern)
+
+            if not literal.isascii() or _has_top_level_alternation(regex.pattern):
+                literal, is_complete = '', False
+
+            if is_complete and literal and regex.flags & re.IGNORECASE:
+                self.__literals.setdefault(literal.lower(), regex.pattern)
+                self.__literal_patterns.append(regex)
+            else:
+                self.__fallback.append((literal.lower(), regex))
+
+        self.__combined = None
+        self.__combined_ignorecase = None
+        if self.__literals:
+            trie_pattern = _build_trie_pattern(self.__literals.keys())
+            # searched on the lowercased text of ASCII user agents, which is much faster than IGNORECASE
+            self.__combined = re.compile(trie_pattern)
+            self.__combined_ignorecase = re.compile(trie_pattern, re.IGNORECASE)
+
+    def __iter__(self):
+        return iter(self.__robots)
+
+    def __len__(self):
+        return len(self.__robots)
+
+    def _match_literals(self, user_agent, lowered):
+        if lowered is not None:
+            m = self.__combined.search(lowered)
+            return self.__literals[m.group(0)] if m else None
+
+        m = self.__combined_ignorecase.search(user_agent)
+        if m:
+            for regex in self.__literal_patterns:
+                if regex.search(user_agent):
+                    return regex.pattern
+
+        return None
+
+    def match(self, user_agent):
+        """
+        Return the robots pattern that matches the user agent, or None.
+        """
+        # lowercasing is only equivalent to IGNORECASE for ASCII text
+        lowered = user_agent.lower() if user_agent.isascii() else None
+
+        if self.__combined is not None:
+            pattern = self._match_literals(user_agent, lowered)
+            if pattern is not None:
+                return pattern
+
+        for literal, regex in self.__fallback:
+            if literal and lowered is not None and literal not in lowered:
+                continue
+            if regex.search(user_agent):
+                return regex.pattern
+
+        return None
+
+    def is_bot(self, user_agent):
+        return self.match(user_agent) is not None
@@ -0,0 +1,141 @@
+import collections
+import datetime
+
+from . import values
+
+
+MAX_CACHED_DAYS = 4096
+
+SessionHit = collections.namedtuple('SessionHit', ['window', 'session', 'server_time', 'latitude', 'longitude', 'action_name'])
+
+
+class SessionBuilder:
+    """
+    Groups the hits of an IP-sorted pretable into COUNTER R5 user-sessions and removes double-clicks.
+
+    A user-session is identified by the IP, the browser and the hour of the access. A click on
+    the same action in the same session within double_click_seconds of the previous one is a
+    double-click and is not emitted.
+
+    Only the current IP is kept in memory. When its hits are also sorted by time, as in the
+    ip_time sort mode, sessions of past hours and clicks older than double_click_seconds are
+    dropped as well, so that memory does not grow with very active IPs (NAT gateways, proxies).
+    If a hit of an IP is older than the previous one, as in the compat sort mode, the state of
+    that IP is kept until the next IP and double-clicks are found in both directions.
+
+    Each emitted hit carries a window number, which changes whenever all the previous sessions
+    are over, so that consumers can drop per-session state at the same points.
+
+    Parameters:
+    -----------
+        double_click_seconds (int): Double-click interval.
+    """
+    def __init__(self, double_click_seconds=values.DOUBLE_CLICK_SECONDS):
+        self.double_click_seconds = double_click_seconds
+        self.hits = 0
+        self.double_clicks = 0
+        self.out_of_order_hits = 0
+        self.sessions = 0
+        self.__window = 0
+        self.__ip = None
+        self.__hour = None
+        self.__last_time = None
+        self.__ordered = True
+        self.__sessions = {}
+        self.__last_clicks = {}
+        self.__clicks = collections.deque()
+        self.__days = {}
+
+    @property
+    def window(self):
+        return self.__window
+
+    @property
+    def tracked_clicks(self):
+        """
+        Number of clicks kept to find double-clicks.
+        """
+        return len(self.__last_clicks)
+
+    def _new_window(self):
+        self.__window += 1
+        self.__hour = None
+        self.__sessions.clear()
+        self.__last_clicks.clear()
+        self.__clicks.clear()
+
+    def _seconds(self, server_time):
+        day = self.__days.get(server_time[:10])
+        if day is None:
+            if len(self.__days) >= MAX_CACHED_DAYS:
+                self.__days.clear()
+            day = self.__days[server_time[:10]] = datetime.date.fromisoformat(server_time[:10]).toordinal() * 86400
+
+        return day + int(server_time[11:13]) * 3600 + int(server_time[14:16]) * 60 + int(server_time[17:19])
+
+    def push(self, server_time, browser_name, browser_version, ip, latitude, longitude, action_name):
+        """
+        Returns:
+        --------
+            SessionHit: The hit with its session, or None if it is a double-click.
+        """
+        if ip != self.__ip:
+            self._new_window()
+            self.__ip = ip
+            self.__ordered = True
+            self.__last_time = server_time
+        elif server_time < self.__last_time:
+            self.out_of_order_hits += 1
+            if self.__ordered:
+                self.__ordered = False
+                self.__clicks.clear()
+        else:
+            self.__last_time = server_time
+
+        hour = server_time[:13]
+        if self.__ordered and hour != self.__hour:
+            # sessions of the previous hours are over
+            if self.__hour is not None:
+                self._new_window()
+            self.__hour = hour
+
+        session_key = (browser_name, browser_version, hour)
+        session = self.__sessions.get(session_key)
+        if session is None:
+            self.sessions += 1
+            session = self.__sessions[session_key] = self.sessions
+
+        try:
+            seconds = self._seconds(server_time)
+        except ValueError:
+            seconds = None
+
+        if seconds is not None:
+            click_key = (session, action_name)
+            last_seconds = self.__last_clicks.get(click_key)
+            self.__last_clicks[click_key] = seconds
+
+            if self.__ordered:
+                clicks = self.__clicks
+                clicks.append((seconds, click_key))
+                while clicks[0][0] < seconds - self.double_click_seconds:
+                    old_seconds, old_key = clicks.popleft()
+                    if self.__last_clicks.get(old_key) == old_seconds:
+                        del self.__last_clicks[old_key]
+
+            if last_seconds is not None and abs(seconds - last_seconds) <= self.double_click_seconds:
+                self.double_clicks += 1
+                return None
+
+        self.hits += 1
+        return SessionHit(self.__window, session, server_time, latitude, longitude, action_name)
+
+    def iter_hits(self, rows):
+        """
+        Yields the session hits of rows in the values.PRETABLE_FILE_HEADER order, without the double-clicks.
+        """
+        push = self.push
+        for row in rows:
+            hit = push(*row)
+            if hit is not None:
+                yield hit
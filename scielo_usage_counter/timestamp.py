@@ -0,0 +1,141 @@
+import datetime
+
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+
+NCSA_DATE_FORMAT = '%d/%b/%Y:%H:%M:%S'
+
+OUTPUT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SECONDS_PER_DAY = 86400
+
+MAX_CACHED_DAYS = 4096
+
+
+def timedelta_from_timezone(timezone):
+    timezone = int(timezone)
+    sign = 1 if timezone >= 0 else -1
+    n = abs(timezone)
+
+    hours = n // 100 * sign
+    minutes = n % 100 * sign
+
+    return datetime.timedelta(hours=hours, minutes=minutes)
+
+
+def legacy_format_date(date, timezone):
+    """
+    Convert a NCSA date and timezone to a UTC date string with strptime and strftime.
+    """
+    try:
+        date = datetime.datetime.strptime(date, NCSA_DATE_FORMAT)
+        date -= timedelta_from_timezone(timezone)
+        return date.strftime(OUTPUT_DATE_FORMAT)
+    except:
+        return
+
+
+class TimestampConverter:
+    """
+    Converts NCSA dates ('DD/Mon/YYYY:HH:MM:SS') and timezones ('-0300') to UTC
+    date strings ('YYYY-MM-DD HH:MM:SS').
+
+    Dates in the fixed-width format are sliced and converted with integer
+    arithmetic. Timezone offsets, the ordinal of each day and the string of
+    each UTC day are cached, since they rarely change within a log file.
+    Other inputs, such as single-digit days, are converted by legacy_format_date.
+    The month abbreviations are always English, whatever the locale.
+    """
+    def __init__(self):
+        self.__offsets = {}
+        self.__days = {}
+        self.__day_strings = {}
+
+    def _offset(self, timezone):
+        offset = self.__offsets.get(timezone)
+
+        if offset is None:
+            offset = int(timedelta_from_timezone(timezone).total_seconds())
+            self.__offsets[timezone] = offset
+
+        return offset
+
+    def _day_ordinal(self, day_prefix):
+        ordinal = self.__days.get(day_prefix)
+
+        if ordinal is None:
+            if len(self.__days) >= MAX_CACHED_DAYS:
+                self.__days.clear()
+
+            month = MONTHS.get(day_prefix[3:6].lower())
+            if month is None or not day_prefix[:2].isdigit() or not day_prefix[7:].isdigit():
+                ordinal = 0
+            else:
+                try:
+                    ordinal = datetime.date(int(day_prefix[7:]), month, int(day_prefix[:2])).toordinal()
+                except ValueError:
+                    ordinal = 0
+            self.__days[day_prefix] = ordinal
+
+        return ordinal
+
+    def _day_string(self, ordinal):
+        day_string = self.__day_strings.get(ordinal)
+
+        if day_string is None:
+            if len(self.__day_strings) >= MAX_CACHED_DAYS:
+                self.__day_strings.clear()
+
+            day = datetime.date.fromordinal(ordinal)
+            day_string = day.isoformat() if day.year >= 1000 else ''
+            self.__day_strings[ordinal] = day_string
+
+        return day_string
+
+    def convert(self, date, timezone):
+        """
+        Convert a NCSA date and timezone to a UTC date string.
+
+        Returns:
+        --------
+            str or None: The UTC date string, or None when the date is invalid.
+        """
+        if (
+            not date or len(date) != 20 or not date.isascii() or
+            date[2] != '/' or date[6] != '/' or date[11] != ':' or date[14] != ':' or date[17] != ':'
+        ):
+            return legacy_format_date(date, timezone)
+
+        ordinal = self._day_ordinal(date[:11])
+
+        hour, minute, second = date[12:14], date[15:17], date[18:20]
+        if not ordinal or not (hour.isdigit() and minute.isdigit() and second.isdigit()):
+            return legacy_format_date(date, timezone)
+
+        hour, minute, second = int(hour), int(minute), int(second)
+        if hour > 23 or minute > 59 or second > 59:
+            return legacy_format_date(date, timezone)
+
+        try:
+            offset = self._offset(timezone)
+        except (TypeError, ValueError, OverflowError):
+            return
+
+        seconds = hour * 3600 + minute * 60 + second - offset
+        days, seconds = divmod(seconds, SECONDS_PER_DAY)
+
+        try:
+            day_string = self._day_string(ordinal + days)
+        except (ValueError, OverflowError):
+            return legacy_format_date(date, timezone)
+
+        if not day_string:
+            return legacy_format_date(date, timezone)
+
+        hour, seconds = divmod(seconds, 3600)
+        minute, second = divmod(seconds, 60)
+
+        return f'{day_string} {hour:02d}:{minute:02d}:{second:02d}'
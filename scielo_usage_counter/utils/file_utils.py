@@ -1,9 +1,17 @@
 import bz2
 import datetime
+import glob
+import io
+import json
+import logging
 import magic
 import os
 import gzip
+import queue
+import re
 import shutil
+import threading
+import time
 
 from scielo_usage_counter import exceptions, values
 
@@ -40,18 +48,199 @@ def get_mimetype(file_path):
         return magic.from_buffer(fin.read(2048), mime=True)
 
 
-def open_logfile(file_path):
+class ReadaheadReader:
+    """
+    Binary line reader that reads a file in a background thread.
+
+    The thread reads (and, for gzip and bz2 files, decompresses) buffers of
+    buffer_size bytes, cuts them after their last line break and puts them in
+    a queue of at most queue_size buffers. Since zlib and bz2 release the GIL
+    while decompressing, decompression overlaps with the parsing of the lines
+    in the main thread. Memory use is bounded by about
+    (queue_size + 2) * buffer_size bytes.
+
+    Lines are split only at b'\\n' and keep it, as when iterating over the file itself.
+    tell returns the offset of the next line in the (decompressed) file, and seek is
+    only supported before the first read, which is enough to resume from a checkpoint.
+
+    Parameters:
+    -----------
+        fileobj (file object): A file opened in binary mode.
+        buffer_size (int): Size, in bytes, of each read.
+        queue_size (int): Maximum number of buffers read ahead.
+    """
+    def __init__(self, fileobj, buffer_size=values.READAHEAD_BUFFER_SIZE, queue_size=values.READAHEAD_QUEUE_SIZE):
+        self.__fileobj = fileobj
+        self.__buffer_size = buffer_size
+        self.__queue = queue.Queue(maxsize=max(1, queue_size))
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__buffer = io.BytesIO()
+        self.__buffer_start = 0
+        self.__buffer_length = 0
+        self.__eof = False
+
+    def _put(self, item):
+        while not self.__stop.is_set():
+            try:
+                self.__queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _read_ahead(self):
+        try:
+            remainder = b''
+            while not self.__stop.is_set():
+                data = self.__fileobj.read(self.__buffer_size)
+                if not data:
+                    if remainder:
+                        self._put(remainder)
+                    break
+
+                data = remainder + data
+                i = data.rfind(b'\n') + 1
+                remainder = data[i:]
+                if i:
+                    self._put(data[:i])
+        except Exception as e:
+            self._put(e)
+            return
+
+        self._put(None)
+
+    def _next_buffer(self):
+        if self.__eof:
+            return False
+
+        if self.__thread is None:
+            # the thread is only started on the first read, after seek and after any process pool is forked
+            self.__thread = threading.Thread(target=self._read_ahead, daemon=True)
+            self.__thread.start()
+
+        item = self.__queue.get()
+        if item is None or isinstance(item, Exception):
+            self.__eof = True
+            if item is not None:
+                raise item
+            return False
+
+        self.__buffer_start += self.__buffer_length
+        self.__buffer_length = len(item)
+        self.__buffer = io.BytesIO(item)
+        return True
+
+    def readline(self):
+        line = self.__buffer.readline()
+        while not line and self._next_buffer():
+            line = self.__buffer.readline()
+        return line
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def tell(self):
+        return self.__buffer_start + self.__buffer.tell()
+
+    def seek(self, offset):
+        if self.__thread is not None:
+            raise io.UnsupportedOperation('seek is only supported before the first read')
+
+        self.__fileobj.seek(offset)
+        self.__buffer_start = offset
+
+    def close(self):
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+        self.__fileobj.close()
+
+
+def open_logfile(file_path, readahead_buffer_size=values.READAHEAD_BUFFER_SIZE, readahead_queue_size=values.READAHEAD_QUEUE_SIZE):
+    """
+    Open a log file. Compressed files are decompressed by a ReadaheadReader thread, unless readahead_buffer_size is zero.
+    """
     file_mime = get_mimetype(file_path)
 
-    if file_mime in ('application/gzip', 'application/x-gzip'):
-        return open_gzip(file_path, 'rb')
-    elif file_mime in ('application/x-bzip2',):
-        return open_bz2(file_path, 'rb')
-    elif file_mime in ('application/text', 'text/plain'):
+    if file_mime in values.MIMETYPES_GZIP:
+        fin = open_gzip(file_path, 'rb')
+    elif file_mime in values.MIMETYPES_BZ2:
+        fin = open_bz2(file_path, 'rb')
+    elif file_mime in values.MIMETYPES_TEXT:
         return open(file_path, 'r')
     else:
         raise exceptions.InvalidLogFileMimeError(f'Arquivo de log inválido: {file_path}')
 
+    if readahead_buffer_size > 0:
+        return ReadaheadReader(fin, readahead_buffer_size, readahead_queue_size)
+    return fin
+
+
+def is_plain_text(file_path):
+    return get_mimetype(file_path) in values.MIMETYPES_TEXT
+
+
+def get_line_aligned_ranges(file_path, chunk_size, start=0):
+    """
+    Split a file into byte ranges whose boundaries fall right after a line break.
+
+    Parameters:
+    -----------
+        file_path (str): Path of an uncompressed file.
+        chunk_size (int): Approximate size, in bytes, of each range.
+        start (int): Offset of the first range, which should be the start of a line.
+
+    Returns:
+    --------
+        list: A list of (start, end) tuples covering the file from start to its end.
+    """
+    size = os.path.getsize(file_path)
+    ranges = []
+
+    with open(file_path, 'rb') as fin:
+        while start < size:
+            end = start + chunk_size
+            if end >= size:
+                end = size
+            else:
+                fin.seek(end - 1)
+                fin.readline()
+                end = fin.tell()
+
+            ranges.append((start, end))
+            start = end
+
+    return ranges
+
+
+def get_logfiles(directories=(), patterns=(), list_files=()):
+    """
+    List log files from directories, glob patterns and files with one path per line.
+
+    Returns:
+    --------
+        list: Paths of existing files, without duplicates, in the order they were found.
+    """
+    paths = []
+
+    for d in directories:
+        paths.extend(sorted(os.path.join(d, f) for f in os.listdir(d)))
+
+    for p in patterns:
+        paths.extend(sorted(glob.glob(p)))
+
+    for lf in list_files:
+        with open(lf) as fin:
+            paths.extend(line.strip() for line in fin if line.strip() and not line.startswith('#'))
+
+    return [p for p in dict.fromkeys(paths) if os.path.isfile(p)]
+
 
 def generate_filepath(output_directory, input_filepath, extension='tsv'):
     filename = os.path.basename(input_filepath)
@@ -71,24 +260,159 @@ def create_file_with_header(path, header=[], delimiter='\t'):
         fout.write(delimiter.join(header) + '\n')
 
 
-def _filename_contains_dates(filename, dates):
-    for d in dates:
-        if d in filename or d.replace('-', '') in filename:
-            return True
-    return False
+# dates written as YYYY-MM-DD or YYYYMMDD anywhere in a file name, including overlapping ones
+DATE_IN_FILENAME_PATTERN = re.compile(r'(?=([0-9]{4}-[0-9]{2}-[0-9]{2}|[0-9]{8}))')
+
+# a directory modified less than this before it was scanned is scanned again,
+# since a file created within the same mtime tick would not change its mtime
+MTIME_GRANULARITY_NS = 2 * 10 ** 9
+
+
+def get_dates_from_filename(filename):
+    """
+    Extract the valid dates that appear in a file name.
+
+    Returns:
+    --------
+        list: Sorted dates, as YYYY-MM-DD strings.
+    """
+    dates = set()
+
+    for m in DATE_IN_FILENAME_PATTERN.finditer(filename):
+        digits = m.group(1).replace('-', '')
+        try:
+            date = datetime.date(int(digits[:4]), int(digits[4:6]), int(digits[6:]))
+        except ValueError:
+            continue
+
+        if date.year >= 1000:
+            dates.add(date.isoformat())
+
+    return sorted(dates)
+
+
+class ProcessedFilesIndex:
+    """
+    Index of the processed log files of a directory by the dates in their names.
+
+    The directory is scanned once and the dates of each file name are extracted once,
+    so that the files of a date are found with dictionary lookups. When index_path is given,
+    the index is persisted, and loaded again while the directory modification time does not change;
+    otherwise only the names that are new in the directory are parsed.
+
+    Parameters:
+    -----------
+        directory (str): Directory of processed log files.
+        extension (str or tuple): Extension, or extensions, of the indexed files.
+        index_path (str): File in which the index is persisted (optional).
+    """
+    def __init__(self, directory, extension='tsv', index_path=None):
+        self.directory = directory
+        self.extension = extension
+        self.index_path = index_path
+
+        self.__files = {}
+        self.__dates = {}
+        self.__mtime_ns = None
+        self.__scanned_ns = None
+
+        if index_path:
+            self._load()
+        self.refresh()
+
+    def _extensions(self):
+        return sorted(self.extension) if isinstance(self.extension, (tuple, list, set)) else [self.extension]
+
+    def _load(self):
+        try:
+            with open(self.index_path) as fin:
+                data = json.load(fin)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f'Índice {self.index_path} não pôde ser lido: {e}')
+            return
+
+        if data.get('directory') != os.path.abspath(self.directory) or data.get('extensions') != self._extensions():
+            return
+
+        self.__files = data.get('files', {})
+        self.__mtime_ns = data.get('mtime_ns')
+        self.__scanned_ns = data.get('scanned_ns')
+
+    def save(self):
+        tmp_path = self.index_path + '.tmp'
+
+        with open(tmp_path, 'w') as fout:
+            json.dump({
+                'directory': os.path.abspath(self.directory),
+                'extensions': self._extensions(),
+                'mtime_ns': self.__mtime_ns,
+                'scanned_ns': self.__scanned_ns,
+                'files': self.__files,
+            }, fout)
+
+        os.replace(tmp_path, self.index_path)
+
+    def _is_up_to_date(self, mtime_ns):
+        return (
+            self.__mtime_ns == mtime_ns and
+            self.__scanned_ns is not None and
+            self.__scanned_ns - mtime_ns > MTIME_GRANULARITY_NS
+        )
+
+    def refresh(self):
+        """
+        Scan the directory again when it was modified since the last scan.
+
+        Returns:
+        --------
+            bool: Whether the directory was scanned.
+        """
+        mtime_ns = os.stat(self.directory).st_mtime_ns
+        scanned = not self._is_up_to_date(mtime_ns)
+
+        if scanned:
+            scanned_ns = time.time_ns()
+            extension = tuple(self._extensions())
+
+            with os.scandir(self.directory) as entries:
+                names = [e.name for e in entries if e.name.endswith(extension)]
+
+            self.__files = {n: self.__files[n] if n in self.__files else get_dates_from_filename(n) for n in names}
+            self.__mtime_ns = mtime_ns
+            self.__scanned_ns = scanned_ns
+
+            if self.index_path:
+                self.save()
+
+        if scanned or not self.__dates:
+            self.__dates = {}
+            for name, dates in self.__files.items():
+                for d in dates:
+                    self.__dates.setdefault(d, []).append(name)
+
+        return scanned
+
+    def __len__(self):
+        return len(self.__files)
+
+    def get_files(self, date, interval=2):
+        """
+        Returns:
+        --------
+            list: Sorted paths of the files whose names contain the date or one of the interval days before or after it.
+        """
+        names = set()
+
+        for i in range(-interval, interval + 1):
+            names.update(self.__dates.get((date + datetime.timedelta(days=i)).strftime('%Y-%m-%d'), ()))
+
+        return [os.path.join(self.directory, n) for n in sorted(names)]
 
 
 def get_processed_files(date, processed_logs_directory: str, extension='tsv'):
-    all_days = [date]
-    
-    for i in range(1, 3):
-        all_days.append(date + datetime.timedelta(days=-i))
-        all_days.append(date + datetime.timedelta(days=+i))
-
-    all_days_str = [d.strftime('%Y-%m-%d') for d in all_days]
-    files = [f for f in os.listdir(processed_logs_directory) if f.endswith(extension)]
-
-    return [os.path.join(processed_logs_directory, f) for f in files if _filename_contains_dates(f, all_days_str)]
+    return ProcessedFilesIndex(processed_logs_directory, extension).get_files(date)
 
 
 def translate_date_to_output_path(date, output_directory, posfix='', extension='tsv'):
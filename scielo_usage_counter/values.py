@@ -140,6 +140,73 @@ PRETABLE_FILE_HEADER = [
     'actionName'
 ]
 
+MIMETYPES_GZIP = ('application/gzip', 'application/x-gzip')
+MIMETYPES_BZ2 = ('application/x-bzip2',)
+MIMETYPES_TEXT = ('application/text', 'text/plain')
+
+UA_CACHE_SIZE = 100000
+UA_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+GEOIP_CACHE_SIZE = 200000
+
+LOG_FORMAT_SNIFF_LINES = 100
+
+# checkpoints are off for a single file and on for the database and batch modes, which resume interrupted runs
+CHECKPOINT_INTERVAL = 0
+RESUMABLE_CHECKPOINT_INTERVAL = 1000000
+
+READAHEAD_BUFFER_SIZE = 4 * 1024 * 1024
+READAHEAD_QUEUE_SIZE = 4
+
+PROFILE_SLOWEST_LINES = 20
+
+OUTPUT_FORMAT_TSV = 'tsv'
+OUTPUT_FORMAT_COLUMNAR = 'col'
+OUTPUT_FORMATS = (OUTPUT_FORMAT_TSV, OUTPUT_FORMAT_COLUMNAR)
+
+# full: every check runs on every matched line and every reason for ignoring it is counted
+# short_circuit: checks run from the cheapest to the most expensive and stop at the first failed one,
+#   so only the primary reason of each ignored line is counted
+EVALUATION_MODE_FULL = 'full'
+EVALUATION_MODE_SHORT_CIRCUIT = 'short_circuit'
+EVALUATION_MODES = (EVALUATION_MODE_FULL, EVALUATION_MODE_SHORT_CIRCUIT)
+
+PARSED_FILE_HEADER = [
+    'server_date',
+    'browser_name',
+    'browser_version',
+    'user_ip',
+    'country_code',
+    'action_name',
+]
+
+PRETABLE_TO_PARSED_FILE_HEADER = {
+    'serverTime': 'server_date',
+    'browserName': 'browser_name',
+    'browserVersion': 'browser_version',
+    'ip': 'user_ip',
+    'actionName': 'action_name',
+}
+
+DB_POOL_SIZE = 5
+DB_POOL_MAX_OVERFLOW = 5
+DB_POOL_RECYCLE = 3600
+DB_STATUS_FLUSH_INTERVAL = 100
+
+DB_LOADER_BATCH_SIZE = 1000
+DB_LOADER_WORKERS = 1
+DB_LOADER_MAX_RETRIES = 5
+DB_LOADER_RETRY_WAIT = 0.5
+
+METRIC_FORMAT_HTML = 'html'
+METRIC_FORMAT_PDF = 'pdf'
+METRIC_UNKNOWN_LANGUAGE = 'un'
+METRIC_MAX_KEYS = 2000000
+METRIC_BATCH_SIZE = 10000
+
+# COUNTER R5: clicks on the same link in the same user-session within this interval count once
+DOUBLE_CLICK_SECONDS = 30
+
 LOGFILE_STATUS_QUEUE = 0
 LOGFILE_STATUS_PARTIAL = 1
 LOGFILE_STATUS_LOADED = 2
@@ -1,30 +1,33 @@
 #!/usr/bin/env bash
 help(){
 	echo "SciELO Usage COUNTER - Batch script Generate Pretable"
-	echo "Please, inform the output directory (parameter -o) and directory containing preprocessed log files (parameter -d). For example: "
+	echo "Please, inform the output directory (parameter -o), directory containing preprocessed log files (parameter -d) and, optionally, the geolocation map (parameter -m). For example: "
 	echo ""
-	echo "   scripts/batch_generate_pretable.sh -d /home/user/preprocessed_dir -o /home/user/output_dir"
+	echo "   scripts/batch_generate_pretable.sh -d /home/user/preprocessed_dir -o /home/user/output_dir -m /home/user/map.mmdb"
 	echo ""
 }
 
 run(){
 	DIR_PREPROCESSED_LOGS=$1;
 	DIR_OUTPUT=$2;
+	MMDB=$3;
 	echo "[DIR_PREPROCESSED_LOGS] $DIR_PREPROCESSED_LOGS"
 
 	for i in `ls "$DIR_PREPROCESSED_LOGS"`; do
 		PPLOG=$DIR_PREPROCESSED_LOGS/$i;
 
 		echo "[Processando] $PPLOG";
-		gen-pretable -o $DIR_OUTPUT file -f $PPLOG;
+		gen-pretable -o $DIR_OUTPUT file -f $PPLOG ${MMDB:+-m $MMDB};
 	done
 }
 
-while getopts d:o: opts; do
+while getopts d:o:m: opts; do
 	case ${opts} in
 		# Diretório contendo arquivos de log preprocessados
       	d) DIR_PREPROCESSED_LOGS=${OPTARG} ;;
 		o) DIR_OUTPUT=${OPTARG} ;;
+		# Mapa de geolocalizações
+		m) MMDB=${OPTARG} ;;
 	esac
 done
 
@@ -33,5 +36,5 @@ if [[ -z "$DIR_PREPROCESSED_LOGS" ]]
 		help;
 		exit;
 	else
-		run $DIR_PREPROCESSED_LOGS $DIR_OUTPUT;
+		run $DIR_PREPROCESSED_LOGS $DIR_OUTPUT $MMDB;
 fi
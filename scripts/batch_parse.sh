@@ -19,12 +19,14 @@ run(){
 	OUTPUT_DIR=$3;
 	INPUT=$4;
 
-	for i in `cat "$INPUT"`; do
-		LOGFILE=$i;
+	if [[ -d "$INPUT" ]]; then
+		BATCH_INPUT="-d $INPUT";
+	else
+		BATCH_INPUT="-l $INPUT";
+	fi
 
-		echo "[Processando] $LOGFILE";
-		parse-log -m "$FILE_MMDB" -r "$FILE_ROBOTS" -o "$OUTPUT_DIR" file -f $LOGFILE;
-	done
+	echo "[Processando] $INPUT";
+	parse-log -m "$FILE_MMDB" -r "$FILE_ROBOTS" -o "$OUTPUT_DIR" -w "${WORKERS:-1}" batch $BATCH_INPUT;
 }
 
 while getopts f:m:r:o: opts; do
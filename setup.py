@@ -30,5 +30,7 @@ setup(
         init-db=scielo_usage_counter.proc.initialize_database:main
         parse-log=scielo_usage_counter.proc.parse_log:main
         gen-pretable=scielo_usage_counter.proc.generate_pretable:main
+        run-pipeline=scielo_usage_counter.proc.run_pipeline:main
+        compute-metrics=scielo_usage_counter.proc.compute_metrics:main
     """
 )
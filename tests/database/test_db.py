@@ -1,7 +1,33 @@
 import datetime
+import os
+import random
+import shutil
+import tempfile
 import unittest
 
+from sqlalchemy import event
+
+from scielo_usage_counter import metrics, values
 from scielo_usage_counter.database import db
+from scielo_usage_counter.proc import compute_metrics
+
+import scielo_usage_counter.database.declararive as models
+
+
+CONTROL_TABLES = [
+    models.Collection.__table__,
+    models.ControlLogFile.__table__,
+    models.ControlDateStatus.__table__,
+]
+
+METRIC_TABLES = CONTROL_TABLES + [
+    models.Journal.__table__,
+    models.Article.__table__,
+    models.ArticleFormat.__table__,
+    models.ArticleLanguage.__table__,
+    models.Geolocation.__table__,
+    models.MetricStatus.__table__,
+] + [models.Base.metadata.tables[t] for t in metrics.METRIC_TABLE_KEYS]
 
 
 class TestDB(unittest.TestCase):
@@ -11,3 +37,285 @@ class TestDB(unittest.TestCase):
         expected_pn_dates = [datetime.datetime.strptime(d, '%Y-%m-%d') for d in ['2021-01-01', '2020-12-31', '2021-01-02', '2020-12-30', '2021-01-03']]
 
         self.assertListEqual(obtained_pn_dates, expected_pn_dates)
+
+
+class TestDBConnections(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.str_connection = 'sqlite:///' + os.path.join(self.tmp_dir, 'usage.db')
+        self.connections = 0
+
+        def _count(dbapi_connection, connection_record):
+            self.connections += 1
+        event.listen(db.get_engine(self.str_connection), 'connect', _count)
+
+        db.create_tables(self.str_connection, tables=CONTROL_TABLES)
+
+        with db.session_scope(self.str_connection) as session:
+            session.add(models.Collection(id=1, acronym='scl', name='Brasil'))
+            for i in range(200):
+                session.add(models.ControlLogFile(
+                    collection=1,
+                    full_path=f'/logs/{i}.log.gz',
+                    created_at=datetime.datetime(2024, 1, 1),
+                    size=1,
+                    name=f'{i}.log.gz',
+                    server='node01',
+                    date=datetime.date(2024, 1, 1) + datetime.timedelta(days=i % 30),
+                    status=values.LOGFILE_STATUS_QUEUE,
+                ))
+                if i < 30:
+                    session.add(models.ControlDateStatus(collection=1, date=datetime.date(2024, 1, 1) + datetime.timedelta(days=i), status=values.DATE_STATUS_LOADED))
+
+    def tearDown(self):
+        db.dispose(self.str_connection)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_engine_is_reused(self):
+        self.assertIs(db.get_engine(self.str_connection), db.get_engine(self.str_connection))
+
+    def test_status_updates_reuse_connection(self):
+        logfiles = db.get_non_parsed_logs(self.str_connection, 1)
+        self.assertEqual(len(logfiles), 200)
+
+        for lf in logfiles:
+            db.set_logfile_status(self.str_connection, lf.id, values.LOGFILE_STATUS_LOADED)
+
+        dates = db.get_non_pretable_dates(self.str_connection, 1)
+        self.assertEqual(len(dates), 26)
+        for d in dates:
+            db.set_control_date_status(self.str_connection, 1, d, values.DATE_STATUS_EXTRACTING_PRETABLE)
+
+        self.assertEqual(db.get_non_parsed_logs(self.str_connection, 1), [])
+        self.assertEqual(len(db.get_unsorted_pretables(self.str_connection, 1)), 26)
+        self.assertEqual(db.get_collection_id(self.str_connection, 'scl'), 1)
+        self.assertEqual(db.get_collection_acronym(self.str_connection, 1), 'scl')
+
+        # a single pooled connection serves all the sessions
+        self.assertEqual(self.connections, 1)
+        self.assertEqual(db.get_engine(self.str_connection).pool.checkedout(), 0)
+
+    def test_bulk_status_updates(self):
+        statements = []
+
+        def _record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, executemany))
+        event.listen(db.get_engine(self.str_connection), 'before_cursor_execute', _record)
+
+        flushed = []
+        with db.StatusBuffer(self.str_connection, db.set_logfile_statuses, flush_interval=150) as statuses:
+            for lf in db.get_non_parsed_logs(self.str_connection, 1):
+                statuses.add((lf.id, values.LOGFILE_STATUS_LOADED), on_flush=lambda i=lf.id: flushed.append(i))
+            self.assertEqual(len(statuses), 50)
+            self.assertEqual(len(flushed), 150)
+        self.assertEqual(len(flushed), 200)
+
+        with db.StatusBuffer(self.str_connection, db.set_control_date_statuses) as statuses:
+            for i in range(30):
+                statuses.add((1, datetime.date(2024, 1, 1) + datetime.timedelta(days=i), values.DATE_STATUS_EXTRACTING_PRETABLE))
+
+        updates = [executemany for statement, executemany in statements if statement.startswith('UPDATE')]
+        self.assertListEqual(updates, [True, True, True])
+
+        self.assertEqual(db.get_non_parsed_logs(self.str_connection, 1), [])
+        self.assertEqual(len(db.get_unsorted_pretables(self.str_connection, 1)), 26)
+
+    def test_iter_partial_logfiles(self):
+        statements = []
+
+        def _record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.get_engine(self.str_connection), 'before_cursor_execute', _record)
+
+        logfiles = db.get_non_parsed_logs(self.str_connection, 1)
+        for i, lf in enumerate(db.iter_partial_logfiles(self.str_connection, logfiles, chunk_size=150)):
+            # the file and the rest of its chunk are already partial
+            status = db.get_logfile_status(self.str_connection, lf.id)[0].status
+            self.assertEqual(status, values.LOGFILE_STATUS_PARTIAL)
+            if i == 149:
+                last = db.get_logfile_status(self.str_connection, logfiles[-1].id)[0].status
+                self.assertEqual(last, values.LOGFILE_STATUS_QUEUE)
+
+        self.assertEqual(len([s for s in statements if s.startswith('UPDATE')]), 2)
+        self.assertEqual(len(db.get_non_parsed_logs(self.str_connection, 1)), 200)
+
+    def test_dispose(self):
+        engine = db.get_engine(self.str_connection)
+        db.dispose(self.str_connection)
+        self.assertIsNot(db.get_engine(self.str_connection), engine)
+
+
+class TestDateReadiness(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.str_connection = 'sqlite:///' + os.path.join(self.tmp_dir, 'usage.db')
+        db.create_tables(self.str_connection, tables=CONTROL_TABLES)
+
+        rnd = random.Random(3)
+        statuses = [0, values.DATE_STATUS_LOADED, values.DATE_STATUS_PRETABLE, values.DATE_STATUS_EXTRACTING_PRETABLE]
+
+        with db.session_scope(self.str_connection) as session:
+            session.add(models.Collection(id=1, acronym='scl', name='Brasil'))
+            session.add(models.Collection(id=2, acronym='arg', name='Argentina'))
+            for collection in [1, 2]:
+                for i in range(400):
+                    # some days are missing
+                    if rnd.random() < 0.03:
+                        continue
+                    session.add(models.ControlDateStatus(
+                        collection=collection,
+                        date=datetime.date(2023, 1, 1) + datetime.timedelta(days=i),
+                        status=rnd.choice(statuses) if rnd.random() < 0.3 else values.DATE_STATUS_LOADED,
+                    ))
+
+        self.queries = 0
+
+        def _count(conn, cursor, statement, parameters, context, executemany):
+            self.queries += 1
+        event.listen(db.get_engine(self.str_connection), 'before_cursor_execute', _count)
+
+    def tearDown(self):
+        db.dispose(self.str_connection)
+        shutil.rmtree(self.tmp_dir)
+
+    def _get_enabled_dates_per_date(self, collection, status_value):
+        # one query per neighbour date, as dates were checked before the window query
+        with db.session_scope(self.str_connection) as session:
+            candidates = session.query(models.ControlDateStatus).filter(
+                models.ControlDateStatus.collection == collection,
+                models.ControlDateStatus.status == status_value,
+            ).order_by(models.ControlDateStatus.date.desc())
+
+            enabled_dates = []
+            for cds in candidates:
+                is_valid_date = True
+                for d in db._get_previous_and_next_dates(cds.date):
+                    n = session.query(models.ControlDateStatus).filter(
+                        models.ControlDateStatus.collection == collection,
+                        models.ControlDateStatus.date == d,
+                    ).one_or_none()
+                    if n is None or (n.status != values.DATE_STATUS_EXTRACTING_PRETABLE and n.status < values.DATE_STATUS_LOADED):
+                        is_valid_date = False
+                        break
+                if is_valid_date:
+                    enabled_dates.append(cds.date)
+
+            return enabled_dates
+
+    def test_same_dates_as_per_date_lookups(self):
+        for collection in [1, 2]:
+            expected = self._get_enabled_dates_per_date(collection, values.DATE_STATUS_LOADED)
+            self.queries = 0
+            obtained = db.get_non_pretable_dates(self.str_connection, collection)
+            self.assertListEqual(obtained, expected)
+            self.assertGreater(len(obtained), 100)
+            self.assertLessEqual(self.queries, 2)
+
+            expected = self._get_enabled_dates_per_date(collection, values.DATE_STATUS_EXTRACTING_PRETABLE)
+            self.queries = 0
+            obtained = db.get_unsorted_pretables(self.str_connection, collection)
+            self.assertListEqual(obtained, expected)
+            self.assertGreater(len(obtained), 0)
+            self.assertLessEqual(self.queries, 2)
+
+    def test_no_candidate_dates(self):
+        self.assertListEqual(db.get_non_pretable_dates(self.str_connection, 3), [])
+
+
+class TestComputeMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.str_connection = 'sqlite:///' + os.path.join(self.tmp_dir, 'usage.db')
+        db.create_tables(self.str_connection, tables=METRIC_TABLES)
+
+        with db.session_scope(self.str_connection) as session:
+            session.add(models.Collection(id=1, acronym='scl', name='Brasil'))
+            session.add(models.Journal(id=1, print_issn='0102-6909', electronic_issn='1806-9053', scielo_issn='0102-6909'))
+            session.add(models.Article(id=1, collection=1, pid='S0102-69092018000300512', yop=2018, journal=1))
+            session.add(models.ArticleFormat(id=1, format='html'))
+            session.add(models.ControlDateStatus(collection=1, date=datetime.date(2024, 2, 12), status=values.DATE_STATUS_PRETABLE))
+            session.add(models.ControlDateStatus(collection=1, date=datetime.date(2024, 2, 13), status=values.DATE_STATUS_PRETABLE))
+
+        with open(os.path.join(self.tmp_dir, '2024-02-12.tsv'), 'w') as fout:
+            fout.write('\t'.join(values.PRETABLE_FILE_HEADER) + '\n')
+            for row in [
+                ['2024-02-12 10:00:01', 'CH', '121.0', '1.1.1.1', '-23.5475', '-46.6361', '/scielo.php?script=sci_arttext&pid=S0102-69092018000300512&tlng=pt'],
+                ['2024-02-12 10:00:09', 'CH', '121.0', '1.1.1.1', '-23.5475', '-46.6361', '/scielo.php?script=sci_pdf&pid=S0102-69092018000300512&tlng=pt'],
+                # article not registered, counted only in the journal metrics
+                ['2024-02-12 10:05:00', 'CH', '121.0', '1.1.1.1', '-23.5475', '-46.6361', '/scielo.php?script=sci_arttext&pid=S0102-69092019000100001'],
+                # journal not registered
+                ['2024-02-12 11:00:00', 'FF', '122.0', '2.2.2.2', '', '', '/scielo.php?script=sci_arttext&pid=S1234-56782019000100001'],
+            ]:
+                fout.write('\t'.join(row) + '\n')
+
+    def tearDown(self):
+        db.dispose(self.str_connection)
+        shutil.rmtree(self.tmp_dir)
+
+    def _count(self, model):
+        with db.session_scope(self.str_connection) as session:
+            return session.query(model).count()
+
+    def _compute(self):
+        compute_metrics.compute_metrics_db(self.str_connection, 1, pretables_directory=self.tmp_dir, batch_size=2, skip_rollup=True)
+
+    def test_compute_metrics_db(self):
+        self._compute()
+
+        with db.session_scope(self.str_connection) as session:
+            daily = session.query(models.MetricArticleDaily).one()
+            self.assertEqual(
+                (daily.article, daily.year_month_day, daily.total_item_requests, daily.total_item_investigations, daily.unique_item_requests, daily.unique_item_investigations),
+                (1, datetime.date(2024, 2, 12), 2, 2, 1, 1),
+            )
+
+            journal = session.query(models.MetricJournalDaily).one()
+            self.assertEqual((journal.journal, journal.total_item_requests, journal.unique_item_requests), (1, 3, 2))
+
+            yops = {m.yop: m.total_item_requests for m in session.query(models.MetricJournalDailyYOP)}
+            self.assertDictEqual(yops, {2018: 2, 2019: 1})
+
+            detailed = session.query(models.MetricArticleDetailed).all()
+            self.assertEqual(sorted(m.format for m in detailed), [1, 2])
+            self.assertEqual({m.geolocation for m in detailed}, {1})
+
+            statuses = {c.date: c.status for c in session.query(models.ControlDateStatus)}
+
+        # the pretable of 2024-02-13 does not exist
+        self.assertDictEqual(statuses, {
+            datetime.date(2024, 2, 12): values.DATE_STATUS_COMPUTED,
+            datetime.date(2024, 2, 13): values.DATE_STATUS_PRETABLE,
+        })
+        self.assertEqual(self._count(models.Geolocation), 1)
+        self.assertEqual(self._count(models.ArticleFormat), 2)
+
+    def test_journal_issns(self):
+        self.assertDictEqual(db.get_journal_issns(self.str_connection), {'0102-6909': '0102-6909', '1806-9053': '0102-6909'})
+
+        # one session reads articles whose PIDs start with the print and the electronic ISSN of one journal
+        with open(os.path.join(self.tmp_dir, '2024-02-13.tsv'), 'w') as fout:
+            fout.write('\t'.join(values.PRETABLE_FILE_HEADER) + '\n')
+            for pid in ['S0102-69092018000300512', 'S1806-90532019000100001']:
+                fout.write('\t'.join(['2024-02-13 10:00:01', 'CH', '121.0', '1.1.1.1', '', '', f'/scielo.php?script=sci_arttext&pid={pid}']) + '\n')
+
+        self._compute()
+
+        with db.session_scope(self.str_connection) as session:
+            journal = session.query(models.MetricJournalDaily).filter(models.MetricJournalDaily.year_month_day == datetime.date(2024, 2, 13)).one()
+            self.assertEqual(
+                (journal.journal, journal.total_item_requests, journal.total_item_investigations, journal.unique_item_requests, journal.unique_item_investigations),
+                (1, 2, 2, 2, 2),
+            )
+
+            yops = {m.yop: m.total_item_requests for m in session.query(models.MetricJournalDailyYOP).filter(models.MetricJournalDailyYOP.year_month_day == datetime.date(2024, 2, 13))}
+            self.assertDictEqual(yops, {2018: 1, 2019: 1})
+
+    def test_compute_again_replaces_metrics(self):
+        self._compute()
+        counts = [self._count(models.Base.metadata.tables[t]) for t in metrics.METRIC_TABLE_KEYS]
+
+        db.set_control_date_status(self.str_connection, 1, datetime.date(2024, 2, 12), values.DATE_STATUS_PRETABLE)
+        self._compute()
+
+        self.assertListEqual([self._count(models.Base.metadata.tables[t]) for t in metrics.METRIC_TABLE_KEYS], counts)
+        self.assertEqual(self._count(models.Geolocation), 1)
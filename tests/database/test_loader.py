@@ -0,0 +1,178 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from sqlalchemy import event, select
+from sqlalchemy.exc import OperationalError
+
+from scielo_usage_counter import metrics
+from scielo_usage_counter.database import db, loader
+from tests.database.test_db import METRIC_TABLES
+
+import scielo_usage_counter.database.declararive as models
+
+
+ARTICLE_DAILY = models.MetricArticleDaily.__table__
+
+ARTICLE_DETAILED = models.MetricArticleDetailed.__table__
+
+DAY = datetime.date(2024, 2, 12)
+
+
+class TestBulkLoader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.str_connection = 'sqlite:///' + os.path.join(self.tmp_dir, 'usage.db')
+        db.create_tables(self.str_connection, tables=[ARTICLE_DAILY, ARTICLE_DETAILED])
+        self.statements = []
+
+    def tearDown(self):
+        db.dispose(self.str_connection)
+        shutil.rmtree(self.tmp_dir)
+
+    def _count_statements(self):
+        @event.listens_for(db.get_engine(self.str_connection), 'before_cursor_execute')
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT'):
+                self.statements.append(statement)
+
+    def _rows(self, articles, value, **keys):
+        return [dict(collection=1, year_month_day=DAY, article=a, **keys, **dict.fromkeys(metrics.MEASURES, value)) for a in articles]
+
+    def _measures(self, table):
+        with db.session_scope(self.str_connection) as session:
+            return {r.article: tuple(r._mapping[m] for m in metrics.MEASURES) for r in session.execute(select(table))}
+
+    def test_replace(self):
+        bulk_loader = loader.BulkLoader(self.str_connection, batch_size=4)
+        bulk_loader.upsert(ARTICLE_DAILY, self._rows(range(10), 1))
+        bulk_loader.upsert('metric_article_daily', self._rows(range(5, 15), 3), loader.UPSERT_REPLACE)
+
+        expected = {a: (1,) * 4 if a < 5 else (3,) * 4 for a in range(15)}
+        self.assertDictEqual(self._measures(ARTICLE_DAILY), expected)
+        self.assertEqual(bulk_loader.rows, 20)
+
+    def test_increment(self):
+        bulk_loader = loader.BulkLoader(self.str_connection, batch_size=4)
+        bulk_loader.upsert(ARTICLE_DAILY, self._rows(range(10), 1), loader.UPSERT_INCREMENT)
+        bulk_loader.upsert(ARTICLE_DAILY, self._rows(range(5, 15), 3), loader.UPSERT_INCREMENT)
+        bulk_loader.upsert(ARTICLE_DAILY, self._rows(range(5), -1), loader.UPSERT_INCREMENT)
+
+        expected = {a: (0,) * 4 if a < 5 else (4,) * 4 if a < 10 else (3,) * 4 for a in range(15)}
+        self.assertDictEqual(self._measures(ARTICLE_DAILY), expected)
+
+    def test_null_keys(self):
+        bulk_loader = loader.BulkLoader(self.str_connection)
+        for _ in range(2):
+            bulk_loader.upsert(ARTICLE_DETAILED, self._rows(range(3), 2, format=1, language=None, geolocation=None), loader.UPSERT_INCREMENT)
+            bulk_loader.upsert(ARTICLE_DETAILED, self._rows(range(3), 1, format=1, language=1, geolocation=1), loader.UPSERT_INCREMENT)
+
+        with db.session_scope(self.str_connection) as session:
+            rows = session.execute(select(ARTICLE_DETAILED)).fetchall()
+
+        self.assertEqual(len(rows), 6)
+        self.assertDictEqual(
+            {(r.article, r.language): r.total_item_requests for r in rows},
+            {**{(a, None): 4 for a in range(3)}, **{(a, 1): 2 for a in range(3)}},
+        )
+
+    def test_null_keys_in_bulk(self):
+        self._count_statements()
+        bulk_loader = loader.BulkLoader(self.str_connection, batch_size=40)
+        bulk_loader.upsert(ARTICLE_DETAILED, self._rows(range(100), 1, format=1, language=1, geolocation=None), loader.UPSERT_INCREMENT)
+        bulk_loader.upsert(ARTICLE_DETAILED, self._rows(range(50, 150), 2, format=1, language=1, geolocation=None), loader.UPSERT_INCREMENT)
+
+        # one INSERT per batch, except for the first batch of the second call, whose rows all exist
+        self.assertEqual(len(self.statements), 3 + 2)
+        self.assertEqual(bulk_loader.rows, 200)
+        self.assertDictEqual(
+            {a: m[0] for a, m in self._measures(ARTICLE_DETAILED).items()},
+            {a: 1 if a < 50 else 3 if a < 100 else 2 for a in range(150)},
+        )
+
+    def test_repeated_null_keys(self):
+        bulk_loader = loader.BulkLoader(self.str_connection, batch_size=2)
+        keys = dict(format=1, language=None, geolocation=None)
+
+        bulk_loader.upsert(ARTICLE_DETAILED, self._rows([1, 1, 2], 1, **keys) + self._rows([1], 5, **keys), loader.UPSERT_INCREMENT)
+        self.assertDictEqual(self._measures(ARTICLE_DETAILED), {1: (7,) * 4, 2: (1,) * 4})
+
+        bulk_loader.upsert(ARTICLE_DETAILED, self._rows([1, 2], 4, **keys) + self._rows([1], 3, **keys), loader.UPSERT_REPLACE)
+        self.assertDictEqual(self._measures(ARTICLE_DETAILED), {1: (3,) * 4, 2: (4,) * 4})
+        self.assertEqual(bulk_loader.rows, 7)
+
+    def test_one_statement_per_batch(self):
+        self._count_statements()
+        loader.BulkLoader(self.str_connection, batch_size=40).upsert(ARTICLE_DAILY, self._rows(range(100), 1))
+
+        self.assertEqual(len(self.statements), 3)
+        self.assertEqual(len(self._measures(ARTICLE_DAILY)), 100)
+
+    def test_retry_on_lock(self):
+        bulk_loader = loader.BulkLoader(self.str_connection, max_retries=2, retry_wait=0)
+        attempts = []
+
+        def work(connection):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OperationalError('INSERT', {}, sqlite3.OperationalError('database is locked'))
+            return len(attempts)
+
+        self.assertEqual(bulk_loader._run(work), 2)
+        self.assertEqual(bulk_loader.retries, 1)
+
+    def test_no_retry_on_other_errors(self):
+        bulk_loader = loader.BulkLoader(self.str_connection, max_retries=2, retry_wait=0)
+
+        def work(connection):
+            raise OperationalError('INSERT', {}, sqlite3.OperationalError('no such table: metric_article_daily'))
+
+        with self.assertRaises(OperationalError):
+            bulk_loader._run(work)
+        self.assertEqual(bulk_loader.retries, 0)
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            loader.BulkLoader(self.str_connection).upsert(ARTICLE_DAILY, self._rows(range(1), 1), 'merge')
+
+
+class TestMetricsWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.str_connection = 'sqlite:///' + os.path.join(self.tmp_dir, 'usage.db')
+        db.create_tables(self.str_connection, tables=METRIC_TABLES)
+
+        with db.session_scope(self.str_connection) as session:
+            session.add(models.Collection(id=1, acronym='scl', name='Brasil'))
+            session.add(models.Journal(id=1, print_issn='0100-879X', electronic_issn='1414-431X', scielo_issn='0100-879X'))
+            session.add(models.Article(id=1, collection=1, pid='S0100-879X2018000300001', yop=2018, journal=1))
+
+    def tearDown(self):
+        db.dispose(self.str_connection)
+        shutil.rmtree(self.tmp_dir)
+
+    def _measures(self, table, column):
+        with db.session_scope(self.str_connection) as session:
+            return {r._mapping[column]: tuple(r._mapping[m] for m in metrics.MEASURES) for r in session.execute(select(table))}
+
+    def test_keys_with_the_same_ids_are_summed(self):
+        results = [
+            # two ISSNs of one journal
+            ((metrics.JOURNAL_DAILY, '0100-879X'), [5, 5, 5, 5]),
+            ((metrics.JOURNAL_DAILY, '1414-431X'), [3, 3, 3, 3]),
+            # places without both coordinates have no geolocation
+            ((metrics.ARTICLE_DAILY_GEO, 'S0100-879X2018000300001', ('', '')), [2, 2, 2, 2]),
+            ((metrics.ARTICLE_DAILY_GEO, 'S0100-879X2018000300001', ('-23.5475', '')), [1, 1, 1, 1]),
+        ]
+
+        # in one batch, and across batches, which also rewrites the day
+        for batch_size, written in [(10, 2), (1, 4)]:
+            writer = loader.MetricsWriter(self.str_connection, 1, batch_size=batch_size)
+            writer.write([(k, list(v)) for k, v in results], DAY)
+
+            self.assertEqual(writer.written, written, batch_size)
+            self.assertDictEqual(self._measures(models.MetricJournalDaily.__table__, 'journal'), {1: (8, 8, 8, 8)})
+            self.assertDictEqual(self._measures(models.MetricArticleDailyGeolocation.__table__, 'geolocation'), {None: (3, 3, 3, 3)})
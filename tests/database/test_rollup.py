@@ -0,0 +1,199 @@
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from scielo_usage_counter import metrics, values
+from scielo_usage_counter.database import db, rollup
+from scielo_usage_counter.proc import compute_metrics
+from tests.database.test_db import METRIC_TABLES
+
+import scielo_usage_counter.database.declararive as models
+
+
+# SQLite index names are global, and some monthly tables share index names, so only part of them is tested
+ROLLUPS = [r for r in rollup.ROLLUPS if r.name in ('art_monthly', 'art_monthly_for', 'art_monthly_geo', 'jou_monthly')]
+
+# monthly tables whose unique measures are counted across formats or languages, with different index names
+UNIQUE_ROLLUPS = [r for r in rollup.ROLLUPS if r.name in ('art_monthly_lan', 'art_monthly_geo', 'art_monthly_geo_lan', 'jou_monthly_for')]
+
+ROLLUP_TABLES = METRIC_TABLES + [models.Base.metadata.tables[r.table] for r in ROLLUPS]
+
+DAYS = [datetime.date(2024, 2, 1) + datetime.timedelta(days=i) for i in range(5)] + [datetime.date(2024, 3, 1)]
+
+
+class TestRollup(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.str_connection = 'sqlite:///' + os.path.join(self.tmp_dir, 'usage.db')
+        db.create_tables(self.str_connection, tables=ROLLUP_TABLES)
+
+        rnd = random.Random(7)
+        with db.session_scope(self.str_connection) as session:
+            session.add(models.Collection(id=1, acronym='scl', name='Brasil'))
+            session.add(models.Journal(id=1, print_issn='0102-6909', electronic_issn='1806-9053', scielo_issn='0102-6909'))
+            session.add(models.ArticleFormat(id=1, format='html'))
+            session.add(models.ArticleFormat(id=2, format='pdf'))
+            session.add(models.Geolocation(id=1, latitude='-23.5475', longitude='-46.6361'))
+            for a in range(1, 11):
+                session.add(models.Article(id=a, collection=1, pid=f'S0102-69092018000300{a:03d}', yop=2018, journal=1))
+
+            for day in DAYS:
+                session.add(models.ControlDateStatus(collection=1, date=day, status=values.DATE_STATUS_COMPUTED))
+                for a in range(1, 11):
+                    for f in [1, 2]:
+                        # detailed rows without geolocation have a NULL key column
+                        for g in [1, None]:
+                            if rnd.random() < 0.5:
+                                session.add(models.MetricArticleDetailed(collection=1, year_month_day=day, article=a, format=f, language=None, geolocation=g, **self._measures(rnd)))
+                            if rnd.random() < 0.5:
+                                session.add(models.MetricArticleDailyGeolocationFormat(collection=1, year_month_day=day, article=a, geolocation=g, format=f, **self._measures(rnd)))
+                    for g in [1, None]:
+                        session.add(models.MetricArticleDailyGeolocation(collection=1, year_month_day=day, article=a, geolocation=g, **self._measures(rnd)))
+                    session.add(models.MetricArticleDaily(collection=1, year_month_day=day, article=a, **self._measures(rnd)))
+                session.add(models.MetricJournalDaily(collection=1, year_month_day=day, journal=1, **self._measures(rnd)))
+
+    def tearDown(self):
+        db.dispose(self.str_connection)
+        shutil.rmtree(self.tmp_dir)
+
+    def _measures(self, rnd):
+        unique = rnd.randint(1, 5)
+        return dict(zip(metrics.MEASURES, [unique + 2, unique + 3, unique, unique]))
+
+    def _expected(self, r):
+        # monthly rows summed from the daily rows of the folded days
+        source = models.Base.metadata.tables[r.source]
+        expected = {}
+        with db.session_scope(self.str_connection) as session:
+            for row in session.execute(source.select()):
+                key = (row.year_month_day.replace(day=1),) + tuple(row._mapping[k] for k in r.keys)
+                sums = expected.setdefault(key, [0, 0, 0, 0])
+                for i, m in enumerate(metrics.MEASURES):
+                    sums[i] += row._mapping[m]
+        return expected
+
+    def _obtained(self, r):
+        table = models.Base.metadata.tables[r.table]
+        with db.session_scope(self.str_connection) as session:
+            return {
+                (row.year_month,) + tuple(row._mapping[k] for k in r.keys): [row._mapping[m] for m in metrics.MEASURES]
+                for row in session.execute(table.select())
+            }
+
+    def _assert_monthly_tables(self):
+        for r in ROLLUPS:
+            self.assertDictEqual(self._obtained(r), self._expected(r), r.name)
+
+    def test_fold_is_idempotent(self):
+        self.assertListEqual(rollup.get_unfolded_dates(self.str_connection, 1, ROLLUPS), DAYS)
+        self.assertListEqual(rollup.fold_pending_dates(self.str_connection, 1, ROLLUPS), DAYS)
+        self._assert_monthly_tables()
+
+        self.assertListEqual(rollup.fold_pending_dates(self.str_connection, 1, ROLLUPS), [])
+        self.assertEqual(rollup.fold_day(self.str_connection, 1, DAYS[0], ROLLUPS), 0)
+        self._assert_monthly_tables()
+
+        with db.session_scope(self.str_connection) as session:
+            self.assertEqual(session.query(models.MetricStatus).count(), len(DAYS) * len(ROLLUPS))
+
+    def test_late_day(self):
+        late_day = DAYS[2]
+        db.set_control_date_status(self.str_connection, 1, late_day, values.DATE_STATUS_PRETABLE)
+        rollup.fold_pending_dates(self.str_connection, 1, ROLLUPS)
+
+        db.set_control_date_status(self.str_connection, 1, late_day, values.DATE_STATUS_COMPUTED)
+        self.assertListEqual(rollup.fold_pending_dates(self.str_connection, 1, ROLLUPS), [late_day])
+        self._assert_monthly_tables()
+
+    def test_unfold_day(self):
+        rollup.fold_pending_dates(self.str_connection, 1, ROLLUPS)
+        rollup.unfold_day(self.str_connection, 1, DAYS[-1], ROLLUPS)
+
+        # the only day of March was removed
+        for r in ROLLUPS:
+            self.assertFalse([k for k in self._obtained(r) if k[0] == datetime.date(2024, 3, 1)])
+
+        self.assertListEqual(rollup.get_unfolded_dates(self.str_connection, 1, ROLLUPS), [DAYS[-1]])
+        rollup.fold_pending_dates(self.str_connection, 1, ROLLUPS)
+        self._assert_monthly_tables()
+
+    def test_compute_again_keeps_monthly_tables(self):
+        rollup.fold_pending_dates(self.str_connection, 1, ROLLUPS)
+
+        day = DAYS[1]
+        with open(os.path.join(self.tmp_dir, day.strftime('%Y-%m-%d') + '.tsv'), 'w') as fout:
+            fout.write('\t'.join(values.PRETABLE_FILE_HEADER) + '\n')
+            fout.write('\t'.join(['2024-02-02 10:00:01', 'CH', '121.0', '1.1.1.1', '', '', '/scielo.php?script=sci_arttext&pid=S0102-69092018000300001']) + '\n')
+
+        db.set_control_date_status(self.str_connection, 1, day, values.DATE_STATUS_PRETABLE)
+        compute_metrics.compute_metrics_db(self.str_connection, 1, pretables_directory=self.tmp_dir, rollups=ROLLUPS)
+
+        self._assert_monthly_tables()
+        self.assertListEqual(rollup.get_unfolded_dates(self.str_connection, 1, ROLLUPS), [])
+
+    def test_every_monthly_table_has_a_rollup(self):
+        monthly_tables = {t for t in models.Base.metadata.tables if t.startswith('metric_') and '_monthly' in t}
+        self.assertSetEqual({r.table for r in rollup.ROLLUPS}, monthly_tables)
+
+        for r in rollup.ROLLUPS:
+            self.assertLessEqual(len(r.name), 32, r.name)
+            # each source groups by every key of its monthly table
+            self.assertLessEqual(set(r.keys), set(metrics.METRIC_TABLE_KEYS[r.source]), r.name)
+
+
+class TestRollupUniqueMeasures(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.str_connection = 'sqlite:///' + os.path.join(self.tmp_dir, 'usage.db')
+        db.create_tables(self.str_connection, tables=METRIC_TABLES + [models.Base.metadata.tables[r.table] for r in UNIQUE_ROLLUPS])
+
+        with db.session_scope(self.str_connection) as session:
+            session.add(models.Collection(id=1, acronym='scl', name='Brasil'))
+            session.add(models.Journal(id=1, print_issn='0102-6909', electronic_issn='1806-9053', scielo_issn='0102-6909'))
+            session.add(models.Article(id=1, collection=1, pid='S0102-69092018000300512', yop=2018, journal=1))
+            session.add(models.ControlDateStatus(collection=1, date=datetime.date(2024, 2, 12), status=values.DATE_STATUS_PRETABLE))
+
+        # one session reads the HTML and the PDF in Portuguese and the HTML in English
+        with open(os.path.join(self.tmp_dir, '2024-02-12.tsv'), 'w') as fout:
+            fout.write('\t'.join(values.PRETABLE_FILE_HEADER) + '\n')
+            for action in [
+                '/scielo.php?script=sci_arttext&pid=S0102-69092018000300512&tlng=pt',
+                '/scielo.php?script=sci_pdf&pid=S0102-69092018000300512&tlng=pt',
+                '/scielo.php?script=sci_arttext&pid=S0102-69092018000300512&tlng=en',
+            ]:
+                fout.write('\t'.join(['2024-02-12 10:00:01', 'CH', '121.0', '1.1.1.1', '-23.5475', '-46.6361', action]) + '\n')
+
+    def tearDown(self):
+        db.dispose(self.str_connection)
+        shutil.rmtree(self.tmp_dir)
+
+    def _monthly(self, name, key_models):
+        r = [r for r in UNIQUE_ROLLUPS if r.name == name][0]
+        table = models.Base.metadata.tables[r.table]
+
+        with db.session_scope(self.str_connection) as session:
+            names = {k: {row[0]: row[1] for row in session.query(m.id, getattr(m, k))} for k, m in key_models.items()}
+            return {
+                tuple(names[k][row._mapping[k]] if k in names else row._mapping[k] for k in r.keys): tuple(row._mapping[m] for m in metrics.MEASURES)
+                for row in session.execute(table.select())
+            }
+
+    def test_unique_measures_across_formats_and_languages(self):
+        compute_metrics.compute_metrics_db(self.str_connection, 1, pretables_directory=self.tmp_dir, rollups=UNIQUE_ROLLUPS)
+
+        self.assertDictEqual(self._monthly('art_monthly_geo', {}), {(1, 1): (3, 3, 1, 1)})
+        self.assertDictEqual(self._monthly('art_monthly_lan', {'language': models.ArticleLanguage}), {
+            (1, 'pt'): (2, 2, 1, 1),
+            (1, 'en'): (1, 1, 1, 1),
+        })
+        self.assertDictEqual(self._monthly('art_monthly_geo_lan', {'language': models.ArticleLanguage}), {
+            (1, 1, 'pt'): (2, 2, 1, 1),
+            (1, 1, 'en'): (1, 1, 1, 1),
+        })
+        self.assertDictEqual(self._monthly('jou_monthly_for', {'format': models.ArticleFormat}), {
+            (1, 'html'): (2, 2, 1, 1),
+            (1, 'pdf'): (1, 1, 1, 1),
+        })
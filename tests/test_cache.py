@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from scielo_usage_counter import cache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_or_compute_counts_hits_and_misses(self):
+        c = cache.LRUCache(max_size=10)
+        calls = []
+
+        def func(k):
+            calls.append(k)
+            return k.upper()
+
+        for k in ['a', 'b', 'a', 'a', 'c']:
+            self.assertEqual(c.get_or_compute(k, func), k.upper())
+
+        self.assertListEqual(calls, ['a', 'b', 'c'])
+        self.assertEqual(c.counters(), (2, 3, 0))
+
+    def test_lru_eviction(self):
+        c = cache.LRUCache(max_size=2)
+        c.put('a', 1)
+        c.put('b', 2)
+        c.get('a')
+        c.put('c', 3)
+
+        self.assertIn('a', c)
+        self.assertNotIn('b', c)
+        self.assertEqual(c.evictions, 1)
+
+    def test_fifo_eviction(self):
+        c = cache.LRUCache(max_size=2, eviction=cache.EVICTION_FIFO)
+        c.put('a', 1)
+        c.put('b', 2)
+        c.get('a')
+        c.put('c', 3)
+
+        self.assertNotIn('a', c)
+        self.assertIn('b', c)
+
+    def test_max_bytes_eviction(self):
+        c = cache.LRUCache(max_size=1000, max_bytes=10, sizeof=lambda k, v: len(v))
+        c.put('a', 'xxxx')
+        c.put('b', 'xxxx')
+        c.put('c', 'xxxx')
+
+        self.assertEqual(len(c), 2)
+        self.assertEqual(c.size_in_bytes, 8)
+        self.assertNotIn('a', c)
+
+    def test_invalid_eviction_policy(self):
+        with self.assertRaises(ValueError):
+            cache.LRUCache(eviction='random')
+
+    def test_save_and_load(self):
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'cache.json')
+
+        try:
+            c = cache.LRUCache()
+            c.put('Mozilla/5.0', ('CH', '90.0', False, False))
+            c.save(path, fingerprint='abc')
+
+            warm = cache.LRUCache()
+            self.assertEqual(warm.load(path, fingerprint='abc'), 1)
+            self.assertEqual(warm.get('Mozilla/5.0'), ('CH', '90.0', False, False))
+
+            stale = cache.LRUCache()
+            self.assertEqual(stale.load(path, fingerprint='def'), 0)
+            self.assertEqual(len(stale), 0)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_merge_files(self):
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'cache.json')
+
+        try:
+            # no worker file: the persisted cache is left untouched
+            c = cache.LRUCache()
+            c.put('a', ('CH', '90.0', False, False))
+            c.save(path, fingerprint='abc')
+            self.assertEqual(cache.merge_files(path, [os.path.join(tmp_dir, 'missing')]), 0)
+
+            worker_paths = []
+            for i, key in enumerate(['b', 'c']):
+                w = cache.LRUCache()
+                w.put('a', ('CH', '90.0', False, False))
+                w.put(key, ('FF', str(i), False, False))
+                worker_paths.append(os.path.join(tmp_dir, f'cache.json.worker-{i}'))
+                w.save(worker_paths[-1], fingerprint='abc')
+
+            self.assertEqual(cache.merge_files(path, worker_paths), 3)
+            self.assertFalse(any(os.path.exists(p) for p in worker_paths))
+
+            merged = cache.LRUCache()
+            self.assertEqual(merged.load(path, fingerprint='abc'), 3)
+            self.assertEqual(merged.get('c'), ('FF', '1', False, False))
+        finally:
+            shutil.rmtree(tmp_dir)
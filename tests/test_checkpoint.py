@@ -0,0 +1,147 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from scielo_usage_counter import checkpoint, log, values
+
+
+class Interrupted(Exception):
+    ...
+
+
+def interrupt_after(rows, n):
+    for i, row in enumerate(rows):
+        if i == n:
+            raise Interrupted()
+        yield row
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.maxDiff = None
+        self.tmp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _parser(self, logfile, checkpoint_path, interval):
+        lp = log.LogParser(mmdb_path='tests/fixtures/map.mmdb', robots_path='tests/fixtures/counter-robots.txt')
+        lp.logfile = logfile
+        lp.enable_checkpoints(checkpoint_path, interval)
+        return lp
+
+    def _read(self, lp, output_path):
+        # wall-clock time and cache counters depend on the cache state of each run
+        keys, values = lp.stats.get_stats()
+        stats = {k: v for k, v in zip(keys, values) if k != 'total_time' and not k.startswith('ua_cache')}
+
+        with open(output_path) as fin:
+            return fin.read(), stats
+
+    def _parse(self, logfile, name, interval):
+        output_path = os.path.join(self.tmp_dir, name)
+        lp = self._parser(logfile, output_path + '.checkpoint', interval)
+        lp.output = output_path
+        lp.stats.output = output_path + '.summary'
+        lp.save(lp.parse())
+        return self._read(lp, output_path)
+
+    def _parse_interrupted(self, logfile, name, interval, interrupt_at):
+        output_path = os.path.join(self.tmp_dir, name)
+        checkpoint_path = output_path + '.checkpoint'
+
+        lp = self._parser(logfile, checkpoint_path, interval)
+        lp.output = output_path
+        with self.assertRaises(Interrupted):
+            lp.save(interrupt_after(lp.parse(), interrupt_at))
+        lp.output.close()
+
+        cp = checkpoint.load_checkpoint(checkpoint_path, logfile)
+        self.assertIsNotNone(cp)
+        self.assertGreater(cp.offset, 0)
+
+        lp = self._parser(logfile, checkpoint_path, interval)
+        lp.resume(cp)
+        lp.stats.output = output_path + '.summary'
+        lp.save(lp.parse())
+
+        self.assertFalse(os.path.exists(checkpoint_path))
+        return self._read(lp, output_path)
+
+    def test_resume_plain_text_matches_uninterrupted(self):
+        expected = self._parse('tests/fixtures/usage.log', 'plain', 0)
+        for interval, interrupt_at in [(10, 3), (7, 6), (50, 8)]:
+            obtained = self._parse_interrupted('tests/fixtures/usage.log', f'plain_{interval}', interval, interrupt_at)
+            self.assertEqual(obtained, expected)
+
+    def test_resume_gzip_matches_uninterrupted(self):
+        gz_path = os.path.join(self.tmp_dir, 'usage.log.gz')
+        with open('tests/fixtures/usage.log', 'rb') as fin, gzip.open(gz_path, 'wb') as fout:
+            shutil.copyfileobj(fin, fout)
+
+        expected = self._parse('tests/fixtures/usage.log', 'plain_gz', 0)
+        obtained = self._parse_interrupted(gz_path, 'gz', 13, 5)
+        self.assertEqual(obtained, expected)
+
+    def test_keep_completed_checkpoint(self):
+        output_path = os.path.join(self.tmp_dir, 'completed')
+        checkpoint_path = output_path + '.checkpoint'
+
+        lp = log.LogParser(mmdb_path='tests/fixtures/map.mmdb', robots_path='tests/fixtures/counter-robots.txt')
+        lp.logfile = 'tests/fixtures/usage.log'
+        lp.enable_checkpoints(checkpoint_path, 10, keep_completed=True)
+        lp.output = output_path
+        lp.stats.output = output_path + '.summary'
+        lp.save(lp.parse())
+
+        cp = checkpoint.load_checkpoint(checkpoint_path, 'tests/fixtures/usage.log')
+        self.assertTrue(cp.completed)
+        self.assertEqual(cp.output_position, os.path.getsize(output_path))
+        self.assertEqual(cp.stats['lines_parsed'], lp.stats.lines_parsed)
+
+        checkpoint.remove_checkpoint(checkpoint_path)
+        self.assertFalse(os.path.exists(checkpoint_path))
+
+    def test_keep_completed_checkpoint_without_interval(self):
+        for output_format in values.OUTPUT_FORMATS:
+            output_path = os.path.join(self.tmp_dir, f'completed.{output_format}')
+            checkpoint_path = output_path + '.checkpoint'
+
+            lp = log.LogParser(mmdb_path='tests/fixtures/map.mmdb', robots_path='tests/fixtures/counter-robots.txt')
+            lp.logfile = 'tests/fixtures/usage.log'
+            lp.output_format = output_format
+            lp.enable_checkpoints(checkpoint_path, 0, keep_completed=True)
+            lp.output = output_path
+            lp.stats.output = output_path + '.summary'
+            lp.save(lp.parse())
+
+            cp = checkpoint.load_checkpoint(checkpoint_path, 'tests/fixtures/usage.log')
+            self.assertTrue(cp.completed)
+            self.assertEqual(cp.output_position, os.path.getsize(output_path))
+
+    def test_load_checkpoint_of_changed_logfile(self):
+        logfile = os.path.join(self.tmp_dir, 'changed.log')
+        shutil.copy('tests/fixtures/usage.log', logfile)
+
+        output_path = os.path.join(self.tmp_dir, 'changed.tsv')
+        with open(output_path, 'w') as fout:
+            fout.write('header\n')
+
+        checkpoint_path = os.path.join(self.tmp_dir, 'changed.checkpoint')
+        checkpoint.Checkpoint(logfile, output_path, offset=100, output_position=7).save(checkpoint_path)
+        self.assertIsNotNone(checkpoint.load_checkpoint(checkpoint_path, logfile))
+
+        with open(logfile, 'a') as fout:
+            fout.write('\n')
+        self.assertIsNone(checkpoint.load_checkpoint(checkpoint_path, logfile))
+
+    def test_get_checkpoint_path(self):
+        self.assertEqual(
+            checkpoint.get_checkpoint_path('data', '/logs/2022-01-01.usage.log.gz'),
+            'data/2022-01-01.usage.log.gz.checkpoint',
+        )
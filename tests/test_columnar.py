@@ -0,0 +1,74 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from scielo_usage_counter import columnar, exceptions, log, values
+from scielo_usage_counter.proc import generate_pretable
+
+
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        rows = [
+            ['2021-05-22 02:58:50', 'CH', '90.0.4430.212', '177.52.0.1', 'BR', '/scielo.php?script=sci_arttext&pid=S1517-97022004000100004'],
+            ['2021-05-22 02:58:51', 'FF', '88.0', '2804:14c:5b71:8f5c::1', 'BR', '/pdf/rem/v63n4/a07v63n4.pdf'],
+            ['2021-05-23 00:00:00', 'CH', '90.0.4430.212', '2804:014c::1', 'AR', '/artigo/ação'],
+            ['1999-12-31 23:59:59', 'UNK', 'UNK', '10.0.0.1', 'CL', ''],
+        ] * 5
+
+        path = os.path.join(self.tmp_dir, 'parsed.col')
+        with columnar.ColumnarWriter(path, block_size=3) as writer:
+            writer.write_rows(rows)
+
+        self.assertTrue(columnar.is_columnar_file(path))
+        self.assertEqual([list(r) for r in columnar.ColumnarReader(path)], rows)
+
+    def test_invalid_file(self):
+        path = os.path.join(self.tmp_dir, 'parsed.tsv')
+        with open(path, 'w') as fout:
+            fout.write('\t'.join(values.PARSED_FILE_HEADER) + '\n')
+
+        self.assertFalse(columnar.is_columnar_file(path))
+        with self.assertRaises(exceptions.InvalidColumnarDataError):
+            list(columnar.ColumnarReader(path))
+
+    def test_parse_log_and_generate_pretables(self):
+        pretables = {}
+
+        for output_format in values.OUTPUT_FORMATS:
+            lp = log.LogParser(mmdb_path='tests/fixtures/map.mmdb', robots_path='tests/fixtures/counter-robots.txt')
+            lp.logfile = 'tests/fixtures/usage.log'
+            lp.output_format = output_format
+            lp.output = os.path.join(self.tmp_dir, f'parsed.{output_format}')
+            lp.stats.output = os.path.join(self.tmp_dir, f'parsed.{output_format}.summary')
+            lp.save(lp.parse())
+
+            output_directory = os.path.join(self.tmp_dir, output_format)
+            os.makedirs(output_directory)
+            generate_pretable.generate_pretables(
+                os.path.join(self.tmp_dir, f'parsed.{output_format}'),
+                output_directory,
+                geoip=generate_pretable.load_geoip('tests/fixtures/map.mmdb'),
+            )
+
+            pretables[output_format] = {}
+            for name in sorted(os.listdir(output_directory)):
+                with open(os.path.join(output_directory, name)) as fin:
+                    pretables[output_format][name] = list(csv.reader(fin, delimiter='\t'))
+
+        self.assertTrue(pretables[values.OUTPUT_FORMAT_TSV])
+        self.assertDictEqual(pretables[values.OUTPUT_FORMAT_TSV], pretables[values.OUTPUT_FORMAT_COLUMNAR])
+
+        latitude = values.PRETABLE_FILE_HEADER.index('latitude')
+        for rows in pretables[values.OUTPUT_FORMAT_TSV].values():
+            self.assertListEqual(rows[0], values.PRETABLE_FILE_HEADER)
+            # coordinates are resolved from the IPs
+            self.assertTrue(any(r[latitude] for r in rows[1:]))
@@ -0,0 +1,80 @@
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from scielo_usage_counter import external_sort, values
+
+
+class TestExternalSorter(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.input_path = os.path.join(self.tmp_dir, 'unsorted.tsv')
+
+        rnd = random.Random(11)
+        ips = ['177.52.0.%d' % i for i in range(1, 30)] + ['2804:14c::1', '10.0.0.1']
+        lines = ['\t'.join(values.PRETABLE_FILE_HEADER)]
+        for _ in range(20000):
+            lines.append('\t'.join([
+                '2021-05-22 %02d:%02d:%02d' % (rnd.randint(0, 23), rnd.randint(0, 59), rnd.randint(0, 2)),
+                rnd.choice(['CH', 'FF']),
+                rnd.choice(['90.0', '88.0']),
+                rnd.choice(ips),
+                rnd.choice(['', '-22.9']),
+                rnd.choice(['', '-43.2']),
+                rnd.choice(['/scielo.php?pid=S0100', '/pdf/ação.pdf', '']),
+            ]))
+        lines.extend(['', 'a\tb', 'a\tb\tc\t'])
+
+        with open(self.input_path, 'w') as fout:
+            fout.write('\n'.join(lines))
+
+        self.lines = lines
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _sort(self, mode, workers=1):
+        output_path = os.path.join(self.tmp_dir, f'{mode}.{workers}.tsv')
+        sorter = external_sort.ExternalSorter(mode=mode, memory_budget=64 * 1024, workers=workers)
+        result = sorter.sort(self.input_path, output_path)
+
+        with open(output_path, 'rb') as fin:
+            return fin.read(), result
+
+    @unittest.skipIf(shutil.which('sort') is None, 'sort não está disponível')
+    def test_compat_mode_matches_sort_uniq(self):
+        expected = subprocess.run(
+            "sort -r -t $'\\t' -k 4 %s | uniq" % self.input_path,
+            shell=True,
+            executable='/bin/bash',
+            env=dict(os.environ, LC_ALL='C'),
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout
+
+        for workers in [1, 2]:
+            obtained, _ = self._sort(external_sort.SORT_MODE_COMPAT, workers)
+            self.assertEqual(obtained, expected)
+
+    def test_ip_time_mode(self):
+        external_sort.MIN_RUN_SIZE, min_run_size = 32 * 1024, external_sort.MIN_RUN_SIZE
+        try:
+            obtained, result = self._sort(external_sort.SORT_MODE_IP_TIME, workers=2)
+        finally:
+            external_sort.MIN_RUN_SIZE = min_run_size
+
+        rows = [line.encode() for line in self.lines[1:]]
+        expected_rows = sorted(set(rows), key=lambda r: ((r.split(b'\t') + [b''] * 4)[3], r.split(b'\t')[0], r))
+        obtained_lines = obtained.split(b'\n')
+
+        self.assertGreater(result.runs, 1)
+        self.assertEqual(obtained_lines[0], self.lines[0].encode())
+        self.assertEqual(obtained_lines[1:-1], expected_rows)
+        self.assertEqual(result.lines_written, len(expected_rows) + 1)
+        self.assertEqual(result.duplicates, len(rows) - len(expected_rows))
@@ -0,0 +1,185 @@
+import bz2
+import datetime
+import gzip
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from scielo_usage_counter.utils import file_utils
+
+
+def filename_contains_dates(filename, dates):
+    # substring search that selected processed files before the index of dates in file names
+    for d in dates:
+        if d in filename or d.replace('-', '') in filename:
+            return True
+    return False
+
+
+class BrokenFile(io.BytesIO):
+
+    def read(self, size=-1):
+        if self.tell() > 0:
+            raise OSError('broken file')
+        return super().read(size)
+
+
+class TestReadaheadReader(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open('tests/fixtures/usage.log', 'rb') as fin:
+            self.data = fin.read()
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_iter_matches_file_lines(self):
+        expected = list(io.BytesIO(self.data))
+
+        for buffer_size in [1, 100, 4096, len(self.data) * 2]:
+            reader = file_utils.ReadaheadReader(io.BytesIO(self.data), buffer_size=buffer_size, queue_size=2)
+            self.assertEqual(list(reader), expected)
+            reader.close()
+
+    def test_last_line_without_line_break(self):
+        reader = file_utils.ReadaheadReader(io.BytesIO(b'a\n\nb\nc'), buffer_size=3)
+        self.assertEqual(list(reader), [b'a\n', b'\n', b'b\n', b'c'])
+
+    def test_readline_tell_and_seek(self):
+        reader = file_utils.ReadaheadReader(io.BytesIO(self.data), buffer_size=1000)
+        for _ in range(50):
+            reader.readline()
+        offset = reader.tell()
+        rest = b''.join(iter(reader.readline, b''))
+        reader.close()
+
+        self.assertEqual(self.data[offset:], rest)
+        self.assertEqual(reader.tell(), len(self.data))
+
+        reader = file_utils.ReadaheadReader(io.BytesIO(self.data), buffer_size=1000)
+        reader.seek(offset)
+        self.assertEqual(b''.join(reader), rest)
+        with self.assertRaises(io.UnsupportedOperation):
+            reader.seek(0)
+
+    def test_read_error_is_raised(self):
+        reader = file_utils.ReadaheadReader(BrokenFile(self.data), buffer_size=100)
+        with self.assertRaises(OSError):
+            list(reader)
+
+    def test_open_compressed_logfile(self):
+        for ext, module in [('gz', gzip), ('bz2', bz2)]:
+            path = os.path.join(self.tmp_dir, f'usage.log.{ext}')
+            with module.open(path, 'wb') as fout:
+                fout.write(self.data)
+
+            logfile = file_utils.open_logfile(path, readahead_buffer_size=4096)
+            self.assertIsInstance(logfile, file_utils.ReadaheadReader)
+            self.assertEqual(b''.join(logfile), self.data)
+            logfile.close()
+
+            logfile = file_utils.open_logfile(path, readahead_buffer_size=0)
+            self.assertNotIsInstance(logfile, file_utils.ReadaheadReader)
+            logfile.close()
+
+
+class TestGetLogfiles(unittest.TestCase):
+
+    def test_get_logfiles(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ['a.log', 'b.log.gz', 'c.txt']:
+                open(os.path.join(tmp_dir, name), 'w').close()
+            os.mkdir(os.path.join(tmp_dir, 'subdir'))
+
+            list_file = os.path.join(tmp_dir, 'c.txt')
+            with open(list_file, 'w') as fout:
+                fout.write('# logs\n')
+                fout.write(os.path.join(tmp_dir, 'a.log') + '\n\n')
+                fout.write('tests/fixtures/usage.log\n')
+                fout.write('tests/fixtures/missing.log\n')
+
+            obtained = file_utils.get_logfiles(
+                directories=[tmp_dir],
+                patterns=[os.path.join(tmp_dir, '*.log*')],
+                list_files=[list_file],
+            )
+
+        self.assertEqual(obtained, [
+            os.path.join(tmp_dir, 'a.log'),
+            os.path.join(tmp_dir, 'b.log.gz'),
+            os.path.join(tmp_dir, 'c.txt'),
+            'tests/fixtures/usage.log',
+        ])
+
+
+class TestProcessedFilesIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _create(self, names):
+        for name in names:
+            open(os.path.join(self.tmp_dir, name), 'w').close()
+
+    def _legacy_processed_files(self, date, extension):
+        dates = [(date + datetime.timedelta(days=i)).strftime('%Y-%m-%d') for i in range(-2, 3)]
+        files = [f for f in os.listdir(self.tmp_dir) if f.endswith(extension)]
+        return sorted(os.path.join(self.tmp_dir, f) for f in files if filename_contains_dates(f, dates))
+
+    def test_same_files_as_substring_search(self):
+        rnd = random.Random(5)
+        names = set()
+        for _ in range(2000):
+            d = datetime.date(2022, 1, 1) + datetime.timedelta(days=rnd.randint(0, 800))
+            name = rnd.choice([
+                '{d:%Y-%m-%d}.usage.log.{t}.{e}',
+                '{d:%Y%m%d}_node01.log.gz.{t}.{e}',
+                'access.{d:%Y-%m-%d}.{d:%Y%m%d}.{e}',
+                'scl.{t}{t}.{e}',
+                'no_date.log.{e}',
+            ]).format(d=d, t=rnd.randint(10 ** 8, 10 ** 10), e=rnd.choice(['tsv', 'col', 'summary', 'profile']))
+            names.add(name)
+        self._create(names)
+
+        extension = ('tsv', 'col')
+        index = file_utils.ProcessedFilesIndex(self.tmp_dir, extension=extension)
+        for i in range(0, 820, 3):
+            date = datetime.date(2022, 1, 1) + datetime.timedelta(days=i)
+            self.assertListEqual(index.get_files(date), self._legacy_processed_files(date, extension), date)
+
+    def test_persisted_index_is_refreshed(self):
+        with tempfile.TemporaryDirectory() as index_dir:
+            index_path = os.path.join(index_dir, 'processed.index')
+            self._create(['2024-01-01.usage.log.1.tsv', '2024-01-02.usage.log.2.tsv', '2024-01-02.usage.log.2.tsv.summary'])
+
+            # the directory was last modified long before it is scanned
+            past = os.stat(self.tmp_dir).st_mtime - 60
+            os.utime(self.tmp_dir, (past, past))
+
+            index = file_utils.ProcessedFilesIndex(self.tmp_dir, index_path=index_path)
+            self.assertEqual(len(index), 2)
+            self.assertTrue(os.path.exists(index_path))
+
+            index = file_utils.ProcessedFilesIndex(self.tmp_dir, index_path=index_path)
+            self.assertFalse(index.refresh())
+            self.assertEqual(len(index.get_files(datetime.date(2024, 1, 1))), 2)
+
+            self._create(['20240105_node01.log.3.tsv'])
+            os.remove(os.path.join(self.tmp_dir, '2024-01-01.usage.log.1.tsv'))
+
+            index = file_utils.ProcessedFilesIndex(self.tmp_dir, index_path=index_path)
+            self.assertEqual(index.get_files(datetime.date(2024, 1, 1)), [os.path.join(self.tmp_dir, '2024-01-02.usage.log.2.tsv')])
+            self.assertEqual(index.get_files(datetime.date(2024, 1, 7)), [os.path.join(self.tmp_dir, '20240105_node01.log.3.tsv')])
+
+    def test_get_dates_from_filename(self):
+        self.assertListEqual(file_utils.get_dates_from_filename('2024-02-29.20240301.log.20241340.tsv'), ['2024-02-29', '2024-03-01'])
+        self.assertListEqual(file_utils.get_dates_from_filename('2023-02-29.log.tsv'), [])
@@ -0,0 +1,54 @@
+import unittest
+
+from scielo_usage_counter import geo
+
+
+class TestGeoIp(unittest.TestCase):
+
+    def setUp(self):
+        self.geoip = geo.GeoIp(prefix_cache=True)
+        self.geoip.map = 'tests/fixtures/map.mmdb'
+
+    def test_country_and_geolocation_share_lookup(self):
+        country_code = self.geoip.ip_to_country_code('89.155.0.1')
+        geolocation = self.geoip.ip_to_geolocation('89.155.0.1')
+
+        self.assertEqual(country_code, geolocation.country_code)
+        self.assertEqual(self.geoip.cache.counters(), (1, 1, 0))
+        self.assertEqual(
+            self.geoip.geolocation_to_str(geolocation),
+            f'{geolocation.latitude}\t{geolocation.longitude}',
+        )
+
+    def test_negative_results_are_cached(self):
+        for ip in ['-', 'unknown', '10.0.0.1', '-', 'unknown', '10.0.0.1']:
+            self.assertIsNone(self.geoip.ip_to_country_code(ip))
+
+        self.assertEqual(self.geoip.cache.counters(), (3, 3, 0))
+
+    def test_prefix_cache_matches_lookup(self):
+        ips = ['89.155.0.1', '89.155.0.7', '89.155.0.200', '2806:108e:21:4720:552:4011:137c:a7fb', '2806:108e:21:4720::1']
+
+        uncached = geo.GeoIp(cache_size=1)
+        uncached.map = 'tests/fixtures/map.mmdb'
+
+        for ip in ips:
+            self.assertEqual(self.geoip.ip_to_country_code(ip), uncached.ip_to_country_code(ip))
+
+        self.assertLess(len(self.geoip.cache), len(ips))
+
+
+class TestCountryPrefixCache(unittest.TestCase):
+
+    def test_only_stores_prefixes_inside_network(self):
+        prefix_cache = geo.CountryPrefixCache()
+        prefix_cache.put('200.136.72.10', 25, 'BR')
+        self.assertIsNone(prefix_cache.get('200.136.72.200'))
+
+        prefix_cache.put('200.136.72.10', 16, 'BR')
+        self.assertEqual(prefix_cache.get('200.136.72.200'), 'BR')
+        self.assertIsNone(prefix_cache.get('200.136.73.1'))
+
+        prefix_cache.put('2001:db8:1::1', 32, 'US')
+        self.assertEqual(prefix_cache.get('2001:db8:1:ffff::1'), 'US')
+        self.assertIsNone(prefix_cache.get('invalid'))
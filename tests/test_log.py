@@ -1,9 +1,12 @@
+import os
+import shutil
+import tempfile
 import unittest
 import datetime
 
 from device_detector import DeviceDetector
 
-from scielo_usage_counter import log
+from scielo_usage_counter import log, values
 
 
 class TestLogParser(unittest.TestCase):
@@ -243,6 +246,39 @@ class TestLogParser(unittest.TestCase):
         self.assertEqual(lp.stats.total_imported_lines, 13)
         self.assertEqual(lp.stats.total_ignored_lines, 187)
 
+    def test_parse_short_circuit(self):
+        rows = {}
+        stats = {}
+        for mode in values.EVALUATION_MODES:
+            lp = log.LogParser(
+                mmdb_path='tests/fixtures/map.mmdb',
+                robots_path='tests/fixtures/counter-robots.txt',
+                evaluation_mode=mode,
+            )
+            lp.logfile = 'tests/fixtures/usage.log'
+            rows[mode] = list(lp.parse())
+            stats[mode] = lp.stats
+
+        full = stats[values.EVALUATION_MODE_FULL]
+        short = stats[values.EVALUATION_MODE_SHORT_CIRCUIT]
+
+        self.assertListEqual(rows[values.EVALUATION_MODE_SHORT_CIRCUIT], rows[values.EVALUATION_MODE_FULL])
+        self.assertEqual(short.lines_parsed, full.lines_parsed)
+        self.assertEqual(short.total_imported_lines, full.total_imported_lines)
+        self.assertEqual(short.total_ignored_lines, full.total_ignored_lines)
+
+        # only the primary reason of each ignored line is counted
+        reasons = [m for m in log.STATS_MEASURES if m.startswith('ignored_lines_')]
+        self.assertLessEqual(sum(getattr(short, m) for m in reasons), short.total_ignored_lines)
+        self.assertEqual(short.ignored_lines_invalid_method, full.ignored_lines_invalid_method)
+        self.assertEqual(short.ignored_lines_static_resources, 177)
+        for m in reasons:
+            self.assertLessEqual(getattr(short, m), getattr(full, m))
+
+    def test_invalid_evaluation_mode(self):
+        with self.assertRaises(ValueError):
+            log.LogParser(mmdb_path='tests/fixtures/map.mmdb', robots_path='tests/fixtures/counter-robots.txt', evaluation_mode='fast')
+
     def test_parse_success_cub(self):
         lp = log.LogParser(mmdb_path='tests/fixtures/map.mmdb', robots_path='tests/fixtures/counter-robots.txt')
         lp.logfile = 'tests/fixtures/usage.cub.log'
@@ -482,6 +518,21 @@ class TestLogParser(unittest.TestCase):
         obtained = self.lp.parse_line(line)
         self.assertListEqual(obtained, [])
 
+    def test_classify_user_agent_cached(self):
+        lp = log.LogParser(mmdb_path='tests/fixtures/map.mmdb', robots_path='tests/fixtures/counter-robots.txt')
+        user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36'
+
+        for i in range(3):
+            obtained = lp.classify_user_agent(user_agent)
+            self.assertTupleEqual(obtained, ('CH', '131.0.0.0', False, False))
+
+        self.assertTupleEqual(lp.classify_user_agent('LOCKSS cache')[2:], (True, False))
+
+        lp.collect_ua_cache_stats()
+        self.assertEqual(lp.stats.ua_cache_hits, 2)
+        self.assertEqual(lp.stats.ua_cache_misses, 2)
+        self.assertEqual(lp.stats.ua_cache_evictions, 0)
+
     def test_device_detector_client_name_valid(self):
         with open('tests/fixtures/user_agents.txt') as fin:
             user_agents = [a.strip() for a in fin]
@@ -526,6 +577,8 @@ class TestStats(unittest.TestCase):
             ('total_ignored_lines', 50),
             ('total_imported_lines', 50),
             ('lines_parsed', 100),
+            ('ua_cache_hits', 30),
+            ('ua_cache_misses', 7),
         ]:
             for i in range(v):
                 self.stats.increment(attr)
@@ -543,3 +596,44 @@ class TestStats(unittest.TestCase):
         self.assertEqual(self.stats.total_ignored_lines, 50)
         self.assertEqual(self.stats.total_imported_lines, 50)
         self.assertEqual(self.stats.lines_parsed, 100)
+        self.assertEqual(self.stats.ua_cache_hits, 30)
+        self.assertEqual(self.stats.ua_cache_misses, 7)
+
+    def test_save_keeps_summary_columns(self):
+        stats = log.Stats()
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            stats.output = os.path.join(tmp_dir, 'parsed.summary')
+            stats.increment('lines_parsed')
+            stats.increment('ua_cache_hits')
+            stats.save()
+
+            with open(os.path.join(tmp_dir, 'parsed.summary')) as fin:
+                header, row = [line.rstrip('\n').split('\t') for line in fin]
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        # the summary columns of the original parser, in the same order
+        self.assertListEqual(header, [
+            'ignored_lines_static_resources', 'ignored_lines_bot', 'ignored_lines_invalid_method',
+            'ignored_lines_invalid_user_agent', 'ignored_lines_invalid_client_name', 'ignored_lines_invalid_client_version',
+            'ignored_lines_invalid_country_code', 'ignored_lines_invalid_local_datetime', 'ignored_lines_http_redirects',
+            'ignored_lines_http_errors', 'total_ignored_lines', 'total_imported_lines', 'lines_parsed', 'total_time',
+        ])
+        self.assertEqual(row[header.index('lines_parsed')], '1')
+        self.assertEqual(dict(zip(*stats.get_extra_stats()))['ua_cache_hits'], 1)
+        self.assertEqual(stats.to_dict()['ua_cache_hits'], 1)
+
+    def test_dump_to_str(self):
+        stats = log.Stats()
+        stats.increment('lines_parsed')
+        stats.increment('lines_parsed')
+
+        with self.assertLogs(level='INFO') as captured:
+            dumped = stats.dump_to_str()
+
+        rows = dumped.split('\n')
+        self.assertEqual(len(rows), len(log.SUMMARY_MEASURES))
+        self.assertIn('lines_parsed\t2', rows)
+        self.assertIn('total_time\t0.0', rows)
+        self.assertEqual(len(captured.records), len(log.SUMMARY_MEASURES))
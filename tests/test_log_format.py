@@ -0,0 +1,82 @@
+import ipaddress
+import re
+import unittest
+
+from scielo_usage_counter import log_format
+
+
+def _legacy_get_ip_type(ip):
+    try:
+        ipa = ipaddress.ip_address(ip)
+    except ValueError:
+        return 'unknown'
+
+    if ipa.is_global:
+        return 'remote'
+    elif ipa.is_private or ipa.is_loopback or ipa.is_link_local:
+        return 'local'
+
+    return 'unknown'
+
+
+def _legacy_match_with_best_pattern(line):
+    match = None
+    ip_value = ''
+
+    for _, pattern in log_format.LOG_FORMATS:
+        match = re.match(pattern, line)
+
+        if match:
+            content = match.groupdict()
+            ip_value = content.get('ip')
+
+            if _legacy_get_ip_type(ip_value) != 'unknown':
+                return match, ip_value
+
+            for i in content.get('ip_list', '').split(','):
+                if _legacy_get_ip_type(i.strip()) != 'unknown':
+                    return match, i.strip()
+
+    return match, ip_value
+
+
+class TestLogFormatMatcher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.lines = []
+        for name in ['usage.log', 'usage.cl.log', 'usage.cub.log', 'usage.esp.log']:
+            with open(f'tests/fixtures/{name}', errors='ignore') as fin:
+                self.lines.append([line.strip() for line in fin])
+
+    def _fields(self, match):
+        if match:
+            data = match.groupdict()
+            return [data.get(k) for k in ('method', 'path', 'status', 'date', 'timezone', 'user_agent')]
+
+    def test_same_result_as_cascade(self):
+        for sniff_lines in [1, 10, 100]:
+            for lines in self.lines:
+                matcher = log_format.LogFormatMatcher(sniff_lines=sniff_lines)
+
+                for line in lines:
+                    expected_match, expected_ip = _legacy_match_with_best_pattern(line)
+                    obtained_match, obtained_ip, _ = matcher.match(line)
+
+                    self.assertEqual(obtained_ip, expected_ip, line)
+                    self.assertEqual(self._fields(obtained_match), self._fields(expected_match), line)
+
+    def test_detects_format(self):
+        matcher = log_format.LogFormatMatcher(sniff_lines=10)
+        for line in self.lines[3][:10]:
+            matcher.match(line)
+        self.assertEqual(matcher.format_name, 'ncsa_extended_domain')
+
+        matcher.reset()
+        self.assertIsNone(matcher.format_name)
+
+    def test_unknown_line(self):
+        matcher = log_format.LogFormatMatcher()
+        match, _, format_name = matcher.match('not a log line')
+        self.assertIsNone(match)
+        self.assertIsNone(format_name)
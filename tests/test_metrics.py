@@ -0,0 +1,151 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from scielo_usage_counter import metrics, values
+
+
+ARTICLE = '/scielo.php?script=sci_arttext&pid=S0102-69092018000300512&tlng=pt'
+ABSTRACT = '/scielo.php?script=sci_abstract&pid=S0102-69092018000300512&lng=es'
+PDF = '/scielo.php?pid=S0102-69092018000300512&script=sci_pdf&tlng=pt'
+OTHER_ARTICLE = '/scielo.php?script=sci_arttext&pid=S0102-69092019000100001'
+
+
+class TestActionTranslator(unittest.TestCase):
+
+    def test_translate(self):
+        translator = metrics.ActionTranslator()
+
+        self.assertEqual(
+            translator.translate(ARTICLE),
+            metrics.Action('S0102-69092018000300512', '0102-6909', '2018', values.METRIC_FORMAT_HTML, 'pt', True),
+        )
+        self.assertEqual(translator.translate(PDF).format, values.METRIC_FORMAT_PDF)
+        self.assertFalse(translator.translate(ABSTRACT).is_request)
+        self.assertEqual(translator.translate(OTHER_ARTICLE).language, values.METRIC_UNKNOWN_LANGUAGE)
+
+        for action_name in [
+            '',
+            '/',
+            '/pdf/rbp/v26n3/a13v26n3.pdf',
+            '/scielo.php?script=sci_serial&pid=0102-6909',
+            '/scielo.php?script=sci_arttext&pid=S0102-690920180003',
+            '/google_metrics/get_h5_m5.php?issn=0104-6632&callback=jsonp1621652375255',
+        ]:
+            self.assertIsNone(translator.translate(action_name), action_name)
+
+    def test_translate_canonical_issn(self):
+        translator = metrics.ActionTranslator(journal_issns={'0102-6909': '0102-6909', '1806-9053': '0102-6909'})
+
+        self.assertEqual(translator.translate(ARTICLE).issn, '0102-6909')
+        self.assertEqual(translator.translate('/scielo.php?script=sci_arttext&pid=S1806-90532019000100001').issn, '0102-6909')
+        # ISSNs of journals that are not registered are kept
+        self.assertEqual(translator.translate('/scielo.php?script=sci_arttext&pid=S1234-56782019000100001').issn, '1234-5678')
+
+
+class TestMetricsAggregator(unittest.TestCase):
+
+    def _results(self, aggregator):
+        return {k: tuple(v) for k, v in aggregator.results()}
+
+    def test_measures(self):
+        aggregator = metrics.MetricsAggregator()
+        geo = ('-23.5475', '-46.6361')
+
+        for row in [
+            # one session reads the abstract, the full text twice and the PDF
+            ('2024-02-12 10:00:01', 'CH', '121.0', '1.1.1.1', geo[0], geo[1], ABSTRACT),
+            ('2024-02-12 10:00:05', 'CH', '121.0', '1.1.1.1', geo[0], geo[1], ARTICLE),
+            ('2024-02-12 10:20:00', 'CH', '121.0', '1.1.1.1', geo[0], geo[1], ARTICLE),
+            ('2024-02-12 10:30:00', 'CH', '121.0', '1.1.1.1', geo[0], geo[1], PDF),
+            # same IP and browser in another hour is another session
+            ('2024-02-12 11:00:00', 'CH', '121.0', '1.1.1.1', geo[0], geo[1], ARTICLE),
+            ('2024-02-12 11:00:00', 'CH', '121.0', '1.1.1.1', geo[0], geo[1], OTHER_ARTICLE),
+            ('2024-02-12 11:00:00', 'CH', '121.0', '1.1.1.1', geo[0], geo[1], '/pdf/rbp/v26n3/a13v26n3.pdf'),
+            ('2024-02-12 10:00:00', 'FF', '122.0', '2.2.2.2', '', '', ARTICLE),
+        ]:
+            aggregator.add(*row)
+
+        self.assertEqual(aggregator.hits, 7)
+        self.assertEqual(aggregator.ignored_hits, 1)
+
+        results = self._results(aggregator)
+        self.assertEqual(results[(metrics.ARTICLE_DAILY, 'S0102-69092018000300512')], (5, 6, 3, 3))
+        self.assertEqual(results[(metrics.ARTICLE_DAILY, 'S0102-69092019000100001')], (1, 1, 1, 1))
+        self.assertEqual(results[(metrics.ARTICLE_DETAILED, 'S0102-69092018000300512', 'html', values.METRIC_UNKNOWN_LANGUAGE, geo)], (0, 1, 0, 1))
+        self.assertEqual(results[(metrics.ARTICLE_DETAILED, 'S0102-69092018000300512', 'html', 'pt', geo)], (3, 3, 2, 2))
+        self.assertEqual(results[(metrics.ARTICLE_DETAILED, 'S0102-69092018000300512', 'pdf', 'pt', geo)], (1, 1, 1, 1))
+        self.assertEqual(results[(metrics.ARTICLE_DETAILED, 'S0102-69092018000300512', 'html', 'pt', ('', ''))], (1, 1, 1, 1))
+
+        # the HTML and the PDF of one session are one unique item, by geolocation and by language
+        self.assertEqual(results[(metrics.ARTICLE_DAILY_GEO, 'S0102-69092018000300512', geo)], (4, 5, 2, 2))
+        self.assertEqual(results[(metrics.ARTICLE_DAILY_GEO_LAN, 'S0102-69092018000300512', geo, 'pt')], (4, 4, 2, 2))
+        self.assertEqual(results[(metrics.JOURNAL_DAILY_GEO_FOR, '0102-6909', geo, 'html')], (4, 5, 3, 3))
+
+        # journal unique measures count unique items per session
+        self.assertEqual(results[(metrics.JOURNAL_DAILY, '0102-6909')], (6, 7, 4, 4))
+        self.assertEqual(results[(metrics.JOURNAL_DAILY_YOP, '0102-6909', '2018')], (5, 6, 3, 3))
+        self.assertEqual(results[(metrics.JOURNAL_DAILY_YOP, '0102-6909', '2019')], (1, 1, 1, 1))
+
+    def test_double_clicks(self):
+        aggregator = metrics.MetricsAggregator()
+        for row in [
+            ('2024-02-12 10:00:05', 'CH', '121.0', '1.1.1.1', '', '', ARTICLE),
+            ('2024-02-12 10:00:09', 'CH', '121.0', '1.1.1.1', '', '', ARTICLE),
+            ('2024-02-12 10:00:40', 'CH', '121.0', '1.1.1.1', '', '', ARTICLE),
+        ]:
+            aggregator.add(*row)
+
+        self.assertEqual(aggregator.hits, 2)
+        self.assertEqual(aggregator.double_clicks, 1)
+        self.assertEqual(self._results(aggregator)[(metrics.ARTICLE_DAILY, 'S0102-69092018000300512')], (2, 2, 1, 1))
+
+    def test_bounded_memory_same_results(self):
+        rnd = random.Random(3)
+        pids = [f'S0102-6909{rnd.randint(2000, 2024)}0001{i:05d}' for i in range(40)]
+        scripts = ['sci_arttext', 'sci_pdf', 'sci_abstract']
+
+        rows = []
+        for ip in sorted(f'10.0.0.{i}' for i in range(60)):
+            for _ in range(rnd.randint(1, 30)):
+                rows.append((
+                    f'2024-02-12 {rnd.randint(0, 23):02d}:00:00',
+                    rnd.choice(['CH', 'FF']),
+                    '1.0',
+                    ip,
+                    rnd.choice(['', '-10.0', '-20.0']),
+                    '-50.0',
+                    f'/scielo.php?script={rnd.choice(scripts)}&pid={rnd.choice(pids)}&tlng={rnd.choice(["pt", "en"])}',
+                ))
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            unbounded = metrics.MetricsAggregator()
+            bounded = metrics.MetricsAggregator(max_keys=50, tmp_dir=tmp_dir)
+            for row in rows:
+                unbounded.add(*row)
+                bounded.add(*row)
+
+            self.assertGreater(bounded.runs, 1)
+            self.assertEqual(sorted(self._results(unbounded).items()), sorted(self._results(bounded).items()))
+            self.assertEqual(os.listdir(tmp_dir), [])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_aggregate_pretable(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, '2024-02-12.tsv')
+            with open(path, 'w') as fout:
+                fout.write('\t'.join(values.PRETABLE_FILE_HEADER) + '\n')
+                fout.write('\t'.join(['2024-02-12 10:00:05', 'CH', '121.0', '1.1.1.1', '', '', ARTICLE]) + '\n')
+                fout.write('\t'.join(['2024-02-12 10:00:09', 'CH', '121.0', '1.1.1.1', '', '', PDF]) + '\n')
+                fout.write('incomplete line\n')
+
+            aggregator = metrics.aggregate_pretable(path, metrics.MetricsAggregator())
+            self.assertEqual(aggregator.hits, 2)
+            self.assertEqual(dict(aggregator.results())[(metrics.ARTICLE_DAILY, 'S0102-69092018000300512')], [2, 2, 1, 1])
+        finally:
+            shutil.rmtree(tmp_dir)
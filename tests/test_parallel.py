@@ -0,0 +1,87 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from scielo_usage_counter import log, parallel
+from scielo_usage_counter.utils import file_utils
+
+
+class TestParallelLogParser(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.maxDiff = None
+        self.tmp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _parse(self, lp, logfile, name):
+        lp.logfile = logfile
+        lp.output = os.path.join(self.tmp_dir, name)
+        lp.stats.output = os.path.join(self.tmp_dir, name + '.summary')
+        lp.save(lp.parse())
+
+        # wall-clock time and cache counters depend on how lines are distributed
+        keys, values = lp.stats.get_stats()
+        stats = {k: v for k, v in zip(keys, values) if k != 'total_time' and not k.startswith('ua_cache')}
+
+        with open(os.path.join(self.tmp_dir, name)) as fin:
+            return fin.read(), stats
+
+    def _sequential(self, logfile):
+        lp = log.LogParser(mmdb_path='tests/fixtures/map.mmdb', robots_path='tests/fixtures/counter-robots.txt')
+        return self._parse(lp, logfile, 'sequential')
+
+    def test_get_line_aligned_ranges(self):
+        ranges = file_utils.get_line_aligned_ranges('tests/fixtures/usage.log', 1000)
+
+        with open('tests/fixtures/usage.log', 'rb') as fin:
+            data = fin.read()
+
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(data))
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(data[end - 1:end], b'\n')
+
+    def test_parse_plain_text_matches_sequential(self):
+        for logfile in ['tests/fixtures/usage.log', 'tests/fixtures/usage.esp.log']:
+            lp = parallel.ParallelLogParser(
+                mmdb_path='tests/fixtures/map.mmdb',
+                robots_path='tests/fixtures/counter-robots.txt',
+                workers=2,
+                chunk_size=4096,
+            )
+            self.assertEqual(self._parse(lp, logfile, 'parallel'), self._sequential(logfile))
+
+    def test_parse_plain_text_newlines_match_sequential(self):
+        # text mode reads \r\n and a lone \r as line breaks
+        path = os.path.join(self.tmp_dir, 'usage.crlf.log')
+        with open('tests/fixtures/usage.log', 'rb') as fin, open(path, 'wb') as fout:
+            lines = fin.read().splitlines()
+            fout.write(b'\r\n'.join(lines[:10]) + b'\r' + b'\r\n'.join(lines[10:]) + b'\r\n')
+
+        lp = parallel.ParallelLogParser(
+            mmdb_path='tests/fixtures/map.mmdb',
+            robots_path='tests/fixtures/counter-robots.txt',
+            workers=2,
+            chunk_size=4096,
+        )
+        self.assertEqual(self._parse(lp, path, 'parallel_crlf'), self._sequential(path))
+
+    def test_parse_gzip_matches_sequential(self):
+        gz_path = os.path.join(self.tmp_dir, 'usage.log.gz')
+        with open('tests/fixtures/usage.log', 'rb') as fin, gzip.open(gz_path, 'wb') as fout:
+            shutil.copyfileobj(fin, fout)
+
+        lp = parallel.ParallelLogParser(
+            mmdb_path='tests/fixtures/map.mmdb',
+            robots_path='tests/fixtures/counter-robots.txt',
+            workers=3,
+            chunk_lines=17,
+        )
+        self.assertEqual(self._parse(lp, gz_path, 'parallel_gz'), self._sequential('tests/fixtures/usage.log'))
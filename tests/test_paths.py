@@ -0,0 +1,60 @@
+import random
+import unittest
+
+from scielo_usage_counter import log_format, paths
+
+
+class TestPathClassifier(unittest.TestCase):
+
+    def setUp(self):
+        self.classifier = paths.PathClassifier()
+
+    def test_classify(self):
+        for path, expected in [
+            ('/img/revistas/rbp/v26n3/a13img02.gif', paths.PATH_STATIC),
+            ('/favicon.ico?script=sci_arttext&pid=S0102-35862003000500003', paths.PATH_STATIC),
+            ('http://www.scielo.br/static/css/scielo-bundle-print.css?v=', paths.PATH_STATIC),
+            ('/pdf/abo/v64n3/12518.pdf', paths.PATH_DOWNLOAD),
+            ('/img/revistas/csp/links_ing.doc', paths.PATH_DOWNLOAD),
+            ('/scielo.php?script=sci_arttext&pid=S1806-37132013000500595', paths.PATH_PAGE),
+            ('/pdf/rbcpol/n6/n6a04', paths.PATH_PAGE),
+            ('/sitemap.xml', paths.PATH_STATIC),
+        ]:
+            self.assertEqual(self.classifier.classify(path), expected, path)
+
+        self.assertTrue(self.classifier.is_download('/sitemap.xml'))
+
+    def test_cache_is_bounded(self):
+        classifier = paths.PathClassifier(max_cached_paths=10)
+        for i in range(25):
+            self.assertEqual(classifier.classify(f'/pdf/a{i}.pdf'), paths.PATH_DOWNLOAD)
+            self.assertEqual(classifier.classify(f'/pdf/a{i}.pdf'), paths.PATH_DOWNLOAD)
+
+    def _fixture_paths(self):
+        matcher = log_format.LogFormatMatcher()
+        for name in ['usage.log', 'usage.cl.log', 'usage.cub.log', 'usage.esp.log']:
+            with open(f'tests/fixtures/{name}') as fin:
+                for line in fin:
+                    match, _, _ = matcher.match(line.strip())
+                    if match:
+                        yield match.groupdict()['path']
+
+    def _random_paths(self, size):
+        rnd = random.Random(11)
+        parts = [
+            '/', '//', '.', '..', '?', '#', ';', '&', '=', ':', '[', ']', '%0D', '\t', ' ',
+            'scielo', 'php', 'pdf', 'PDF', 'css', 'Js', 'xml', 'gif', 'mp4', 'doc', 'ico', 'a', 'v12n5',
+            'http:', 'https://www.scielo.br', 'script=sci_arttext', 'pid=S0102-35862003000500003',
+        ]
+
+        for _ in range(size):
+            path = ''.join(rnd.choice(parts) for _ in range(rnd.randint(1, 12)))
+            yield path if rnd.random() < 0.2 else '/' + path
+
+    def test_same_result_as_legacy(self):
+        corpus = list(self._fixture_paths()) + list(self._random_paths(20000))
+        self.assertGreater(len(corpus), 20000)
+
+        for path in corpus:
+            self.assertEqual(self.classifier.is_static_file(path), paths.legacy_is_static_file(path), path)
+            self.assertEqual(self.classifier.is_download(path), paths.legacy_is_download(path), path)
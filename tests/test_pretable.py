@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from scielo_usage_counter import pretable, values
+
+
+class TestPretable(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_format(self):
+        formatter = pretable.PretableFormatter()
+        row = ['2021-05-22 02:58:50', 'CH', '90.0.4430.212', '177.52.0.1', 'BR', '/scielo.php?pid=S0100']
+
+        self.assertEqual(
+            formatter.format(row, '-22.9', '-43.2'),
+            '2021-05-22 02:58:50\tCH\t90.0.4430.212\t177.52.0.1\t-22.9\t-43.2\t/scielo.php?pid=S0100',
+        )
+        self.assertEqual(
+            formatter.format(row),
+            '2021-05-22 02:58:50\tCH\t90.0.4430.212\t177.52.0.1\t\t\t/scielo.php?pid=S0100',
+        )
+
+    def test_writer_one_file_per_day(self):
+        with pretable.PretableWriter(self.tmp_dir) as writer:
+            writer.write('2021-05-22', 'a')
+            writer.write('2021-05-23', 'b')
+            writer.write('2021-05-22', 'c')
+
+        with pretable.PretableWriter(self.tmp_dir) as writer:
+            writer.write('2021-05-22', 'd')
+
+        self.assertListEqual(sorted(os.listdir(self.tmp_dir)), ['2021-05-22.unsorted.tsv', '2021-05-23.unsorted.tsv'])
+        self.assertDictEqual(writer.paths, {'2021-05-22': os.path.join(self.tmp_dir, '2021-05-22.unsorted.tsv')})
+
+        with open(os.path.join(self.tmp_dir, '2021-05-22.unsorted.tsv')) as fin:
+            self.assertEqual(fin.read(), '\t'.join(values.PRETABLE_FILE_HEADER) + '\na\nc\nd\n')
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from scielo_usage_counter import log, profiling
+
+
+class TestStageProfiler(unittest.TestCase):
+
+    def test_nested_stages_are_exclusive(self):
+        p = profiling.StageProfiler(slowest_lines=2)
+
+        inner = p.wrap_stage(lambda: time.sleep(0.02), 'inner')
+
+        def _outer():
+            time.sleep(0.01)
+            inner()
+        outer = p.wrap_stage(_outer, 'outer')
+
+        parse_line = p.wrap_line(lambda line: outer())
+        for line in ['a', 'b', 'c']:
+            parse_line(line)
+
+        stages = {s: (seconds, calls) for s, seconds, calls in p.get_stages()}
+        self.assertEqual(stages['inner'][1], 3)
+        self.assertEqual(stages['outer'][1], 3)
+        self.assertEqual(stages['other'][1], 3)
+        self.assertGreater(stages['inner'][0], stages['outer'][0])
+        self.assertAlmostEqual(sum(s for s, _ in stages.values()), p.total_time, places=6)
+
+        slowest = p.get_slowest_lines()
+        self.assertEqual(len(slowest), 2)
+        self.assertEqual(slowest[0][1], 'inner')
+
+
+class TestLogParserProfiling(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.maxDiff = None
+        self.tmp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _parse(self, name, profile):
+        output_path = os.path.join(self.tmp_dir, name)
+
+        lp = log.LogParser(mmdb_path='tests/fixtures/map.mmdb', robots_path='tests/fixtures/counter-robots.txt')
+        lp.logfile = 'tests/fixtures/usage.log'
+        lp.output = output_path
+        lp.stats.output = output_path + '.summary'
+        if profile:
+            lp.enable_profiling(output_path + '.profile', slowest_lines=5)
+        lp.save(lp.parse())
+
+        with open(output_path) as fin:
+            return lp, fin.read()
+
+    def test_profiling_does_not_change_output(self):
+        _, expected = self._parse('plain.tsv', False)
+        lp, obtained = self._parse('profiled.tsv', True)
+
+        self.assertEqual(obtained, expected)
+        self.assertEqual(lp.profiler.lines, lp.stats.lines_parsed)
+
+        stages = {s: calls for s, _, calls in lp.profiler.get_stages()}
+        self.assertEqual(stages['regex'], lp.stats.lines_parsed)
+        for s in ['ua_cache', 'ua_detection', 'robots', 'path', 'geoip', 'date', 'other']:
+            self.assertIn(s, stages)
+
+        with open(os.path.join(self.tmp_dir, 'profiled.tsv.profile')) as fin:
+            content = fin.read().split('\n\n')
+
+        self.assertTrue(content[0].startswith('stage\tseconds\tcalls\tshare\n'))
+        self.assertEqual(len(content[1].strip().split('\n')), 6)
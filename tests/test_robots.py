@@ -0,0 +1,66 @@
+import re
+import unittest
+
+from scielo_usage_counter import robots
+from scielo_usage_counter.utils import resource_utils
+
+
+class TestRobotsMatcher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.robots = resource_utils.load_robots(robots_list=None, robots_path='tests/fixtures/counter-robots.txt')
+        self.matcher = robots.RobotsMatcher(self.robots)
+
+    def _is_bot(self, user_agent):
+        for regex in self.robots:
+            if regex.search(user_agent):
+                return True
+        return False
+
+    def test_scan_literal(self):
+        self.assertTupleEqual(robots._scan_literal('spider'), ('spider', True))
+        self.assertTupleEqual(robots._scan_literal('^Buck\\/[0-9]'), ('Buck/', False))
+        self.assertTupleEqual(robots._scan_literal('daum(oa)?'), ('daum', False))
+        self.assertTupleEqual(robots._scan_literal('^\\%?default\\%?$'), ('', False))
+        self.assertTupleEqual(robots._scan_literal('aria2\\/\\d'), ('aria2/', False))
+
+    def test_has_top_level_alternation(self):
+        self.assertTrue(robots._has_top_level_alternation('bot|spider'))
+        self.assertFalse(robots._has_top_level_alternation('Web(\\s|\\+)Downloader'))
+        self.assertFalse(robots._has_top_level_alternation('a[|]b'))
+        self.assertFalse(robots._has_top_level_alternation('a\\|b'))
+
+    def test_same_verdict_as_pattern_loop(self):
+        with open('tests/fixtures/user_agents.txt') as fin:
+            user_agents = [ua.strip() for ua in fin]
+
+        user_agents.extend([
+            '',
+            'a',
+            'Buck/2.0',
+            'xBuck/2.0',
+            'Web+Downloader/1.0',
+            'Mozilla/5.0 Gecko/20100115 Firefox/3.6',
+            'Mozilla/5.0 (compatible; BINGBOT/2.0)',
+            'Mozilla/5.0 (compatible; KOGGLE crawler)',
+            'Navegador São Paulo',
+            '破解后的',
+        ])
+
+        for ua in user_agents:
+            self.assertEqual(self.matcher.is_bot(ua), self._is_bot(ua), ua)
+
+    def test_match_reports_pattern(self):
+        self.assertEqual(self.matcher.match('LOCKSS cache'), 'LOCKSS')
+        self.assertEqual(self.matcher.match('Buck/2.0'), '^Buck\\/[0-9]')
+        self.assertIsNone(self.matcher.match('Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/65.0.3325.162 Safari/537.36'))
+
+    def test_non_ascii_user_agent(self):
+        matcher = robots.RobotsMatcher([re.compile('kbot', re.IGNORECASE)])
+        self.assertTrue(matcher.is_bot('\u212aBOT'))
+        self.assertFalse(matcher.is_bot('São Paulo'))
+
+    def test_iterates_over_patterns(self):
+        self.assertEqual(len(self.matcher), len(self.robots))
+        self.assertSetEqual(set(self.matcher), self.robots)
@@ -0,0 +1,104 @@
+import datetime
+import random
+import unittest
+
+from scielo_usage_counter import sessions
+
+
+ARTICLE = '/scielo.php?script=sci_arttext&pid=S0102-69092018000300512'
+PDF = '/scielo.php?script=sci_pdf&pid=S0102-69092018000300512'
+
+
+def _row(server_time, ip='1.1.1.1', browser='CH', action=ARTICLE):
+    return (server_time, browser, '121.0', ip, '', '', action)
+
+
+class TestSessionBuilder(unittest.TestCase):
+
+    def test_double_clicks(self):
+        builder = sessions.SessionBuilder()
+        hits = list(builder.iter_hits([
+            _row('2024-02-12 10:00:00'),
+            _row('2024-02-12 10:00:20'),
+            # within 30 seconds of the previous click, although not of the first one
+            _row('2024-02-12 10:00:45'),
+            _row('2024-02-12 10:01:16'),
+            _row('2024-02-12 10:01:16', action=PDF),
+            _row('2024-02-12 10:01:17', browser='FF'),
+            _row('2024-02-12 10:01:18', ip='2.2.2.2'),
+        ]))
+
+        self.assertEqual([h.server_time for h in hits], ['2024-02-12 10:00:00', '2024-02-12 10:01:16', '2024-02-12 10:01:16', '2024-02-12 10:01:17', '2024-02-12 10:01:18'])
+        self.assertEqual(builder.double_clicks, 2)
+        self.assertEqual([h.session for h in hits], [1, 1, 1, 2, 3])
+        self.assertEqual(builder.sessions, 3)
+
+    def test_sessions_by_hour(self):
+        builder = sessions.SessionBuilder()
+        hits = list(builder.iter_hits([
+            _row('2024-02-12 10:59:50'),
+            _row('2024-02-12 11:00:05'),
+            _row('2024-02-12 11:10:00', browser='FF'),
+        ]))
+
+        self.assertEqual(len(hits), 3)
+        self.assertEqual(len({h.session for h in hits}), 3)
+        self.assertEqual([h.window for h in hits], [1, 2, 2])
+
+    def test_hot_ip_state_is_bounded(self):
+        builder = sessions.SessionBuilder()
+        start = datetime.datetime(2024, 2, 12)
+        tracked = 0
+
+        for i in range(20000):
+            server_time = (start + datetime.timedelta(seconds=i * 4)).strftime('%Y-%m-%d %H:%M:%S')
+            builder.push(server_time, 'CH', '121.0', '10.0.0.1', '', '', f'/scielo.php?script=sci_arttext&pid=S0102-6909201800030{i:04d}')
+            tracked = max(tracked, builder.tracked_clicks)
+
+        self.assertEqual(builder.hits, 20000)
+        self.assertLessEqual(tracked, 9)
+
+    def _reference(self, rows, seconds=30):
+        # every click of an IP is kept, sessions by IP, browser and hour
+        last_clicks = {}
+        kept = []
+        for server_time, browser_name, browser_version, ip, _, _, action in rows:
+            t = datetime.datetime.strptime(server_time, '%Y-%m-%d %H:%M:%S')
+            key = (ip, browser_name, browser_version, server_time[:13], action)
+            last = last_clicks.get(key)
+            last_clicks[key] = t
+            if last is None or abs((t - last).total_seconds()) > seconds:
+                kept.append((server_time, ip, browser_name, action))
+        return kept
+
+    def _random_rows(self):
+        rnd = random.Random(5)
+        rows = []
+        for ip in range(50):
+            for _ in range(rnd.randint(1, 200)):
+                rows.append(_row(
+                    f'2024-02-12 {rnd.randint(9, 11):02d}:{rnd.randint(0, 5):02d}:{rnd.randint(0, 59):02d}',
+                    ip=f'10.0.0.{ip}',
+                    browser=rnd.choice(['CH', 'FF']),
+                    action=rnd.choice([ARTICLE, PDF]),
+                ))
+        return sorted(rows, key=lambda r: (r[3], r[0]))
+
+    def _push(self, builder, rows):
+        return [(h.server_time, r[3], r[1], h.action_name) for r in rows for h in [builder.push(*r)] if h is not None]
+
+    def test_same_hits_as_reference(self):
+        rows = self._random_rows()
+        builder = sessions.SessionBuilder()
+
+        self.assertListEqual(self._push(builder, rows), self._reference(rows))
+        self.assertGreater(builder.double_clicks, 0)
+        self.assertEqual(builder.out_of_order_hits, 0)
+
+    def test_out_of_order_hits(self):
+        # hits of each IP from the latest to the earliest
+        rows = sorted(self._random_rows(), key=lambda r: (r[3], r[0]), reverse=True)
+        builder = sessions.SessionBuilder()
+
+        self.assertListEqual(self._push(builder, rows), self._reference(rows))
+        self.assertGreater(builder.out_of_order_hits, 0)
@@ -0,0 +1,55 @@
+import datetime
+import random
+import unittest
+
+from scielo_usage_counter import timestamp
+
+
+class TestTimestampConverter(unittest.TestCase):
+
+    def setUp(self):
+        self.converter = timestamp.TimestampConverter()
+
+    def test_convert(self):
+        self.assertEqual(self.converter.convert('21/May/2021:23:58:50', '-0300'), '2021-05-22 02:58:50')
+        self.assertEqual(self.converter.convert('01/Jan/2024:01:00:00', '+0200'), '2023-12-31 23:00:00')
+        self.assertEqual(self.converter.convert('29/Feb/2024:12:00:00', '+0000'), '2024-02-29 12:00:00')
+
+    def test_half_hour_timezone(self):
+        self.assertEqual(timestamp.timedelta_from_timezone('-0330'), datetime.timedelta(hours=-3, minutes=-30))
+        self.assertEqual(self.converter.convert('10/Dec/2024:00:00:16', '+0530'), '2024-12-09 18:30:16')
+
+    def test_invalid_dates(self):
+        for date, timezone in [
+            ('31/Feb/2024:00:00:00', '-0300'),
+            ('10/Foo/2024:00:00:00', '-0300'),
+            ('10/Dec/2024:24:00:00', '-0300'),
+            ('10/Dec/2024:00:00:00', 'xxxx'),
+            ('', '-0300'),
+            (None, '-0300'),
+        ]:
+            self.assertIsNone(self.converter.convert(date, timezone))
+
+    def test_same_result_as_strptime(self):
+        rnd = random.Random(7)
+        months = ['Jan', 'feb', 'MAR', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+        for _ in range(5000):
+            date = '{:02d}/{}/{}:{:02d}:{:02d}:{:02d}'.format(
+                rnd.randint(0, 32),
+                rnd.choice(months),
+                rnd.choice([1999, 2000, 2023, 2024, 9999]),
+                rnd.randint(0, 24),
+                rnd.randint(0, 60),
+                rnd.randint(0, 60),
+            )
+            timezone = rnd.choice(['-0300', '+0000', '+0100', '-0500', '+0530', '-1200', '+1400'])
+
+            self.assertEqual(
+                self.converter.convert(date, timezone),
+                timestamp.legacy_format_date(date, timezone),
+                (date, timezone),
+            )
+
+    def test_non_standard_width(self):
+        self.assertEqual(self.converter.convert('4/Nov/2011:00:05:23', '-0300'), '2011-11-04 03:05:23')